@@ -1,14 +1,25 @@
-from flask import Flask, request, jsonify, render_template
-import requests
+from flask import Flask, request, jsonify, render_template, Response, stream_with_context, g
 import os
-import geopandas as gpd
-from shapely.geometry import Point
 import json
+import logging
 from flask_httpauth import HTTPBasicAuth
 from werkzeug.security import generate_password_hash, check_password_hash
 from dotenv import load_dotenv
+from dataset import load_dataset
+import geocoder
+import batch
+import instrumentation
+import lookups
+from local_geocoder import LocalGeocoder
+from zip_townships import ZipTownships
+from county_shards import CountyShards
+from map_features import MapFeatures
+from vector_tiles import TownshipTiles
+from nearest import NearestResources
 
 app = Flask(__name__)
+data_loaded = False
+logging.basicConfig(level=logging.INFO)
 # auth = HTTPBasicAuth()
 
 # # Load environment variables from dotenv file
@@ -36,150 +47,159 @@ app = Flask(__name__)
 #     if username in users and check_password_hash(users.get(username), password):
 #         return username
 
-# Load township boundaries
-township_gdf = gpd.read_file('static/utilities/data/indiana_townships.geojson')
+# Load township boundaries, trustee and food pantry data once at startup.
+# This reads the compiled bundle if there is one (see dataset.py), otherwise the source files.
+dataset = load_dataset()
 
-# Function to determine the township for given coordinates
-def get_township(latitude, longitude):
-    point = Point(longitude, latitude)
-    for index, row in township_gdf.iterrows():
-        if row['geometry'].contains(point):
-            return row['cnty_name'], row['tl_2021_18_cousub_namelsad']
-    return None, None
+# Spatial index over the township polygons
+township_resolver = dataset.resolver
+
+# Trustee and food pantry data indexed by county and township
+resource_store = dataset.resource_store
+
+# Nearest trustee offices and food pantries, regardless of county lines
+nearest_resources = NearestResources(resource_store.trustees, resource_store.food_pantries)
+
+# Offline address index, if one has been built (see local_geocoder.py)
+local_geocoder = LocalGeocoder.open()
+
+# Townships and trustees for each ZIP code, if the table has been built (see zip_townships.py)
+zip_table = ZipTownships.open()
+
+# Per-county data for the map, precompressed (see county_shards.py)
+county_shards = CountyShards.load(resource_store)
+
+# Trustee and food pantry markers, clustered per zoom level for the map
+map_features = MapFeatures(resource_store.trustees, resource_store.food_pantries)
+
+# Township boundary vector tiles, built on demand and cached (see vector_tiles.py)
+township_tiles = TownshipTiles(township_resolver, layers=dataset.tile_layers)
+
+# Everything above has to finish before the app can answer lookups
+data_loaded = True
+
+# Upstream counters for /metrics (see instrumentation.py)
+instrumentation.register_counters('nominatim_calls_total', 'Nominatim calls by outcome.', 'outcome',
+                                  lambda: geocoder.client.counters)
+instrumentation.register_counters('geocode_cache_lookups_total', 'Geocode cache lookups by outcome.', 'outcome',
+                                  lambda: {key: value for key, value in geocoder.cache.stats().items()
+                                           if key != 'memory_entries'})
+
+@app.before_request
+def start_timer():
+    g.timer_token = instrumentation.start_request()
+
+@app.after_request
+def finish_timer(response):
+    instrumentation.finish_request(
+        g.pop('timer_token', None), request.method, request.url_rule.rule if request.url_rule else 'unmatched',
+        request.path, response.status_code, response.headers, request.remote_addr, response.content_length)
+    return response
+
+def json_response(body, status):
+    with instrumentation.stage('serialize'):
+        return jsonify(body), status
 
 @app.route('/')
 # @auth.login_required
 def index():
     return render_template('index.html')
 
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Readiness check: 200 only once the township data and indexes are loaded."""
+    body, status = lookups.readiness_result(dataset, data_loaded)
+    return jsonify(body), status
+
 @app.route('/geocode', methods=['GET'])
 # @auth.login_required
 def geocode():
     address = request.args.get('address')
     zip = request.args.get('zip')
-    base_url = "https://nominatim.openstreetmap.org/search"
-    params = {
-        "format": "json",
-        "addressdetails": 1
-    }
-
-    if zip:
-        params['postalcode'] = zip
-    if address:
-        params['q'] = address
-        params['limit'] = 1
-    headers = {
-        "User-Agent": "Indiana Resource Lookup"
-    }
-
-
-    # Get lat/lon from Nominatim
-    response = requests.get(base_url, params=params, headers=headers)
-    data = response.json()
-    print(data)
-    if response.status_code == 200 and data:
-
-        if zip:
-            # if a zip code is provided, loop through each result and find the one with a state of Indiana
-            for item in data:
-                print (item)
-                if 'state' in item['address'] and item['address']['state'].lower() == 'indiana':
-                    location = item
-                    break
-            else:
-                # if no location with Indiana state is found, return the first result
-                location = data[0]
-        else:
-            # if we are using an address, just take the first result
-            location = data[0]
-        latitude = float(location['lat'])
-        longitude = float(location['lon'])
-
-        # Use the township lookup
-        county, township = get_township(latitude, longitude)
-
-        if county and township:
-            return get_trustee_info(county, township)
-        else:
+
+    if zip and not address and zip_table:
+        # Every township in the ZIP comes from the offline table, no geocoding needed
+        with instrumentation.stage('zip_table'):
+            townships = zip_table.lookup(zip)
+        if townships:
+            return json_response(*lookups.zip_result(townships))
+
+    coordinates = None
+    if address and not zip and local_geocoder:
+        # Try the offline address index first, it avoids the round-trip to Nominatim
+        with instrumentation.stage('local_geocoder'):
+            coordinates = local_geocoder.geocode(address)
+    if coordinates is None:
+        try:
+            coordinates = lookups.pick_location(geocoder.search(address=address, zip=zip), zip)
+        except geocoder.GeocoderUnavailable as e:
+            app.logger.warning("Geocoding failed: %s", e)
             return jsonify({
-                "latitude": latitude,
-                "longitude": longitude,
-                "message": "No township found for the provided coordinates"
-            })
-    else:
-        return jsonify({
-            "error": "Nothing found for the provided address or zip code"
-        })
-
-def get_trustee_info(county, township):
-    """Gets trustee information for a given county and township."""
-    try:
-        with open('static/utilities/data/indiana_township_trustees.json', 'r') as f:
-            trustee_data = json.load(f)
-        for trustee in trustee_data:
-            if trustee['County'].lower() == county.lower() and trustee['Name'].lower().startswith(township.lower()):
-                return jsonify({
-                    "county": county,
-                    "township": township,
-                    "trustee": trustee
-                })
-        return jsonify({
-            "county": county,
-            "message": "No immediate trustee found for the provided address"
-        })
-    except FileNotFoundError:
-        return jsonify({
-            "error": "Trustee data file not found. Please check the file path."
-        })
+                "error": "The geocoding service is unavailable right now, please try again shortly"
+            }), 503
+
+    body, status = lookups.geocode_result(township_resolver, resource_store, coordinates)
+    return json_response(body, status)
 
 @app.route('/reverse-geocode', methods=['GET'])
 # @auth.login_required
 def reverse_geocode():
-    lat = request.args.get('lat')
-    lon = request.args.get('lon')
-
-    if not lat or not lon:
-        return jsonify({"error": "Latitude and longitude are required"}), 400
-
-    try:
-        latitude = float(lat)
-        longitude = float(lon)
+    body, status = lookups.reverse_geocode_result(
+        township_resolver, resource_store, request.args.get('lat'), request.args.get('lon'))
+    return json_response(body, status)
 
-        # Get township and county
-        county, township = get_township(latitude, longitude)
+@app.route('/nearest', methods=['GET'])
+# @auth.login_required
+def nearest():
+    """Returns the trustee offices and food pantries closest to a point, sorted by distance."""
+    body, status = lookups.nearest_result(nearest_resources, request.args)
+    return json_response(body, status)
 
-        if not county or not township:
-            return jsonify({"error": "No township found for the provided coordinates"}), 404
-        # Get trustee data
-        trustee_info = None
-        try:
-            with open('static/utilities/data/indiana_township_trustees.json', 'r') as f:
-                trustees = json.load(f)
-                for trustee in trustees:
-                    if trustee['County'].lower() == county.lower() and trustee['Name'].lower().startswith(township.lower()):
-                        trustee_info = trustee
-                        break
-        except FileNotFoundError:
-            print("Trustee data file not found.")
-
-        # Get food pantry data
-        food_pantries = []
-        try:
-            with open('static/utilities/data/indiana_food_pantries.json', 'r') as f:
-                pantries = json.load(f)
-                for pantry in pantries:
-                    if pantry['County'].lower() == county.lower():
-                        food_pantries.append(pantry)
-        except FileNotFoundError:
-            print("Food pantry data file not found.")
-
-        return jsonify({
-            "trustee": trustee_info,
-            "food_pantries": food_pantries
-        })
-
-    except ValueError:
-        return jsonify({"error": "Invalid latitude or longitude"}), 400
+@app.route('/api/county/<name>', methods=['GET'])
+# @auth.login_required
+def county_data(name):
+    """Trustees and food pantries in one county, for the map."""
+    shard = county_shards.response(name, request.headers.get('Accept-Encoding'), request.headers.get('If-None-Match'))
+    if shard is None:
+        return jsonify({"error": "Unknown county"}), 404
+    status, headers, body = shard
+    return Response(body, status=status, headers=headers, mimetype='application/json')
+
+@app.route('/api/features', methods=['GET'])
+# @auth.login_required
+def features():
+    """Map markers inside a bbox: clusters at low zoom, individual points when zoomed in."""
+    body, status = lookups.features_result(map_features, request.args)
+    return json_response(body, status)
+
+@app.route('/tiles/<int:z>/<int:x>/<int:y>.mvt', methods=['GET'])
+def township_tile(z, x, y):
+    """Township boundaries as a Mapbox Vector Tile."""
+    with instrumentation.stage('tile'):
+        tile = township_tiles.tile(z, x, y)
+    if tile is None:
+        return jsonify({"error": "No such tile"}), 404
+    return Response(tile, mimetype='application/vnd.mapbox-vector-tile',
+                    headers={'Cache-Control': 'public, max-age=86400'})
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Request latency histograms and upstream counters in the Prometheus text format."""
+    return Response(instrumentation.render(), content_type=instrumentation.CONTENT_TYPE)
+
+@app.route('/batch/reverse-geocode', methods=['POST'])
+# @auth.login_required
+def batch_reverse_geocode():
+    """Resolves many coordinates at once.
+
+    Accepts NDJSON (one {"lat", "lon", "id"} object per line) or CSV with a header row
+    (send Content-Type: text/csv). Results stream back as NDJSON, one line per input row
+    in the same order, while the request body is still being read.
+    """
+    include_pantries = request.args.get('pantries', '1').lower() not in ('0', 'false', 'no')
+    points = batch.read_points(request.stream, request.content_type)
+    results = batch.resolve_points(points, township_resolver, resource_store, include_pantries)
+    return Response(stream_with_context(batch.to_ndjson(results)), mimetype='application/x-ndjson')
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,190 @@
+"""asyncio version of the app, served by an ASGI server:
+
+    uvicorn async_app:app --host 0.0.0.0 --port 5000
+
+It has the same lookup routes as app.py. Waiting on Nominatim doesn't hold a worker, so one
+process can have hundreds of /geocode requests in flight. Township, trustee and nearest
+lookups are CPU work and run on a small thread pool instead of on the event loop.
+"""
+import asyncio
+import contextvars
+import functools
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from quart import Quart, Response, g, jsonify, render_template, request
+
+import async_geocoder
+import geocoder
+import instrumentation
+import lookups
+from county_shards import CountyShards
+from dataset import load_dataset
+from local_geocoder import LocalGeocoder
+from map_features import MapFeatures
+from vector_tiles import TownshipTiles
+from nearest import NearestResources
+from zip_townships import ZipTownships
+
+# Threads for township, trustee and nearest lookups
+CPU_WORKERS = int(os.getenv('ASYNC_CPU_WORKERS', min(4, os.cpu_count() or 1)))
+# Lookups allowed to wait for a thread before new ones wait on the event loop instead
+MAX_PENDING = int(os.getenv('ASYNC_MAX_PENDING', 256))
+
+app = Quart(__name__)
+data_loaded = False
+logging.basicConfig(level=logging.INFO)
+
+# Same data as app.py: the compiled bundle if there is one, otherwise the source files
+dataset = load_dataset()
+township_resolver = dataset.resolver
+resource_store = dataset.resource_store
+nearest_resources = NearestResources(resource_store.trustees, resource_store.food_pantries)
+local_geocoder = LocalGeocoder.open()
+zip_table = ZipTownships.open()
+county_shards = CountyShards.load(resource_store)
+map_features = MapFeatures(resource_store.trustees, resource_store.food_pantries)
+township_tiles = TownshipTiles(township_resolver, layers=dataset.tile_layers)
+data_loaded = True
+
+class BoundedExecutor:
+    """Runs blocking functions on a fixed thread pool with a cap on queued work."""
+
+    def __init__(self, workers, max_pending):
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='lookup')
+        self.max_pending = max_pending
+        self.pending = None
+
+    async def run(self, function, *args):
+        if self.pending is None:
+            # Created on first use so it belongs to the serving event loop
+            self.pending = asyncio.Semaphore(self.max_pending)
+        # Run in a copy of the request's context, so stages timed in the thread count for the request
+        call = functools.partial(contextvars.copy_context().run, function, *args)
+        async with self.pending:
+            return await asyncio.get_running_loop().run_in_executor(self.pool, call)
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+executor = BoundedExecutor(CPU_WORKERS, MAX_PENDING)
+nominatim = None
+
+@app.before_serving
+async def start_client():
+    global nominatim
+    nominatim = async_geocoder.AsyncNominatimClient()
+
+@app.after_serving
+async def stop_client():
+    await nominatim.close()
+    executor.shutdown()
+
+# Upstream counters for /metrics (see instrumentation.py)
+instrumentation.register_counters('nominatim_calls_total', 'Nominatim calls by outcome.', 'outcome',
+                                  lambda: nominatim.counters if nominatim else {})
+instrumentation.register_counters('geocode_cache_lookups_total', 'Geocode cache lookups by outcome.', 'outcome',
+                                  lambda: {key: value for key, value in geocoder.cache.stats().items()
+                                           if key != 'memory_entries'})
+
+@app.before_request
+async def start_timer():
+    g.timer_token = instrumentation.start_request()
+
+@app.after_request
+async def finish_timer(response):
+    instrumentation.finish_request(
+        g.pop('timer_token', None), request.method, request.url_rule.rule if request.url_rule else 'unmatched',
+        request.path, response.status_code, response.headers, request.remote_addr, response.content_length)
+    return response
+
+def json_response(body, status):
+    with instrumentation.stage('serialize'):
+        return jsonify(body), status
+
+@app.route('/')
+async def index():
+    return await render_template('index.html')
+
+@app.route('/ready', methods=['GET'])
+async def ready():
+    """Readiness check: 200 only once the township data and indexes are loaded."""
+    body, status = lookups.readiness_result(dataset, data_loaded)
+    return jsonify(body), status
+
+@app.route('/geocode', methods=['GET'])
+async def geocode():
+    address = request.args.get('address')
+    zip = request.args.get('zip')
+
+    if zip and not address and zip_table:
+        # Every township in the ZIP comes from the offline table, no geocoding needed
+        with instrumentation.stage('zip_table'):
+            townships = zip_table.lookup(zip)
+        if townships:
+            return json_response(*lookups.zip_result(townships))
+
+    coordinates = None
+    if address and not zip and local_geocoder:
+        # Try the offline address index first, it avoids the round-trip to Nominatim
+        with instrumentation.stage('local_geocoder'):
+            coordinates = await executor.run(local_geocoder.geocode, address)
+    if coordinates is None:
+        try:
+            data = await async_geocoder.search(nominatim, address=address, zip=zip)
+        except geocoder.GeocoderUnavailable as e:
+            app.logger.warning("Geocoding failed: %s", e)
+            return jsonify({
+                "error": "The geocoding service is unavailable right now, please try again shortly"
+            }), 503
+        coordinates = lookups.pick_location(data, zip)
+
+    body, status = await executor.run(lookups.geocode_result, township_resolver, resource_store, coordinates)
+    return json_response(body, status)
+
+@app.route('/reverse-geocode', methods=['GET'])
+async def reverse_geocode():
+    body, status = await executor.run(
+        lookups.reverse_geocode_result, township_resolver, resource_store,
+        request.args.get('lat'), request.args.get('lon'))
+    return json_response(body, status)
+
+@app.route('/nearest', methods=['GET'])
+async def nearest():
+    """Returns the trustee offices and food pantries closest to a point, sorted by distance."""
+    body, status = await executor.run(lookups.nearest_result, nearest_resources, request.args.to_dict())
+    return json_response(body, status)
+
+@app.route('/api/county/<name>', methods=['GET'])
+async def county_data(name):
+    """Trustees and food pantries in one county, for the map."""
+    shard = county_shards.response(name, request.headers.get('Accept-Encoding'), request.headers.get('If-None-Match'))
+    if shard is None:
+        return jsonify({"error": "Unknown county"}), 404
+    status, headers, body = shard
+    return Response(body, status=status, headers=headers, mimetype='application/json')
+
+@app.route('/api/features', methods=['GET'])
+async def features():
+    """Map markers inside a bbox: clusters at low zoom, individual points when zoomed in."""
+    body, status = await executor.run(lookups.features_result, map_features, request.args.to_dict())
+    return json_response(body, status)
+
+@app.route('/tiles/<int:z>/<int:x>/<int:y>.mvt', methods=['GET'])
+async def township_tile(z, x, y):
+    """Township boundaries as a Mapbox Vector Tile."""
+    with instrumentation.stage('tile'):
+        tile = await executor.run(township_tiles.tile, z, x, y)
+    if tile is None:
+        return jsonify({"error": "No such tile"}), 404
+    return Response(tile, mimetype='application/vnd.mapbox-vector-tile',
+                    headers={'Cache-Control': 'public, max-age=86400'})
+
+@app.route('/metrics', methods=['GET'])
+async def metrics():
+    """Request latency histograms and upstream counters in the Prometheus text format."""
+    return Response(instrumentation.render(), content_type=instrumentation.CONTENT_TYPE)
+
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', port=5000, debug=True)
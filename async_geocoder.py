@@ -0,0 +1,117 @@
+"""Non-blocking version of geocoder.search for the asyncio app (async_app.py).
+
+It shares the geocode cache and the rate limiter with geocoder.py, so it keeps to the same
+Nominatim request budget, but makes the HTTP calls with httpx on the event loop.
+"""
+import asyncio
+import logging
+import os
+
+import httpx
+
+import geocoder
+from geocoder import (CONNECT_TIMEOUT, HEADERS, MAX_QUEUE_WAIT, MAX_RETRIES, NOMINATIM_URL, READ_TIMEOUT,
+                      RETRY_STATUSES, GeocoderUnavailable, backoff, build_params)
+from geocode_cache import cache_key
+from instrumentation import stage
+
+logger = logging.getLogger(__name__)
+
+# Connections kept open to Nominatim per process
+MAX_CONNECTIONS = int(os.getenv('NOMINATIM_MAX_CONNECTIONS', 32))
+
+
+class AsyncSingleFlight:
+    """Makes concurrent coroutines with the same key share one execution."""
+
+    def __init__(self):
+        self.calls = {}
+
+    async def do(self, key, function):
+        task = self.calls.get(key)
+        if task is None:
+            # Run the call as its own task, so a client that disconnects doesn't cancel it for the others
+            task = asyncio.ensure_future(function())
+            self.calls[key] = task
+            task.add_done_callback(lambda _: self.calls.pop(key, None))
+        return await asyncio.shield(task)
+
+
+class AsyncNominatimClient:
+    """httpx-based Nominatim client with the same timeouts, rate limit and retries as geocoder.NominatimClient."""
+
+    def __init__(self, url=NOMINATIM_URL, limiter=None, max_retries=MAX_RETRIES,
+                 timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), max_queue_wait=MAX_QUEUE_WAIT):
+        self.url = url
+        self.limiter = limiter or geocoder.client.limiter
+        self.max_retries = max_retries
+        self.max_queue_wait = max_queue_wait
+        connect_timeout, read_timeout = timeout
+        self.http = httpx.AsyncClient(
+            headers=HEADERS,
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS),
+        )
+        self.counters = {'requests': 0, 'retries': 0, 'failures': 0, 'throttled': 0}
+
+    async def close(self):
+        await self.http.aclose()
+
+    async def search(self, params):
+        """Returns the decoded JSON results. Raises GeocoderUnavailable when it can't get an answer."""
+        for attempt in range(self.max_retries + 1):
+            wait = self.limiter.reserve(self.max_queue_wait)
+            if wait is None:
+                self.counters['throttled'] += 1
+                raise GeocoderUnavailable("Too many geocoding requests queued, try again shortly")
+            if wait:
+                await asyncio.sleep(wait)
+
+            self.counters['requests'] += 1
+            response = None
+            try:
+                response = await self.http.get(self.url, params=params)
+            except httpx.TransportError as e:
+                logger.warning("Nominatim request failed: %s", e)
+            else:
+                if response.status_code == 200:
+                    try:
+                        return response.json()
+                    except ValueError:
+                        logger.warning("Nominatim returned a 200 that isn't JSON")
+                elif response.status_code not in RETRY_STATUSES:
+                    self.counters['failures'] += 1
+                    raise GeocoderUnavailable(f"Nominatim returned {response.status_code}")
+                else:
+                    logger.warning("Nominatim returned %s", response.status_code)
+
+            if attempt < self.max_retries:
+                self.counters['retries'] += 1
+                await asyncio.sleep(backoff(attempt, response))
+
+        self.counters['failures'] += 1
+        raise GeocoderUnavailable("Nominatim did not answer after retrying")
+
+
+single_flight = AsyncSingleFlight()
+
+
+async def search(client, address=None, zip=None):
+    """Async geocoder.search: goes through the shared geocode cache and coalesces identical queries."""
+    cache = geocoder.cache
+    key = cache_key(address=address, zip=zip)
+    if not key:
+        return []
+    # SQLite reads and writes can wait on another process's lock, so keep them off the event loop
+    with stage('geocode_cache'):
+        found, data = await asyncio.to_thread(cache.get, key)
+    if found:
+        return data
+
+    async def fetch():
+        data = await client.search(build_params(address, zip))
+        await asyncio.to_thread(cache.set, key, data)
+        return data
+
+    with stage('nominatim'):
+        return await single_flight.do(key, fetch)
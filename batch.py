@@ -0,0 +1,117 @@
+import csv
+import json
+import math
+from itertools import islice
+
+CHUNK_SIZE = 2000
+
+LATITUDE_FIELDS = ('lat', 'latitude')
+LONGITUDE_FIELDS = ('lon', 'lng', 'longitude')
+ID_FIELDS = ('id',)
+
+
+def decode_lines(stream):
+    """Yields decoded text lines from a binary request stream as they arrive."""
+    for line in stream:
+        yield line.decode('utf-8', errors='replace').lstrip('\ufeff').rstrip('\r\n')
+
+
+def first_present(row, fields):
+    for field in fields:
+        value = row.get(field)
+        if value not in (None, ''):
+            return value
+    return None
+
+
+def parse_row(line_number, row):
+    """Turns one input row into a point dict, or an error dict when it can't be parsed."""
+    row = {str(key).strip().lower(): value for key, value in row.items()}
+    point = {"line": line_number, "id": first_present(row, ID_FIELDS)}
+    if isinstance(point["id"], float) and not math.isfinite(point["id"]):
+        # Written back as a string, since NaN and infinity aren't valid JSON
+        point["id"] = str(point["id"])
+    try:
+        point["lat"] = float(first_present(row, LATITUDE_FIELDS))
+        point["lon"] = float(first_present(row, LONGITUDE_FIELDS))
+    except (TypeError, ValueError):
+        point["error"] = "Invalid latitude or longitude"
+        return point
+    # NaN and infinity parse as floats but can't be looked up or written back as JSON
+    if not (math.isfinite(point["lat"]) and math.isfinite(point["lon"])):
+        del point["lat"], point["lon"]
+        point["error"] = "Invalid latitude or longitude"
+    return point
+
+
+def read_ndjson(lines):
+    """Yields points from newline-delimited JSON objects with lat/lon (and optional id) keys."""
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            # Bare NaN/Infinity come through as strings and fail the finite check in parse_row
+            row = json.loads(line, parse_constant=str)
+        except ValueError:
+            yield {"line": line_number, "id": None, "error": "Invalid JSON"}
+            continue
+        if not isinstance(row, dict):
+            yield {"line": line_number, "id": None, "error": "Expected a JSON object"}
+            continue
+        yield parse_row(line_number, row)
+
+
+def read_csv(lines):
+    """Yields points from CSV text with a header row naming the lat/lon (and optional id) columns."""
+    reader = csv.DictReader(lines)
+    for row in reader:
+        # Header is line 1, so data rows start at line 2.
+        yield parse_row(reader.line_num, row)
+
+
+def read_points(stream, content_type):
+    """Picks the CSV or NDJSON reader based on the request content type."""
+    lines = decode_lines(stream)
+    if content_type and 'csv' in content_type.lower():
+        return read_csv(lines)
+    return read_ndjson(lines)
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def resolve_points(points, township_resolver, resource_store, include_pantries=True, chunk_size=CHUNK_SIZE):
+    """Resolves points in vectorized chunks and yields one result dict per input row, in order."""
+    for chunk in chunked(points, chunk_size):
+        valid = [point for point in chunk if "error" not in point]
+        resolved = township_resolver.resolve_many(
+            [point["lat"] for point in valid],
+            [point["lon"] for point in valid],
+        )
+        for point, (county, township) in zip(valid, resolved):
+            point["county"] = county
+            point["township"] = township
+
+        for point in chunk:
+            if "error" in point:
+                yield point
+                continue
+            if not point["county"] or not point["township"]:
+                point["error"] = "No township found for the provided coordinates"
+                yield point
+                continue
+            point["trustee"] = resource_store.get_trustee(point["county"], point["township"])
+            if include_pantries:
+                point["food_pantries"] = resource_store.get_food_pantries(point["county"])
+            yield point
+
+
+def to_ndjson(results):
+    for result in results:
+        yield json.dumps(result, allow_nan=False) + '\n'
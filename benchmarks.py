@@ -0,0 +1,275 @@
+"""Microbenchmarks for the lookup hot paths, run against synthetic data at several sizes.
+
+Each benchmark times one hot path with every engine that can answer it, e.g. township
+lookups with the legacy GeoDataFrame scan, the STRtree, the township grid and the vectorized
+resolver. Timing works like asv: the call is repeated until one sample takes SAMPLE_TIME,
+then several samples are taken and the median time per call is reported.
+
+    python benchmarks.py run --scales 1 10 100 --output cache/benchmarks/after.json
+    python benchmarks.py compare cache/benchmarks/before.json cache/benchmarks/after.json
+
+Datasets come from synthetic_data.py and are generated into cache/synthetic on first use.
+"""
+import argparse
+import datetime
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+import shapely
+from flask import Flask, jsonify, request
+
+import lookups
+import synthetic_data
+from dataset import load_sources
+from local_geocoder import LocalGeocoder, build_index, read_extract
+from township_grid import TownshipGrid, rasterize
+from township_resolver import TownshipResolver
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'utilities'))
+import geo_lookup  # noqa: E402
+
+RESULTS_PATH = 'cache/benchmarks'
+SCALES = (1, 10, 100)
+SAMPLE_TIME = 0.05
+SAMPLES = 7
+# A benchmark stops taking samples after this long, so the legacy engines don't take all day
+MAX_TIME = 5.0
+QUERIES = 1000
+# The legacy engines re-read the data files on every call, so they only run at small scales
+LEGACY_MAX_SCALE = 1
+
+
+def measure(function, batch_size=1):
+    """Times function. Returns per-call statistics in microseconds."""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        elapsed = time.perf_counter() - start
+        if elapsed >= SAMPLE_TIME or number >= 1 << 20:
+            break
+        number *= 2 if elapsed == 0 else max(2, min(10, int(SAMPLE_TIME / elapsed) + 1))
+
+    samples = [elapsed / number]
+    deadline = time.perf_counter() + MAX_TIME
+    while len(samples) < SAMPLES and time.perf_counter() < deadline:
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        samples.append((time.perf_counter() - start) / number)
+
+    per_call = [sample / batch_size * 1e6 for sample in samples]
+    return {
+        'median_us': statistics.median(per_call),
+        'min_us': min(per_call),
+        'max_us': max(per_call),
+        'stdev_us': statistics.stdev(per_call) if len(per_call) > 1 else 0.0,
+        'number': number,
+        'samples': len(per_call),
+        'batch_size': batch_size,
+    }
+
+
+class Suite:
+    """The loaded synthetic dataset for one scale, and the benchmarks that run against it."""
+
+    def __init__(self, scale, seed=0):
+        self.scale = scale
+        self.paths = synthetic_data.ensure(scale, seed)
+        with open(self.paths['meta'], 'r') as f:
+            self.meta = json.load(f)
+
+        dataset = load_sources(self.paths['townships'], self.paths['trustees'], self.paths['food_pantries'])
+        self.store = dataset.resource_store
+        # load_sources only uses a grid built for the real data, so build both engines explicitly
+        self.tree_resolver = TownshipResolver(dataset.resolver.geometries, dataset.resolver.counties,
+                                              dataset.resolver.townships)
+        self.grid_resolver = TownshipResolver(dataset.resolver.geometries, dataset.resolver.counties,
+                                              dataset.resolver.townships)
+        self.grid_resolver.use_grid(TownshipGrid(*rasterize(self.grid_resolver)))
+
+        # Query points: half at addresses (where real lookups land), half anywhere in the state
+        rng = np.random.default_rng(seed)
+        self.addresses = list(read_extract(self.paths['addresses']))
+        sample = rng.choice(len(self.addresses), QUERIES // 2)
+        west, south, east, north = shapely.total_bounds(dataset.resolver.geometries)
+        self.latitudes = np.concatenate([[self.addresses[i]['latitude'] for i in sample],
+                                         rng.uniform(south, north, QUERIES - len(sample))])
+        self.longitudes = np.concatenate([[self.addresses[i]['longitude'] for i in sample],
+                                          rng.uniform(west, east, QUERIES - len(sample))])
+        self.points = list(zip(self.latitudes.tolist(), self.longitudes.tolist()))
+        resolved = self.tree_resolver.resolve_many(self.latitudes, self.longitudes)
+        self.townships = [(county, township) for county, township in resolved if county]
+        self.address_queries = [self.addresses[i] for i in sample]
+
+        self.street_index = geo_lookup.StreetIndex(self.addresses)
+        index_dir = os.path.join(os.path.dirname(self.paths['meta']), 'address_index')
+        if not os.path.exists(os.path.join(index_dir, 'meta.json')):
+            build_index(self.paths['addresses'], index_dir)
+        self.local_geocoder = LocalGeocoder(index_dir)
+        self.app = self.make_app()
+
+    def make_app(self):
+        """A Flask app with the same /reverse-geocode route as app.py, over this suite's data."""
+        app = Flask(__name__)
+
+        @app.route('/reverse-geocode', methods=['GET'])
+        def reverse_geocode():
+            body, status = lookups.reverse_geocode_result(
+                self.grid_resolver, self.store, request.args.get('lat'), request.args.get('lon'))
+            return jsonify(body), status
+
+        return app.test_client()
+
+    def benchmarks(self):
+        """Yields (benchmark, engine, function, batch_size) for every engine that runs at this scale."""
+        points = itertools.cycle(self.points)
+        townships = itertools.cycle(self.townships)
+        addresses = itertools.cycle(self.address_queries)
+        legacy = self.scale <= LEGACY_MAX_SCALE
+
+        # get_township: a point to its (county, township)
+        if legacy:
+            yield 'get_township', 'legacy', lambda: geo_lookup.get_township_from_geojson(
+                *next(points), self.paths['townships']), 1
+        yield 'get_township', 'strtree', lambda: self.tree_resolver.resolve(*next(points)), 1
+        yield 'get_township', 'grid', lambda: self.grid_resolver.resolve(*next(points)), 1
+        yield 'get_township', 'vectorized', lambda: self.grid_resolver.resolve_many(
+            self.latitudes, self.longitudes), len(self.latitudes)
+
+        # get_trustee_info: a township to its trustee record
+        if legacy:
+            def legacy_trustee():
+                address = next(addresses)
+                geo_lookup.get_trustee_info_geojson(
+                    f"{address['housenumber']} {address['street']}, {address['city']}, IN {address['postcode']}",
+                    self.paths['trustees'], self.paths['townships'], None, self.street_index)
+            yield 'get_trustee_info', 'legacy', legacy_trustee, 1
+        yield 'get_trustee_info', 'store', lambda: self.store.get_trustee(*next(townships)), 1
+
+        # interpolate_coordinates: an address to coordinates
+        yield 'interpolate_coordinates', 'street_index', lambda: geo_lookup.interpolate_coordinates(
+            next(addresses), self.street_index), 1
+        streets = [address['street'] for address in self.address_queries]
+        numbers = [geo_lookup.parse_house_number(address['housenumber']) for address in self.address_queries]
+        cities = [address['city'] for address in self.address_queries]
+        postcodes = [address['postcode'] for address in self.address_queries]
+        yield 'interpolate_coordinates', 'vectorized', lambda: self.street_index.interpolate_many(
+            streets, numbers, cities, postcodes), len(streets)
+
+        def local_lookup():
+            address = next(addresses)
+            self.local_geocoder.lookup(int(address['housenumber']), address['street'],
+                                       address['city'], address['postcode'])
+        yield 'interpolate_coordinates', 'local_geocoder', local_lookup, 1
+
+        # /reverse-geocode: the handler alone, and through Flask with JSON serialization
+        yield 'reverse_geocode', 'handler', lambda: lookups.reverse_geocode_result(
+            self.grid_resolver, self.store, *map(str, next(points))), 1
+
+        def flask_request():
+            latitude, longitude = next(points)
+            self.app.get(f'/reverse-geocode?lat={latitude}&lon={longitude}')
+        yield 'reverse_geocode', 'flask', flask_request, 1
+
+
+def environment():
+    """Where the results came from, so result files can be compared sensibly."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'numpy': np.__version__,
+        'shapely': shapely.__version__,
+    }
+
+
+def run(scales, output, only=None):
+    results = []
+    for scale in scales:
+        suite = Suite(scale)
+        print(f"\n{scale:g}x: {suite.meta['townships']} townships, {suite.meta['trustees']} trustees, "
+              f"{suite.meta['addresses']} addresses")
+        for benchmark, engine, function, batch_size in suite.benchmarks():
+            if only and benchmark not in only:
+                continue
+            result = measure(function, batch_size)
+            result.update({'benchmark': benchmark, 'engine': engine, 'scale': scale})
+            results.append(result)
+            print(f"  {benchmark:24} {engine:15} {result['median_us']:12.2f} us/call   "
+                  f"(+/- {result['stdev_us']:.2f}, {result['samples']} x {result['number']})")
+
+    directory = os.path.dirname(output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({'environment': environment(), 'results': results}, f, indent=2)
+    print(f"\nSaved results to {output}")
+
+
+def compare(before_file, after_file, threshold):
+    """Prints the change for each benchmark in both files. Returns the number of regressions."""
+    with open(before_file, 'r') as f:
+        before = {(r['benchmark'], r['engine'], r['scale']): r for r in json.load(f)['results']}
+    with open(after_file, 'r') as f:
+        after = json.load(f)['results']
+
+    regressions = 0
+    print(f"{'benchmark':24} {'engine':15} {'scale':>6} {'before us':>12} {'after us':>12} {'ratio':>7}")
+    for result in after:
+        key = (result['benchmark'], result['engine'], result['scale'])
+        if key not in before:
+            continue
+        ratio = result['median_us'] / before[key]['median_us']
+        flag = ''
+        if ratio > threshold:
+            flag = '  slower'
+            regressions += 1
+        elif ratio < 1 / threshold:
+            flag = '  faster'
+        print(f"{key[0]:24} {key[1]:15} {key[2]:>5g}x {before[key]['median_us']:12.2f} "
+              f"{result['median_us']:12.2f} {ratio:7.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the lookup hot paths on synthetic data.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='Run the benchmarks and save the results as JSON')
+    run_parser.add_argument('--scales', type=float, nargs='+', default=SCALES)
+    run_parser.add_argument('--benchmark', action='append', help='Only run this benchmark (repeatable)')
+    run_parser.add_argument('--output', default=os.path.join(RESULTS_PATH, 'results.json'))
+
+    compare_parser = subparsers.add_parser('compare', help='Compare two result files')
+    compare_parser.add_argument('before')
+    compare_parser.add_argument('after')
+    compare_parser.add_argument('--threshold', type=float, default=1.2,
+                                help='Ratio of after to before time that counts as a regression')
+    compare_parser.add_argument('--fail-on-regression', action='store_true', help='Exit with status 1 on a regression')
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        run(args.scales, args.output, args.benchmark)
+    elif compare(args.before, args.after, args.threshold) and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,410 @@
+"""Looks up the township trustee for every address in a CSV or Excel file.
+
+    python bulk_lookup.py clients.csv results.csv --workers 4
+    python bulk_lookup.py clients.xlsx results.csv --address-column "Home Address"
+    python bulk_lookup.py --address "325 E Winslow Rd, Bloomington, IN 47401"
+
+Each row goes through the same lookups as the app. The address comes from the offline
+address index (local_geocoder.py) if it has been built, otherwise from Nominatim through
+the geocode cache. A row with only a ZIP code uses the ZIP code table (zip_townships.py),
+and so does a row whose address can't be placed but has a ZIP code.
+Then the township and its trustee are looked up. The data and indexes are loaded once,
+before the worker processes are forked, so the workers share them.
+
+Nominatim calls are limited to --rate per second across all workers together. Rows are
+read, looked up and written in chunks, in input order, so memory stays flat however long
+the file is. Progress is saved next to the output after every chunk. If a run stops
+part way, running it again continues from there; --restart starts over.
+
+The output is a CSV with the input columns followed by the result columns. A result column
+whose name the input already uses is written as lookup_<name>.
+"""
+import argparse
+import csv
+import gc
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter, deque
+from itertools import islice
+
+import batch
+import geocoder
+import lookups
+from dataset import load_dataset
+from local_geocoder import ZIP_CODE, LocalGeocoder
+from zip_townships import ZipTownships
+
+CHUNK_SIZE = 500
+RESULT_COLUMNS = ('latitude', 'longitude', 'geocoded_by', 'county', 'township', 'trustee_name', 'trustee_phone',
+                  'trustee_address', 'trustee_website', 'other_townships', 'error')
+
+# Header names tried, lowercased, when the columns aren't given on the command line
+ADDRESS_COLUMNS = ('address', 'full address', 'full_address', 'street address', 'client address')
+STREET_COLUMNS = ('street', 'street address', 'address 1', 'address1', 'address line 1')
+CITY_COLUMNS = ('city', 'town')
+STATE_COLUMNS = ('state', 'st')
+ZIP_COLUMNS = ('zip', 'zip code', 'zipcode', 'zip_code', 'postcode', 'postal code')
+
+# Loaded by load_indexes() before the workers are forked
+dataset = None
+local_geocoder = None
+zip_table = None
+
+
+def load_indexes():
+    global dataset, local_geocoder, zip_table
+    dataset = load_dataset()
+    local_geocoder = LocalGeocoder.open()
+    zip_table = ZipTownships.open()
+
+
+def cell_text(value):
+    """Excel cells come back as numbers, dates or None; ZIP codes like 47401.0 should read '47401'."""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def read_rows(path, sheet=None):
+    """Yields the header of a CSV or Excel file, then each row as a dict keyed by it."""
+    if path.lower().endswith(('.xlsx', '.xlsm')):
+        try:
+            import openpyxl
+        except ImportError:
+            sys.exit("Reading Excel files needs openpyxl: pip install openpyxl")
+        # Read-only mode streams the rows instead of loading the whole workbook
+        workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = (workbook[sheet] if sheet else workbook.active).iter_rows(values_only=True)
+            header = [cell_text(value) for value in next(rows, ())]
+            yield header
+            for values in rows:
+                if any(value is not None for value in values):
+                    yield {column: cell_text(value) for column, value in zip(header, values)}
+        finally:
+            workbook.close()
+    else:
+        with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+            reader = csv.DictReader(f)
+            yield reader.fieldnames or []
+            yield from reader
+
+
+def find_column(header, names, given=None):
+    """Returns the header column matching given, or the first of names, ignoring case."""
+    by_name = {column.strip().lower(): column for column in header}
+    if given:
+        if given.strip().lower() not in by_name:
+            sys.exit(f"There is no {given!r} column, the columns are: {', '.join(header)}")
+        return by_name[given.strip().lower()]
+    return next((by_name[name] for name in names if name in by_name), None)
+
+
+def find_columns(header, address_column=None, zip_column=None):
+    """Works out which columns hold the address, or its street, city and state, and the ZIP code."""
+    columns = {
+        'address': find_column(header, ADDRESS_COLUMNS, address_column),
+        'zip': find_column(header, ZIP_COLUMNS, zip_column),
+    }
+    if not columns['address']:
+        columns['street'] = find_column(header, STREET_COLUMNS)
+        columns['city'] = find_column(header, CITY_COLUMNS)
+        columns['state'] = find_column(header, STATE_COLUMNS)
+    if not columns['address'] and not columns.get('street') and not columns['zip']:
+        sys.exit(f"Couldn't find an address or ZIP code column in: {', '.join(header)}. "
+                 "Name one with --address-column or --zip-column.")
+    return columns
+
+
+def address_zip(address):
+    """Returns the ZIP code after the street in 'street, city, IN zip', or ''."""
+    matches = ZIP_CODE.findall(address.partition(',')[2])
+    return matches[-1] if matches else ''
+
+
+def row_query(row, columns):
+    """Returns the (address, zip code) to look up for a row."""
+    zip_code = row.get(columns['zip'], '').strip() if columns['zip'] else ''
+    if columns['address']:
+        address = row.get(columns['address'], '').strip()
+    elif columns['street'] and row.get(columns['street'], '').strip():
+        parts = [row.get(columns[part], '').strip() for part in ('street', 'city') if columns[part]]
+        state = (row.get(columns['state'], '').strip() if columns['state'] else '') or 'IN'
+        address = ', '.join(part for part in parts if part) + f", {state}"
+    else:
+        address = ''
+    if address and zip_code and zip_code not in address:
+        address = f"{address} {zip_code}"
+    elif address and not zip_code:
+        # Falls back on the ZIP code when the street can't be found
+        zip_code = address_zip(address)
+    return address, zip_code
+
+
+def add_trustee(result, trustee):
+    if trustee:
+        result['trustee_name'] = trustee.get('Name')
+        result['trustee_phone'] = trustee.get('Phone')
+        result['trustee_address'] = trustee.get('Address')
+        result['trustee_website'] = trustee.get('Website')
+
+
+def zip_townships(result, zip_code):
+    """Fills in the result from the ZIP code table. Returns False if the ZIP code isn't in it."""
+    townships = zip_table.lookup(zip_code) if zip_table and zip_code else None
+    if not townships:
+        return False
+    primary = next((entry for entry in townships if entry['trustee']), townships[0])
+    result['geocoded_by'] = 'zip_table'
+    result['county'] = primary['county']
+    result['township'] = primary['township']
+    add_trustee(result, primary['trustee'])
+    result['other_townships'] = '; '.join(
+        f"{entry['county']}: {entry['township']} ({entry['weight']:.0%})"
+        for entry in townships if entry is not primary)
+    return True
+
+
+def geocode_query(result, address, zip_code, use_upstream):
+    """Geocodes one row. Returns (lat, lon), or None if the ZIP code table answered it or nothing was found.
+
+    An address that can't be placed still gets the townships of its ZIP code, if it has one.
+    """
+    if address:
+        coordinates = local_geocoder.geocode(address) if local_geocoder else None
+        if coordinates:
+            result['geocoded_by'] = 'local'
+            return coordinates
+        if use_upstream:
+            try:
+                coordinates = lookups.pick_location(geocoder.search(address=address))
+            except geocoder.GeocoderUnavailable:
+                if zip_townships(result, zip_code):
+                    return None
+                raise
+            if coordinates:
+                result['geocoded_by'] = 'nominatim'
+                return coordinates
+        zip_townships(result, zip_code)
+        return None
+
+    if zip_townships(result, zip_code) or not use_upstream:
+        return None
+    result['geocoded_by'] = 'nominatim'
+    return lookups.pick_location(geocoder.search(zip=zip_code), zip_code)
+
+
+def lookup_chunk(queries, use_upstream=True):
+    """Looks up a list of (address, zip code) queries. Returns one result dict per query."""
+    results = []
+    points = []
+    for position, (address, zip_code) in enumerate(queries):
+        result = {}
+        results.append(result)
+        if not address and not zip_code:
+            result['error'] = 'No address or zip code'
+            continue
+        try:
+            coordinates = geocode_query(result, address, zip_code, use_upstream)
+        except geocoder.GeocoderUnavailable as e:
+            result['error'] = f"Geocoding failed: {e}"
+            continue
+        if coordinates:
+            result['latitude'], result['longitude'] = coordinates
+            points.append({'line': position, 'lat': coordinates[0], 'lon': coordinates[1]})
+        elif 'township' not in result:
+            result['error'] = 'Address not found'
+
+    # Townships for the whole chunk in one vectorized lookup, like the batch endpoint
+    for point in batch.resolve_points(points, dataset.resolver, dataset.resource_store, include_pantries=False,
+                                      chunk_size=max(1, len(points))):
+        result = results[point['line']]
+        if 'error' in point:
+            result['error'] = point['error']
+            continue
+        result['county'] = point['county']
+        result['township'] = point['township']
+        add_trustee(result, point['trustee'])
+    return results
+
+
+def result_columns(header):
+    """Maps each result column to its output column name.
+
+    A result column whose name the input already uses, e.g. a county column in the client
+    list, is written as lookup_<name> (lookup_<name>_2 and so on if that's taken too), so the
+    input values are kept.
+    """
+    taken = {column.strip().lower() for column in header}
+    names = {}
+    for column in RESULT_COLUMNS:
+        name = column
+        suffix = 1
+        while name.lower() in taken:
+            name = f'lookup_{column}' if suffix == 1 else f'lookup_{column}_{suffix}'
+            suffix += 1
+        taken.add(name.lower())
+        names[column] = name
+    return names
+
+
+def init_worker():
+    # A SQLite connection must not be used on both sides of a fork, so each worker opens its own
+    geocoder.cache.local = threading.local()
+    # Ctrl-C stops the parent, which then stops the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def run_chunks(chunks, workers, use_upstream):
+    """Yields (rows, results) for each chunk of rows, in order, with a few chunks in flight at most."""
+    if workers <= 1:
+        for rows, queries in chunks:
+            yield rows, lookup_chunk(queries, use_upstream)
+        return
+
+    # Fork so the workers share the indexes loaded in this process
+    with multiprocessing.get_context('fork').Pool(workers, initializer=init_worker) as pool:
+        pending = deque()
+        for rows, queries in chunks:
+            pending.append((rows, pool.apply_async(lookup_chunk, (queries, use_upstream))))
+            if len(pending) >= workers * 2:
+                rows, result = pending.popleft()
+                yield rows, result.get()
+        while pending:
+            rows, result = pending.popleft()
+            yield rows, result.get()
+
+
+def checkpoint_path(output):
+    return output + '.checkpoint'
+
+
+def load_checkpoint(input_path, output):
+    """Returns the progress saved by an unfinished run over the same input, or None."""
+    try:
+        with open(checkpoint_path(output), 'r') as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        return None
+    stat = os.stat(input_path)
+    if checkpoint.get('input') != os.path.abspath(input_path) or checkpoint.get('input_size') != stat.st_size \
+            or checkpoint.get('input_mtime') != stat.st_mtime:
+        return None
+    if not os.path.exists(output) or os.path.getsize(output) < checkpoint['output_bytes']:
+        return None
+    return checkpoint
+
+
+def save_checkpoint(output, checkpoint):
+    temporary_path = checkpoint_path(output) + '.tmp'
+    with open(temporary_path, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(temporary_path, checkpoint_path(output))
+
+
+def bulk_lookup(input_path, output, address_column=None, zip_column=None, sheet=None, workers=1,
+                chunk_size=CHUNK_SIZE, rate=geocoder.RATE_PER_SECOND, use_upstream=True, restart=False):
+    """Looks up every row of the input file and writes the results to output as CSV."""
+    rows = read_rows(input_path, sheet)
+    header = next(rows)
+    columns = find_columns(header, address_column, zip_column)
+    output_columns = result_columns(header)
+    renamed = [f"{column} as {name}" for column, name in output_columns.items() if name != column]
+    if renamed:
+        print(f"The input already has some result columns, writing {', '.join(renamed)}")
+    fieldnames = header + list(output_columns.values())
+
+    checkpoint = None if restart else load_checkpoint(input_path, output)
+    if checkpoint:
+        # Drop anything written after the last checkpoint, it's looked up again
+        os.truncate(output, checkpoint['output_bytes'])
+        rows = islice(rows, checkpoint['rows'], None)
+        print(f"Resuming after row {checkpoint['rows']}")
+    else:
+        stat = os.stat(input_path)
+        checkpoint = {'input': os.path.abspath(input_path), 'input_size': stat.st_size,
+                      'input_mtime': stat.st_mtime, 'rows': 0, 'output_bytes': 0}
+
+    load_indexes()
+    # Created before the workers fork, so they all share the one bucket
+    geocoder.client.limiter = geocoder.TokenBucket(rate, 1)
+    # Wait as long as it takes for a turn at Nominatim instead of failing the row
+    geocoder.client.max_queue_wait = None
+    # Keep the garbage collector in the workers from touching (and copying) the loaded data
+    gc.freeze()
+
+    def chunks():
+        for chunk in batch.chunked(rows, chunk_size):
+            yield chunk, [row_query(row, columns) for row in chunk]
+
+    outcomes = Counter()
+    start = time.perf_counter()
+    reported = start
+    done = 0
+    directory = os.path.dirname(output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(output, 'a' if checkpoint['rows'] else 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames, extrasaction='ignore')
+        if not checkpoint['rows']:
+            writer.writeheader()
+        try:
+            for chunk, results in run_chunks(chunks(), workers, use_upstream):
+                for row, result in zip(chunk, results):
+                    row.update((output_columns[column], value) for column, value in result.items())
+                    writer.writerow(row)
+                    outcomes['error' if 'error' in result else result['geocoded_by']] += 1
+                f.flush()
+                done += len(chunk)
+                checkpoint['rows'] += len(chunk)
+                checkpoint['output_bytes'] = os.fstat(f.fileno()).st_size
+                save_checkpoint(output, checkpoint)
+                if time.perf_counter() - reported > 10:
+                    reported = time.perf_counter()
+                    print(f"{checkpoint['rows']} rows, {done / (reported - start):.0f} rows/s")
+        except KeyboardInterrupt:
+            print(f"Stopped after row {checkpoint['rows']}, run again to resume")
+            return
+
+    os.remove(checkpoint_path(output))
+    elapsed = time.perf_counter() - start
+    print(f"Looked up {done} rows in {elapsed:.1f} s ({done / max(elapsed, 1e-9):.0f} rows/s): "
+          + ', '.join(f"{count} {outcome}" for outcome, count in outcomes.most_common()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Look up the township trustee for every address in a file.')
+    parser.add_argument('input', nargs='?', help='CSV or Excel (.xlsx) file with a header row')
+    parser.add_argument('output', nargs='?', help='CSV file to write the results to')
+    parser.add_argument('--address', help='Look up this one address and print the result instead')
+    parser.add_argument('--address-column', help='Column with the full address (default: guessed from the header)')
+    parser.add_argument('--zip-column', help='Column with the ZIP code (default: guessed from the header)')
+    parser.add_argument('--sheet', help='Excel sheet to read (default: the active one)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Rows per task and per checkpoint')
+    parser.add_argument('--rate', type=float, default=geocoder.RATE_PER_SECOND,
+                        help='Nominatim calls per second, across all workers')
+    parser.add_argument('--no-upstream', action='store_true',
+                        help="Don't call Nominatim, leave addresses the local indexes can't place unmatched")
+    parser.add_argument('--restart', action='store_true', help='Ignore the checkpoint of an unfinished run')
+    args = parser.parse_args()
+
+    if args.address:
+        load_indexes()
+        print(json.dumps(lookup_chunk([(args.address, address_zip(args.address))], not args.no_upstream)[0], indent=2))
+        return
+    if not args.input or not args.output:
+        parser.error('give an input and an output file, or --address')
+    bulk_lookup(args.input, args.output, args.address_column, args.zip_column, args.sheet, args.workers,
+                args.chunk_size, args.rate, not args.no_upstream, args.restart)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+"""Per-county trustee and food pantry data for the map frontend, served from /api/county/<name>.
+
+`python county_shards.py publish` splits both datasets by county and keeps only the fields
+the frontend shows. It writes each county as JSON, gzip and (when the brotli package is
+installed) brotli. The app serves whichever encoding the browser accepts. Each response has
+a strong ETag and Cache-Control, so revisits are answered with a 304.
+
+Without published shards the app builds them in memory at startup.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import os
+import time
+
+from data_store import FOOD_PANTRY_FILE, TRUSTEE_FILE, ResourceStore, normalize
+
+logger = logging.getLogger(__name__)
+
+SHARD_PATH = os.getenv('COUNTY_SHARD_PATH', 'cache/county_shards')
+COUNTIES_FILE = 'static/utilities/data/counties_bounding_boxes.json'
+CACHE_CONTROL = f"public, max-age={int(os.getenv('COUNTY_CACHE_MAX_AGE', 3600))}"
+
+# Fields the map popups and result cards use
+RECORD_FIELDS = ('Name', 'Address', 'Phone', 'Website', 'Hours', 'Latitude', 'Longitude')
+
+# Preferred first when the browser accepts several
+ENCODINGS = ('br', 'gzip', 'identity')
+EXTENSIONS = {'br': '.json.br', 'gzip': '.json.gz', 'identity': '.json'}
+
+
+def slim(record):
+    """Keeps only the fields the frontend shows."""
+    return {field: record[field] for field in RECORD_FIELDS if field in record}
+
+
+def county_names(store, counties_file=COUNTIES_FILE):
+    """Display names for every county in the county list or the data, keyed by normalized name."""
+    names = {}
+    if os.path.exists(counties_file):
+        with open(counties_file, 'r') as f:
+            for county in json.load(f):
+                names[normalize(county['name'])] = county['name']
+    for record in (store.trustees or []) + (store.food_pantries or []):
+        names.setdefault(normalize(record['County']), record['County'])
+    return names
+
+
+def compress(body, quality=11):
+    """Returns the body in every available encoding."""
+    encoded = {'identity': body, 'gzip': gzip.compress(body, compresslevel=9, mtime=0)}
+    try:
+        import brotli
+    except ImportError:
+        pass
+    else:
+        encoded['br'] = brotli.compress(body, quality=quality)
+    return encoded
+
+
+def accepted_encodings(header):
+    """Content codings the Accept-Encoding header allows, ignoring any with q=0."""
+    accepted = set()
+    for part in (header or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        params = params.replace(' ', '')
+        if coding and params not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            accepted.add(coding.lower())
+    return accepted
+
+
+class CountyShard:
+    """One county's payload in every encoding it was compressed to."""
+
+    def __init__(self, name, encoded):
+        self.name = name
+        self.encoded = encoded
+        self.digest = hashlib.sha256(encoded['identity']).hexdigest()[:20]
+
+    def etag(self, encoding):
+        # Each encoding is a different byte sequence, so a strong ETag has to differ per encoding too
+        return f'"{self.digest}"' if encoding == 'identity' else f'"{self.digest}-{encoding}"'
+
+
+class CountyShards:
+    """The per-county payloads, looked up by normalized county name."""
+
+    def __init__(self, shards, source):
+        self.shards = shards
+        self.source = source
+
+    def __len__(self):
+        return len(self.shards)
+
+    @classmethod
+    def from_store(cls, store, counties_file=COUNTIES_FILE, quality=11):
+        """Builds the shards from the resource store."""
+        shards = {}
+        for key, name in county_names(store, counties_file).items():
+            payload = {
+                'county': name,
+                'trustees': [slim(record) for record in store.trustees_by_county.get(key, [])],
+                'food_pantries': [slim(record) for record in store.pantries_by_county.get(key, [])],
+            }
+            body = json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+            shards[key] = CountyShard(name, compress(body, quality))
+        return cls(shards, 'memory')
+
+    @classmethod
+    def open(cls, shard_dir=SHARD_PATH):
+        """Reads published shards, or returns None if there aren't any."""
+        manifest_path = os.path.join(shard_dir, 'manifest.json')
+        if not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+        for source in manifest['sources']:
+            if os.path.exists(source) and os.path.getmtime(source) > manifest['published_at']:
+                logger.warning("%s changed after the county shards were published, run publish again", source)
+
+        shards = {}
+        for key, entry in manifest['counties'].items():
+            encoded = {}
+            for encoding in entry['encodings']:
+                with open(os.path.join(shard_dir, entry['file'] + EXTENSIONS[encoding]), 'rb') as f:
+                    encoded[encoding] = f.read()
+            shards[key] = CountyShard(entry['name'], encoded)
+        return cls(shards, shard_dir)
+
+    @classmethod
+    def load(cls, store, shard_dir=SHARD_PATH):
+        """Published shards if there are any, otherwise shards built from the store."""
+        shards = cls.open(shard_dir)
+        if shards is None:
+            # Lower brotli quality, so building them doesn't hold up startup
+            shards = cls.from_store(store, quality=5)
+        return shards
+
+    def response(self, name, accept_encoding=None, if_none_match=None):
+        """Returns (status, headers, body) for a county, or None if there's no such county."""
+        shard = self.shards.get(normalize(name))
+        if shard is None:
+            return None
+
+        accepted = accepted_encodings(accept_encoding)
+        encoding = next(e for e in ENCODINGS if e in shard.encoded and (e in accepted or e == 'identity'))
+        etag = shard.etag(encoding)
+        headers = {
+            'ETag': etag,
+            'Cache-Control': CACHE_CONTROL,
+            'Vary': 'Accept-Encoding',
+        }
+
+        # If-None-Match uses the weak comparison, so a W/ prefix added by a proxy still matches
+        candidates = [tag.strip().removeprefix('W/') for tag in (if_none_match or '').split(',')]
+        if etag in candidates or '*' in candidates:
+            return 304, headers, b''
+
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return 200, headers, shard.encoded[encoding]
+
+
+def publish(output_dir=SHARD_PATH, trustee_file=TRUSTEE_FILE, food_pantry_file=FOOD_PANTRY_FILE):
+    """Writes every county's shard, in every encoding, plus a manifest to output_dir."""
+    store = ResourceStore.load(trustee_file, food_pantry_file)
+    shards = CountyShards.from_store(store)
+    os.makedirs(output_dir, exist_ok=True)
+
+    manifest = {
+        'published_at': time.time(),
+        'sources': [trustee_file, food_pantry_file, COUNTIES_FILE],
+        'counties': {},
+    }
+    total = {encoding: 0 for encoding in ENCODINGS}
+    for key, shard in shards.shards.items():
+        file_name = key.replace(' ', '_').replace('.', '')
+        for encoding, body in shard.encoded.items():
+            with open(os.path.join(output_dir, file_name + EXTENSIONS[encoding]), 'wb') as f:
+                f.write(body)
+            total[encoding] += len(body)
+        manifest['counties'][key] = {'name': shard.name, 'file': file_name, 'encodings': sorted(shard.encoded)}
+
+    # The manifest goes last, so the app never opens a half-written set of shards
+    with open(os.path.join(output_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    sizes = ', '.join(f"{encoding} {total[encoding] / 1024:.0f} KB" for encoding in ENCODINGS if total[encoding])
+    print(f"Published {len(shards)} counties to {output_dir} ({sizes} in total, "
+          f"{total['identity'] / len(shards) / 1024:.1f} KB per county on average before compression)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Publish per-county data shards for the frontend.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    publish_parser = subparsers.add_parser('publish', help='Write the county shards')
+    publish_parser.add_argument('--output', default=SHARD_PATH)
+    publish_parser.add_argument('--trustees', default=TRUSTEE_FILE)
+    publish_parser.add_argument('--food-pantries', default=FOOD_PANTRY_FILE)
+    args = parser.parse_args()
+
+    publish(args.output, args.trustees, args.food_pantries)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
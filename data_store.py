@@ -0,0 +1,139 @@
+import json
+import logging
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+TRUSTEE_FILE = 'static/utilities/data/indiana_township_trustees.json'
+FOOD_PANTRY_FILE = 'static/utilities/data/indiana_food_pantries.json'
+
+REQUIRED_FIELDS = ('County', 'Name')
+
+
+def normalize(value):
+    """Normalizes a county or township name for use as a lookup key."""
+    return ' '.join(value.split()).lower() if isinstance(value, str) else ''
+
+
+def township_keys(name):
+    """Returns every prefix of a trustee name that ends in 'township'.
+
+    The app has always matched a trustee when its name starts with the township name,
+    e.g. 'Blue Creek township' matches 'Blue Creek Township Trustee'. Indexing these
+    prefixes lets that comparison be answered with a dict lookup.
+    """
+    name = normalize(name)
+    keys = []
+    start = name.find('township')
+    while start != -1:
+        keys.append(name[:start + len('township')])
+        start = name.find('township', start + 1)
+    return keys
+
+
+def load_records(file_path, label):
+    """Loads a JSON list of records, returning None if the file does not exist."""
+    try:
+        with open(file_path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        logger.warning("%s data file not found: %s", label, file_path)
+        return None
+
+
+def validate_records(records, label):
+    """Drops records missing the fields every lookup relies on and logs what was dropped."""
+    valid = []
+    for position, record in enumerate(records):
+        missing = [field for field in REQUIRED_FIELDS if not record.get(field)]
+        if missing:
+            logger.warning("Skipping %s record %d, missing %s: %r", label, position, ', '.join(missing), record.get('Name'))
+            continue
+        valid.append(record)
+    return valid
+
+
+class ResourceStore:
+    """In-memory trustee and food pantry data, indexed by county and township.
+
+    Built once at startup so request handlers never re-read the JSON files.
+    A list is None when its data file was not found, so callers can still report that.
+    """
+
+    def __init__(self, trustees, food_pantries):
+        self.trustees = trustees
+        self.food_pantries = food_pantries
+        self.trustees_by_township = {}
+        self.trustees_by_county = defaultdict(list)
+        self.pantries_by_county = defaultdict(list)
+
+        for trustee in trustees or []:
+            county = normalize(trustee['County'])
+            self.trustees_by_county[county].append(trustee)
+            for key in township_keys(trustee['Name']):
+                # First record in file order wins, same as the old linear scan.
+                self.trustees_by_township.setdefault((county, key), trustee)
+
+        for pantry in food_pantries or []:
+            self.pantries_by_county[normalize(pantry['County'])].append(pantry)
+
+    @classmethod
+    def load(cls, trustee_file=TRUSTEE_FILE, food_pantry_file=FOOD_PANTRY_FILE, townships=None):
+        """Loads and validates both data files.
+
+        townships is an optional iterable of (county, township) pairs from the township
+        polygons; when given, townships without a trustee and trustees that match no
+        township are logged.
+        """
+        trustees = load_records(trustee_file, 'Trustee')
+        food_pantries = load_records(food_pantry_file, 'Food pantry')
+        if trustees is not None:
+            trustees = validate_records(trustees, 'trustee')
+        if food_pantries is not None:
+            food_pantries = validate_records(food_pantries, 'food pantry')
+
+        store = cls(trustees, food_pantries)
+        if townships is not None:
+            store.log_unmatched(townships)
+        logger.info("Loaded %d trustees and %d food pantries", len(trustees or []), len(food_pantries or []))
+        return store
+
+    def log_unmatched(self, townships):
+        """Logs townships with no trustee and trustees that match no township."""
+        matched = set()
+        missing = []
+        for county, township in set(townships):
+            trustee = self.get_trustee(county, township)
+            if trustee is None:
+                missing.append(f"{county}: {township}")
+            else:
+                matched.add(id(trustee))
+
+        if missing:
+            logger.info("%d townships have no trustee record", len(missing))
+            logger.debug("Townships without a trustee: %s", '; '.join(sorted(missing)))
+
+        unmatched = [trustee for trustee in self.trustees or [] if id(trustee) not in matched]
+        if unmatched:
+            logger.info("%d trustee records do not match any township", len(unmatched))
+            logger.debug("Unmatched trustees: %s", '; '.join(f"{t['County']}: {t['Name']}" for t in unmatched))
+
+    def get_trustee(self, county, township):
+        """Returns the trustee record for a county and township, or None."""
+        county = normalize(county)
+        township = normalize(township)
+        trustee = self.trustees_by_township.get((county, township))
+        if trustee is not None:
+            return trustee
+        if township.endswith('township'):
+            return None
+        # Township names that don't end in 'township' (e.g. 'County Subdivisions Not Defined')
+        # fall back to a scan of the handful of trustees in that county.
+        for trustee in self.trustees_by_county.get(county, ()):
+            if normalize(trustee['Name']).startswith(township):
+                return trustee
+        return None
+
+    def get_food_pantries(self, county):
+        """Returns the list of food pantries in a county."""
+        return self.pantries_by_county.get(normalize(county), [])
@@ -0,0 +1,281 @@
+"""Loads the township, trustee and food pantry data the app serves.
+
+`python dataset.py compile-data` writes everything into one binary bundle: township
+geometries as WKB, township names as string columns, the township lookup grid, the
+township polygons simplified for each map tile zoom (see vector_tiles.py) and the
+validated trustee and food pantry records. At startup the bundle is memory-mapped, which
+skips the GeoJSON parse and the geopandas import. Without a bundle the app falls back to
+reading the source files.
+
+Bundle layout: b'IRLB', uint32 version, uint32 header length, a JSON header describing
+each array (dtype, shape, offset), then the arrays themselves, 64-byte aligned.
+"""
+import argparse
+import json
+import logging
+import mmap
+import os
+import statistics
+import struct
+import subprocess
+import sys
+import time
+
+import numpy as np
+import shapely
+
+from data_store import FOOD_PANTRY_FILE, TRUSTEE_FILE, ResourceStore
+from township_grid import DEFAULT_RESOLUTION, TownshipGrid, rasterize
+from township_resolver import TownshipResolver
+
+logger = logging.getLogger(__name__)
+
+TOWNSHIP_FILE = 'static/utilities/data/indiana_townships.geojson'
+BUNDLE_PATH = os.getenv('DATASET_BUNDLE', 'cache/dataset.bundle')
+
+MAGIC = b'IRLB'
+BUNDLE_VERSION = 1
+ALIGNMENT = 64
+
+
+class Dataset:
+    """The loaded township resolver and resource store, and where they came from."""
+
+    def __init__(self, resolver, resource_store, source, tile_layers=None):
+        self.resolver = resolver
+        self.resource_store = resource_store
+        self.source = source
+        # {zoom: simplified Web Mercator polygons} for TownshipTiles, when the bundle has them
+        self.tile_layers = tile_layers
+
+
+def aligned(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def encode_blobs(values):
+    """Packs a list of bytes into one uint8 blob plus an offsets array."""
+    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(value) for value in values])
+    return np.frombuffer(b''.join(values), dtype=np.uint8), offsets
+
+
+def decode_blobs(blob, offsets):
+    return [blob[offsets[i]:offsets[i + 1]].tobytes() for i in range(len(offsets) - 1)]
+
+
+def decode_strings(blob, offsets):
+    return [value.decode('utf-8') for value in decode_blobs(blob, offsets)]
+
+
+def write_bundle(path, arrays, meta):
+    """Writes named arrays and a metadata dict to a bundle file."""
+    entries = {}
+    offset = 0
+    contiguous = {}
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        offset = aligned(offset)
+        entries[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        contiguous[name] = array
+        offset += array.nbytes
+
+    header = json.dumps({'meta': meta, 'arrays': entries}).encode('utf-8')
+    prefix = MAGIC + struct.pack('<II', BUNDLE_VERSION, len(header)) + header
+    data_start = aligned(len(prefix))
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'wb') as f:
+        f.write(prefix)
+        for name, array in contiguous.items():
+            f.write(b'\0' * (data_start + entries[name]['offset'] - f.tell()))
+            f.write(array.tobytes())
+    # Replace atomically so a running app never maps a half-written file
+    os.replace(temporary_path, path)
+
+
+def read_bundle(path):
+    """Memory-maps a bundle file. Returns (arrays, meta); the arrays are views into the map.
+
+    Raises ValueError for a file that isn't a complete bundle, e.g. one cut short by a full disk.
+    """
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if len(mapped) < 12 or mapped[:4] != MAGIC:
+        raise ValueError(f"{path} is not a dataset bundle")
+    version, header_length = struct.unpack('<II', mapped[4:12])
+    if version != BUNDLE_VERSION:
+        raise ValueError(f"Dataset bundle version {version} is not supported, run compile-data again")
+    if 12 + header_length > len(mapped):
+        raise ValueError(f"{path} is truncated")
+    header = json.loads(mapped[12:12 + header_length])
+    data_start = aligned(12 + header_length)
+
+    arrays = {}
+    try:
+        for name, entry in header['arrays'].items():
+            dtype = np.dtype(entry['dtype'])
+            count = int(np.prod(entry['shape']))
+            start = data_start + entry['offset']
+            if entry['offset'] < 0 or start + count * dtype.itemsize > len(mapped):
+                raise ValueError(f"{path} is truncated")
+            array = np.frombuffer(mapped, dtype=dtype, count=count, offset=start)
+            arrays[name] = array.reshape(entry['shape'])
+        meta = header['meta']
+    except (KeyError, TypeError, AttributeError) as e:
+        raise ValueError(f"{path} has a malformed header ({e!r})") from e
+    return arrays, meta
+
+
+def compile_data(output=BUNDLE_PATH, township_file=TOWNSHIP_FILE, trustee_file=TRUSTEE_FILE,
+                 food_pantry_file=FOOD_PANTRY_FILE, grid_resolution=DEFAULT_RESOLUTION):
+    """Compiles the source data files into a bundle."""
+    from vector_tiles import simplify_layers
+
+    dataset = load_sources(township_file, trustee_file, food_pantry_file)
+    resolver = dataset.resolver
+    store = dataset.resource_store
+
+    arrays = {}
+    arrays['township_wkb'], arrays['township_wkb_offsets'] = encode_blobs(list(shapely.to_wkb(resolver.geometries)))
+    arrays['township_counties'], arrays['township_counties_offsets'] = encode_blobs(
+        [str(county).encode('utf-8') for county in resolver.counties])
+    arrays['township_names'], arrays['township_names_offsets'] = encode_blobs(
+        [str(township).encode('utf-8') for township in resolver.townships])
+    arrays['trustees'], _ = encode_blobs([json.dumps(store.trustees).encode('utf-8')])
+    arrays['food_pantries'], _ = encode_blobs([json.dumps(store.food_pantries).encode('utf-8')])
+
+    tile_layers = simplify_layers(resolver.geometries)
+    for z, geometries in tile_layers.items():
+        arrays[f'tile_layer_{z}_wkb'], arrays[f'tile_layer_{z}_wkb_offsets'] = encode_blobs(
+            list(shapely.to_wkb(geometries)))
+
+    meta = {
+        'compiled_at': time.time(),
+        'sources': [township_file, trustee_file, food_pantry_file],
+        'townships': len(resolver),
+        'tile_zooms': list(tile_layers),
+    }
+    if grid_resolution:
+        grid, grid_meta = rasterize(resolver, grid_resolution)
+        arrays['township_grid'] = grid
+        meta['grid'] = grid_meta
+
+    write_bundle(output, arrays, meta)
+    print(f"Compiled {len(resolver)} townships, {len(store.trustees or [])} trustees and "
+          f"{len(store.food_pantries or [])} food pantries into {output} ({os.path.getsize(output)} bytes)")
+
+
+def load_bundle(path=BUNDLE_PATH):
+    """Builds the dataset from a compiled bundle."""
+    arrays, meta = read_bundle(path)
+    for source in meta['sources']:
+        if os.path.exists(source) and os.path.getmtime(source) > meta['compiled_at']:
+            logger.warning("%s changed after %s was compiled, run compile-data again", source, path)
+
+    geometries = shapely.from_wkb(decode_blobs(arrays['township_wkb'], arrays['township_wkb_offsets']))
+    counties = decode_strings(arrays['township_counties'], arrays['township_counties_offsets'])
+    townships = decode_strings(arrays['township_names'], arrays['township_names_offsets'])
+    resolver = TownshipResolver(geometries, counties, townships)
+    if 'township_grid' in arrays:
+        resolver.use_grid(TownshipGrid(arrays['township_grid'], meta['grid']))
+
+    # A missing source file was compiled as null, so it still reads back as None
+    trustees = json.loads(arrays['trustees'].tobytes())
+    food_pantries = json.loads(arrays['food_pantries'].tobytes())
+    resource_store = ResourceStore(trustees, food_pantries)
+    # The same check ResourceStore.load makes when reading the source files
+    resource_store.log_unmatched(zip(counties, townships))
+
+    tile_layers = {}
+    for z in meta.get('tile_zooms', []):
+        tile_layers[z] = shapely.from_wkb(
+            decode_blobs(arrays[f'tile_layer_{z}_wkb'], arrays[f'tile_layer_{z}_wkb_offsets']))
+    return Dataset(resolver, resource_store, path, tile_layers or None)
+
+
+def load_sources(township_file=TOWNSHIP_FILE, trustee_file=TRUSTEE_FILE, food_pantry_file=FOOD_PANTRY_FILE):
+    """Builds the dataset from the GeoJSON and JSON source files."""
+    import geopandas as gpd
+
+    township_gdf = gpd.read_file(township_file)
+    resolver = TownshipResolver.from_geodataframe(township_gdf)
+    # Use the precomputed township grid, if one has been built (see township_grid.py)
+    grid = TownshipGrid.open(resolver)
+    if grid:
+        resolver.use_grid(grid)
+
+    resource_store = ResourceStore.load(
+        trustee_file, food_pantry_file,
+        townships=zip(resolver.counties, resolver.townships)
+    )
+    return Dataset(resolver, resource_store, township_file)
+
+
+def load_dataset(bundle_path=BUNDLE_PATH):
+    """Loads the compiled bundle if there is one, otherwise the source files."""
+    if bundle_path and os.path.exists(bundle_path):
+        try:
+            return load_bundle(bundle_path)
+        except (OSError, ValueError, KeyError, IndexError, shapely.errors.ShapelyError) as e:
+            # A bad bundle costs a slow start, not an app that won't start
+            logger.warning("Could not load %s (%s), reading the source files instead", bundle_path, e)
+    return load_sources()
+
+
+def benchmark(bundle_path=BUNDLE_PATH, repeat=5):
+    """Times a cold start (fresh interpreter, imports included) with and without the bundle."""
+    script = (
+        "import time; start = time.perf_counter(); import dataset; "
+        "dataset.load_dataset({!r}); print(time.perf_counter() - start)"
+    )
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    for label, path in (('geojson', None), ('bundle', bundle_path)):
+        if path and not os.path.exists(path):
+            print(f"{path} does not exist, run compile-data first")
+            continue
+        timings = []
+        for _ in range(repeat):
+            output = subprocess.run(
+                [sys.executable, '-c', script.format(path)],
+                cwd=here, capture_output=True, text=True, check=True,
+            ).stdout
+            timings.append(float(output.strip().splitlines()[-1]))
+        results[label] = timings
+        print(f"{label:8} median {statistics.median(timings) * 1000:8.1f} ms   "
+              f"min {min(timings) * 1000:8.1f} ms   ({repeat} runs)")
+    if len(results) == 2:
+        speedup = statistics.median(results['geojson']) / statistics.median(results['bundle'])
+        print(f"bundle starts {speedup:.1f}x faster")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compile and benchmark the app dataset.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    compile_parser = subparsers.add_parser('compile-data', help='Compile the source files into a bundle')
+    compile_parser.add_argument('--output', default=BUNDLE_PATH)
+    compile_parser.add_argument('--townships', default=TOWNSHIP_FILE)
+    compile_parser.add_argument('--trustees', default=TRUSTEE_FILE)
+    compile_parser.add_argument('--food-pantries', default=FOOD_PANTRY_FILE)
+    compile_parser.add_argument('--grid-resolution', type=float, default=DEFAULT_RESOLUTION,
+                                help='Township grid cell size in degrees, 0 to leave the grid out')
+
+    benchmark_parser = subparsers.add_parser('benchmark', help='Compare cold start times with and without the bundle')
+    benchmark_parser.add_argument('--bundle', default=BUNDLE_PATH)
+    benchmark_parser.add_argument('--repeat', type=int, default=5)
+
+    args = parser.parse_args()
+    if args.command == 'compile-data':
+        compile_data(args.output, args.townships, args.trustees, args.food_pantries, args.grid_resolution)
+    else:
+        benchmark(args.bundle, args.repeat)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
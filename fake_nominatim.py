@@ -0,0 +1,208 @@
+"""A local stand-in for Nominatim's /search, for load tests and offline development.
+
+    python fake_nominatim.py --port 8080 --latency-ms 200 --jitter-ms 50 --error-rate 0.02
+    NOMINATIM_URL=http://127.0.0.1:8080/search NOMINATIM_RATE=1000 python app.py
+
+Answers have the shape of real Nominatim results with addressdetails=1. Address searches get
+one result near an Indiana city, and postal code searches get a few results, with the Indiana
+one not always first, like the real thing. The same query always gets the same answer. Each
+request waits --latency-ms plus or minus --jitter-ms. A share of requests get a 503
+(--error-rate), a 429 with Retry-After (--throttle-rate) or an empty list (--empty-rate).
+
+GET /stats returns how many requests of each kind were answered, so a load test can count
+its upstream calls.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+from urllib.parse import parse_qs
+
+LATENCY_MS = float(os.getenv('FAKE_NOMINATIM_LATENCY_MS', 200))
+JITTER_MS = float(os.getenv('FAKE_NOMINATIM_JITTER_MS', 50))
+ERROR_RATE = float(os.getenv('FAKE_NOMINATIM_ERROR_RATE', 0))
+THROTTLE_RATE = float(os.getenv('FAKE_NOMINATIM_THROTTLE_RATE', 0))
+EMPTY_RATE = float(os.getenv('FAKE_NOMINATIM_EMPTY_RATE', 0))
+
+LICENCE = 'Data © OpenStreetMap contributors, ODbL 1.0. http://osm.org/copyright'
+
+# (city, county, postcode, latitude, longitude)
+CITIES = [
+    ('Indianapolis', 'Marion County', '46204', 39.7684, -86.1581),
+    ('Bloomington', 'Monroe County', '47401', 39.1653, -86.5264),
+    ('Fort Wayne', 'Allen County', '46802', 41.0793, -85.1394),
+    ('Evansville', 'Vanderburgh County', '47708', 37.9716, -87.5711),
+    ('South Bend', 'St. Joseph County', '46601', 41.6764, -86.2520),
+    ('Lafayette', 'Tippecanoe County', '47901', 40.4167, -86.8753),
+    ('Muncie', 'Delaware County', '47305', 40.1934, -85.3864),
+    ('Terre Haute', 'Vigo County', '47807', 39.4667, -87.4139),
+    ('Columbus', 'Bartholomew County', '47201', 39.2014, -85.9214),
+    ('Kokomo', 'Howard County', '46901', 40.4864, -86.1336),
+]
+# Results outside Indiana that a bare postal code search also returns
+OTHER_PLACES = [
+    ('Ohio', 'Franklin County', 'Columbus', 39.9612, -82.9988),
+    ('Illinois', 'Cook County', 'Chicago', 41.8781, -87.6298),
+    ('Kentucky', 'Jefferson County', 'Louisville', 38.2527, -85.7585),
+]
+
+counters = {'search': 0, 'errors': 0, 'throttled': 0, 'empty': 0}
+
+
+def query_random(query):
+    """A random generator seeded by the query, so the same query always gets the same answer."""
+    return random.Random(hashlib.sha1(query.encode('utf-8')).digest())
+
+
+def address_result(rng, query):
+    city, county, postcode, latitude, longitude = rng.choice(CITIES)
+    latitude += rng.uniform(-0.03, 0.03)
+    longitude += rng.uniform(-0.03, 0.03)
+    house_number = str(rng.randint(1, 9999))
+    road = query.split(',')[0].lstrip('0123456789 ').strip() or 'Main Street'
+    osm_id = rng.randint(10 ** 8, 10 ** 10)
+    return {
+        'place_id': rng.randint(10 ** 6, 10 ** 9),
+        'licence': LICENCE,
+        'osm_type': 'node',
+        'osm_id': osm_id,
+        'lat': f'{latitude:.7f}',
+        'lon': f'{longitude:.7f}',
+        'class': 'place',
+        'type': 'house',
+        'place_rank': 30,
+        'importance': 9.99999999995449e-06,
+        'addresstype': 'place',
+        'name': '',
+        'display_name': f'{house_number}, {road}, {city}, {county}, Indiana, {postcode}, United States',
+        'address': {
+            'house_number': house_number,
+            'road': road,
+            'city': city,
+            'county': county,
+            'state': 'Indiana',
+            'ISO3166-2-lvl4': 'US-IN',
+            'postcode': postcode,
+            'country': 'United States',
+            'country_code': 'us',
+        },
+        'boundingbox': [f'{latitude - 0.0001:.7f}', f'{latitude + 0.0001:.7f}',
+                        f'{longitude - 0.0001:.7f}', f'{longitude + 0.0001:.7f}'],
+    }
+
+
+def postcode_result(rng, postcode, state, county, city, latitude, longitude):
+    return {
+        'place_id': rng.randint(10 ** 6, 10 ** 9),
+        'licence': LICENCE,
+        'lat': f'{latitude + rng.uniform(-0.05, 0.05):.7f}',
+        'lon': f'{longitude + rng.uniform(-0.05, 0.05):.7f}',
+        'class': 'place',
+        'type': 'postcode',
+        'place_rank': 21,
+        'importance': 0.12000999999999997,
+        'addresstype': 'postcode',
+        'name': postcode,
+        'display_name': f'{city}, {county}, {state}, {postcode}, United States',
+        'address': {
+            'city': city,
+            'county': county,
+            'state': state,
+            'postcode': postcode,
+            'country': 'United States',
+            'country_code': 'us',
+        },
+        'boundingbox': [f'{latitude - 0.05:.7f}', f'{latitude + 0.05:.7f}',
+                        f'{longitude - 0.05:.7f}', f'{longitude + 0.05:.7f}'],
+    }
+
+
+def search(params):
+    """Builds the answer for the search parameters."""
+    postcode = params.get('postalcode')
+    query = params.get('q') or postcode or ''
+    rng = query_random(query)
+    if rng.random() < EMPTY_RATE:
+        counters['empty'] += 1
+        return []
+    if not postcode:
+        return [address_result(rng, query)]
+
+    city, county, _, latitude, longitude = rng.choice(CITIES)
+    results = [postcode_result(rng, postcode, 'Indiana', county, city, latitude, longitude)]
+    for place in rng.sample(OTHER_PLACES, rng.randint(0, 2)):
+        results.insert(rng.randint(0, len(results)), postcode_result(rng, postcode, *place))
+    return results
+
+
+async def send_json(send, status, body, headers=()):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json; charset=utf-8'), *headers],
+    })
+    await send({'type': 'http.response.body', 'body': json.dumps(body).encode('utf-8')})
+
+
+async def app(scope, receive, send):
+    """The ASGI application."""
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    if scope['type'] != 'http':
+        return
+
+    if scope['path'] == '/stats':
+        await send_json(send, 200, counters)
+        return
+    if scope['path'] != '/search':
+        await send_json(send, 404, {'error': 'Only /search and /stats are available'})
+        return
+
+    params = {key: values[0] for key, values in parse_qs(scope['query_string'].decode('latin-1')).items()}
+    counters['search'] += 1
+    await asyncio.sleep(max(0.0, LATENCY_MS + random.uniform(-JITTER_MS, JITTER_MS)) / 1000)
+
+    roll = random.random()
+    if roll < ERROR_RATE:
+        counters['errors'] += 1
+        await send_json(send, 503, {'error': 'Service temporarily unavailable'})
+    elif roll < ERROR_RATE + THROTTLE_RATE:
+        counters['throttled'] += 1
+        await send_json(send, 429, {'error': 'Too many requests'}, [(b'retry-after', b'1')])
+    else:
+        await send_json(send, 200, search(params))
+
+
+def main():
+    global LATENCY_MS, JITTER_MS, ERROR_RATE, THROTTLE_RATE, EMPTY_RATE
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description='Run a fake Nominatim search server.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency-ms', type=float, default=LATENCY_MS)
+    parser.add_argument('--jitter-ms', type=float, default=JITTER_MS)
+    parser.add_argument('--error-rate', type=float, default=ERROR_RATE, help='Share of requests answered with a 503')
+    parser.add_argument('--throttle-rate', type=float, default=THROTTLE_RATE,
+                        help='Share of requests answered with a 429')
+    parser.add_argument('--empty-rate', type=float, default=EMPTY_RATE, help='Share of queries with no results')
+    parser.add_argument('--seed', type=int, help='Seed for latency and errors, for repeatable runs')
+    args = parser.parse_args()
+
+    LATENCY_MS, JITTER_MS = args.latency_ms, args.jitter_ms
+    ERROR_RATE, THROTTLE_RATE, EMPTY_RATE = args.error_rate, args.throttle_rate, args.empty_rate
+    if args.seed is not None:
+        random.seed(args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level='warning')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_PATH = os.getenv('GEOCODE_CACHE_PATH', 'cache/geocode_cache.sqlite')
+DEFAULT_TTL = int(os.getenv('GEOCODE_CACHE_TTL', 30 * 24 * 3600))
+DEFAULT_NEGATIVE_TTL = int(os.getenv('GEOCODE_CACHE_NEGATIVE_TTL', 24 * 3600))
+DEFAULT_MEMORY_SIZE = int(os.getenv('GEOCODE_CACHE_MEMORY_SIZE', 2048))
+DEFAULT_DISK_SIZE = int(os.getenv('GEOCODE_CACHE_DISK_SIZE', 200000))
+
+
+def cache_key(address=None, zip=None):
+    """Builds the normalized cache key for a geocode query."""
+    parts = []
+    if zip:
+        parts.append('zip=' + ' '.join(zip.split()).lower())
+    if address:
+        parts.append('address=' + ' '.join(address.split()).lower())
+    return '|'.join(parts)
+
+
+class GeocodeCache:
+    """Two-tier cache for geocoder responses.
+
+    The first tier is an in-process LRU, the second a SQLite file that survives restarts
+    and is shared between worker processes. Both tiers expire entries after a TTL.
+    Empty results are cached too, with their own shorter TTL, so repeated lookups of
+    addresses that don't exist don't go upstream every time.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, ttl=DEFAULT_TTL, negative_ttl=DEFAULT_NEGATIVE_TTL,
+                 memory_size=DEFAULT_MEMORY_SIZE, disk_size=DEFAULT_DISK_SIZE):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.writes = 0
+        self.counters = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'negative_hits': 0,
+            'misses': 0,
+            'stores': 0,
+        }
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.connection().execute(
+                'CREATE TABLE IF NOT EXISTS geocode_cache '
+                '(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)'
+            )
+
+    def connection(self):
+        """Returns this thread's SQLite connection, reopening it after a fork."""
+        local = self.local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            local.connection.execute('PRAGMA journal_mode=WAL')
+            local.connection.execute('PRAGMA synchronous=NORMAL')
+            local.pid = os.getpid()
+        return local.connection
+
+    def get(self, key, count=True):
+        """Returns (found, value). A found value that is empty is a cached negative result.
+
+        Pass count=False for internal re-checks that shouldn't show up in the hit/miss counters.
+        """
+        now = time.time()
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires > now:
+                    self.memory.move_to_end(key)
+                    if count:
+                        self.count_hit('memory_hits', value)
+                    return True, value
+                del self.memory[key]
+
+        if self.path:
+            row = self.connection().execute(
+                'SELECT value, expires FROM geocode_cache WHERE key = ?', (key,)
+            ).fetchone()
+            if row is not None and row[1] > now:
+                value = json.loads(row[0])
+                with self.lock:
+                    self.remember(key, value, row[1])
+                    if count:
+                        self.count_hit('disk_hits', value)
+                return True, value
+
+        if count:
+            with self.lock:
+                self.counters['misses'] += 1
+        return False, None
+
+    def set(self, key, value):
+        """Stores a response. Falsy values (no results) are stored with the negative TTL."""
+        ttl = self.ttl if value else self.negative_ttl
+        expires = time.time() + ttl
+        with self.lock:
+            self.remember(key, value, expires)
+            self.counters['stores'] += 1
+            self.writes += 1
+            prune = self.writes % 1000 == 0
+
+        if self.path:
+            connection = self.connection()
+            connection.execute(
+                'INSERT OR REPLACE INTO geocode_cache (key, value, expires) VALUES (?, ?, ?)',
+                (key, json.dumps(value), expires)
+            )
+            if prune:
+                self.prune(connection)
+
+    def prune(self, connection=None):
+        """Deletes expired rows and, past disk_size, the rows closest to expiring."""
+        connection = connection or self.connection()
+        connection.execute('DELETE FROM geocode_cache WHERE expires <= ?', (time.time(),))
+        connection.execute(
+            'DELETE FROM geocode_cache WHERE key IN '
+            '(SELECT key FROM geocode_cache ORDER BY expires DESC LIMIT -1 OFFSET ?)',
+            (self.disk_size,)
+        )
+
+    def remember(self, key, value, expires):
+        # Caller holds self.lock.
+        self.memory[key] = (value, expires)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_size:
+            self.memory.popitem(last=False)
+
+    def count_hit(self, counter, value):
+        # Caller holds self.lock.
+        self.counters[counter] += 1
+        if not value:
+            self.counters['negative_hits'] += 1
+
+    def stats(self):
+        """Returns a copy of the hit/miss counters plus the current LRU size."""
+        with self.lock:
+            stats = dict(self.counters)
+            stats['memory_entries'] = len(self.memory)
+        return stats
+
+
+def read_queries(file_path):
+    """Reads warm-up queries, one per line. Lines starting with 'zip:' are postal codes."""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.lower().startswith('zip:'):
+                yield None, line[4:].strip()
+            else:
+                yield line, None
+
+
+def warm(file_path):
+    """Looks up every query in the file through the geocoder so the cache is populated.
+
+    The geocoder client rate-limits itself, so this goes no faster than Nominatim allows.
+    """
+    import geocoder
+
+    failed = 0
+    for address, zip in read_queries(file_path):
+        try:
+            geocoder.search(address=address, zip=zip)
+        except geocoder.GeocoderUnavailable as e:
+            print(f"Could not look up {address or zip}: {e}")
+            failed += 1
+    print(f"{failed} queries failed")
+    print(json.dumps(geocoder.cache.stats()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Manage the geocode cache.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    warm_parser = subparsers.add_parser('warm', help='Populate the cache from a file of queries')
+    warm_parser.add_argument('file', help="One address per line, or 'zip:<code>'")
+
+    subparsers.add_parser('prune', help='Remove expired and excess entries')
+    subparsers.add_parser('stats', help='Show how many entries are on disk')
+
+    args = parser.parse_args()
+    if args.command == 'warm':
+        warm(args.file)
+    elif args.command == 'prune':
+        GeocodeCache().prune()
+    elif args.command == 'stats':
+        connection = GeocodeCache().connection()
+        total, live = connection.execute(
+            'SELECT COUNT(*), SUM(expires > ?) FROM geocode_cache', (time.time(),)
+        ).fetchone()
+        print(f"{total} entries on disk, {live or 0} not expired")
+
+
+if __name__ == '__main__':
+    main()
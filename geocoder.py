@@ -0,0 +1,218 @@
+import logging
+import multiprocessing
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from geocode_cache import GeocodeCache, cache_key
+from instrumentation import stage
+
+logger = logging.getLogger(__name__)
+
+# Point this at a local stub server to run without reaching the real Nominatim
+NOMINATIM_URL = os.getenv('NOMINATIM_URL', 'https://nominatim.openstreetmap.org/search')
+
+CONNECT_TIMEOUT = float(os.getenv('NOMINATIM_CONNECT_TIMEOUT', 3))
+READ_TIMEOUT = float(os.getenv('NOMINATIM_READ_TIMEOUT', 10))
+# Nominatim's usage policy allows about one request per second
+RATE_PER_SECOND = float(os.getenv('NOMINATIM_RATE', 1))
+BURST = int(os.getenv('NOMINATIM_BURST', 1))
+# Give up instead of queueing a request behind the limiter for longer than this
+MAX_QUEUE_WAIT = float(os.getenv('NOMINATIM_MAX_QUEUE_WAIT', 10))
+MAX_RETRIES = int(os.getenv('NOMINATIM_MAX_RETRIES', 2))
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+HEADERS = {
+    "User-Agent": "Indiana Resource Lookup"
+}
+
+
+class GeocoderUnavailable(Exception):
+    """Raised when the upstream geocoder can't be reached or keeps failing."""
+
+
+def backoff(attempt, response=None):
+    """Seconds to wait before retrying, honouring Retry-After when the server sends one."""
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    if retry_after and retry_after.isdigit():
+        return min(float(retry_after), 30)
+    return min(0.5 * 2 ** attempt, 8) * random.uniform(0.5, 1.5)
+
+
+class TokenBucket:
+    """Token bucket rate limiter, shared by threads and by processes forked after it's created.
+
+    The token count lives in shared memory, so the gunicorn workers forked from the preloaded
+    app all draw from one bucket instead of each getting the full rate.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        # [tokens, time of the last update]; time.monotonic is the same clock in every process
+        self.state = multiprocessing.Array('d', [capacity, time.monotonic()])
+
+    def reserve(self, max_wait=None):
+        """Reserves one token and returns how many seconds to wait before using it.
+
+        Returns None without reserving anything if the wait would be longer than max_wait.
+        Tokens are reserved up front, so waiting callers are served in the order they arrived.
+        """
+        with self.state.get_lock():
+            now = time.monotonic()
+            tokens = min(self.capacity, self.state[0] + (now - self.state[1]) * self.rate)
+            wait = 0 if tokens >= 1 else (1 - tokens) / self.rate
+            if max_wait is not None and wait > max_wait:
+                return None
+            self.state[0] = tokens - 1
+            self.state[1] = now
+        return wait
+
+    def acquire(self, max_wait=None):
+        """Takes one token, sleeping until one is available. Returns False if it would wait past max_wait."""
+        wait = self.reserve(max_wait)
+        if wait is None:
+            return False
+        if wait:
+            time.sleep(wait)
+        return True
+
+
+class SingleFlight:
+    """Makes concurrent calls with the same key share one execution of the function."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, function):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = {'done': threading.Event(), 'result': None, 'error': None}
+
+        if not leader:
+            call['done'].wait()
+            if call['error'] is not None:
+                raise call['error']
+            return call['result']
+
+        try:
+            call['result'] = function()
+            return call['result']
+        except Exception as e:
+            call['error'] = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call['done'].set()
+
+
+class NominatimClient:
+    """Nominatim search client with a connection pool, timeouts, rate limiting and retries."""
+
+    def __init__(self, url=NOMINATIM_URL, rate=RATE_PER_SECOND, burst=BURST, max_retries=MAX_RETRIES,
+                 timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), max_queue_wait=MAX_QUEUE_WAIT):
+        self.url = url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_queue_wait = max_queue_wait
+        self.limiter = TokenBucket(rate, burst)
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=16)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.counters = {'requests': 0, 'retries': 0, 'failures': 0, 'throttled': 0}
+        self.counters_lock = threading.Lock()
+
+    def count(self, name):
+        # gthread workers call search from several threads
+        with self.counters_lock:
+            self.counters[name] += 1
+
+    def search(self, params):
+        """Returns the decoded JSON results. Raises GeocoderUnavailable when it can't get an answer."""
+        for attempt in range(self.max_retries + 1):
+            if not self.limiter.acquire(self.max_queue_wait):
+                self.count('throttled')
+                raise GeocoderUnavailable("Too many geocoding requests queued, try again shortly")
+
+            self.count('requests')
+            response = None
+            try:
+                response = self.session.get(self.url, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                logger.warning("Nominatim request failed: %s", e)
+            else:
+                if response.status_code == 200:
+                    try:
+                        return response.json()
+                    except ValueError:
+                        # e.g. an HTML error page from a proxy in front of Nominatim
+                        logger.warning("Nominatim returned a 200 that isn't JSON")
+                elif response.status_code not in RETRY_STATUSES:
+                    self.count('failures')
+                    raise GeocoderUnavailable(f"Nominatim returned {response.status_code}")
+                else:
+                    logger.warning("Nominatim returned %s", response.status_code)
+
+            if attempt < self.max_retries:
+                self.count('retries')
+                time.sleep(backoff(attempt, response))
+
+        self.count('failures')
+        raise GeocoderUnavailable("Nominatim did not answer after retrying")
+
+
+cache = GeocodeCache()
+client = NominatimClient()
+single_flight = SingleFlight()
+
+
+def build_params(address=None, zip=None):
+    """Builds the Nominatim search parameters for an address or zip code query."""
+    params = {
+        "format": "json",
+        "addressdetails": 1
+    }
+    if zip:
+        params['postalcode'] = ' '.join(zip.split())
+    if address:
+        params['q'] = ' '.join(address.split())
+        params['limit'] = 1
+    return params
+
+
+def search(address=None, zip=None):
+    """Searches Nominatim for an address or zip code, going through the geocode cache.
+
+    Returns the list of results, or an empty list when nothing was found. Concurrent
+    searches for the same query share one upstream call. Raises GeocoderUnavailable
+    when Nominatim can't be reached; failures are not cached.
+    """
+    key = cache_key(address=address, zip=zip)
+    if not key:
+        return []
+    with stage('geocode_cache'):
+        found, data = cache.get(key)
+    if found:
+        return data
+
+    def fetch():
+        # Another request may have filled the cache while this one waited for the lock
+        found, data = cache.get(key, count=False)
+        if found:
+            return data
+        data = client.search(build_params(address, zip))
+        cache.set(key, data)
+        return data
+
+    with stage('nominatim'):
+        return single_flight.do(key, fetch)
@@ -0,0 +1,35 @@
+# Production settings for serving the app with gunicorn:
+#
+#     gunicorn -c gunicorn.conf.py app:app
+#
+# The app (townships, indexes, trustee and food pantry data) is loaded once in the
+# master process before the workers are forked, so every worker shares those pages
+# copy-on-write instead of loading its own copy.
+import gc
+import multiprocessing
+import os
+
+bind = os.getenv('BIND', '0.0.0.0:5000')
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+threads = int(os.getenv('THREADS', 2))
+worker_class = 'gthread'
+
+preload_app = True
+
+# Recycle workers gracefully so a slow leak can't grow forever. The jitter keeps
+# them from all restarting at once.
+max_requests = int(os.getenv('MAX_REQUESTS', 5000))
+max_requests_jitter = int(os.getenv('MAX_REQUESTS_JITTER', 500))
+graceful_timeout = 30
+timeout = 60
+keepalive = 5
+
+# The app writes its own JSON access log (see instrumentation.py); set GUNICORN_ACCESS_LOG=- to get gunicorn's as well
+accesslog = os.getenv('GUNICORN_ACCESS_LOG')
+
+
+def when_ready(server):
+    # Everything allocated while loading the app moves to the permanent generation, so
+    # the garbage collector in the workers never touches (and copies) those pages.
+    gc.freeze()
+    server.log.info("Data loaded in the master, %d objects frozen before forking workers", gc.get_freeze_count())
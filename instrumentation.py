@@ -0,0 +1,208 @@
+"""Request timing, Prometheus metrics and JSON access logs, shared by app.py and async_app.py.
+
+Code marks the parts of a request worth timing with `with stage('township'):`. The app
+starts a RequestTimer for each request, and at the end the stage times go into:
+
+- a Server-Timing response header, which shows up in the browser's network panel
+- the stage_duration_seconds histogram, next to request_duration_seconds per route
+- one JSON access log line on the 'access' logger
+
+GET /metrics returns the histograms and the Nominatim and geocode cache counters in the
+Prometheus text format. The metrics are kept per process, so with several gunicorn workers
+each scrape sees the worker that answered it.
+
+stage() is a no-op outside a request (scripts, benchmarks) or with METRICS=0. Otherwise a
+stage costs two perf_counter() calls and a list append, and a request one histogram update
+per stage.
+"""
+import bisect
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+
+ENABLED = os.getenv('METRICS', '1').lower() not in ('0', 'false', 'no')
+ACCESS_LOG = os.getenv('ACCESS_LOG', '1').lower() not in ('0', 'false', 'no')
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds. Requests that go to Nominatim take a second or more, local lookups well under a millisecond
+REQUEST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STAGE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# One JSON object per line, without the level and logger name prefix the root handler adds
+access_logger = logging.getLogger('access')
+if not access_logger.handlers:
+    access_handler = logging.StreamHandler()
+    access_handler.setFormatter(logging.Formatter('%(message)s'))
+    access_logger.addHandler(access_handler)
+    access_logger.setLevel(logging.INFO)
+    access_logger.propagate = False
+
+current_timer = contextvars.ContextVar('request_timer', default=None)
+
+
+def label_text(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+class Histogram:
+    """A Prometheus histogram with one set of buckets per combination of label values."""
+
+    def __init__(self, name, help, labels=(), buckets=REQUEST_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        self.observe_many(((value, label_values),))
+
+    def observe_many(self, observations):
+        """Records (value, label values) pairs under one lock."""
+        with self.lock:
+            for value, label_values in observations:
+                series = self.series.get(label_values)
+                if series is None:
+                    series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+                series[0][bisect.bisect_left(self.buckets, value)] += 1
+                series[1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            series = [(values, list(counts), total) for values, (counts, total) in sorted(self.series.items())]
+        for values, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{self.name}_bucket{label_text(self.labels + ("le",), values + (le,))} {cumulative}')
+            lines.append(f'{self.name}_sum{label_text(self.labels, values)} {total}')
+            lines.append(f'{self.name}_count{label_text(self.labels, values)} {cumulative}')
+        return lines
+
+
+class CounterSet:
+    """Counters read from a dict at scrape time, e.g. NominatimClient.counters."""
+
+    def __init__(self, name, help, label, read):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.read = read
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for key, value in sorted(self.read().items()):
+            lines.append(f'{self.name}{label_text((self.label,), (key,))} {value}')
+        return lines
+
+
+request_duration = Histogram('request_duration_seconds', 'Time to handle a request.',
+                             ('method', 'route', 'status'))
+stage_duration = Histogram('stage_duration_seconds', 'Time spent in each stage of a request.',
+                           ('stage',), STAGE_BUCKETS)
+metrics = [request_duration, stage_duration]
+
+
+def register_counters(name, help, label, read):
+    """Adds a set of counters to /metrics. read() returns a dict of label value to count."""
+    metrics.append(CounterSet(name, help, label, read))
+
+
+def render():
+    """Returns every metric in the Prometheus text format."""
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+class RequestTimer:
+    """Start time and stage durations of one request."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = []
+
+    def server_timing(self, total):
+        """Server-Timing header value, durations in milliseconds."""
+        entries = [f'{name};dur={seconds * 1000:.2f}' for name, seconds in self.stages]
+        entries.append(f'total;dur={total * 1000:.2f}')
+        return ', '.join(entries)
+
+
+class Stage:
+    """Context manager that adds its duration to a RequestTimer."""
+
+    __slots__ = ('timer', 'name', 'start')
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.timer.stages.append((self.name, time.perf_counter() - self.start))
+
+
+NO_STAGE = contextlib.nullcontext()
+
+
+def stage(name):
+    """Context manager that times a stage of the current request; does nothing outside one."""
+    timer = current_timer.get()
+    if timer is None:
+        return NO_STAGE
+    return Stage(timer, name)
+
+
+def start_request():
+    """Starts timing a request. Returns a token for finish_request, or None when disabled."""
+    if not ENABLED:
+        return None
+    return current_timer.set(RequestTimer())
+
+
+def finish_request(token, method, route, path, status, headers, remote=None, size=None):
+    """Records the request's metrics, adds the Server-Timing header and writes the access log line."""
+    if token is None:
+        return
+    timer = current_timer.get()
+    current_timer.reset(token)
+    total = time.perf_counter() - timer.start
+
+    request_duration.observe(total, method, route, str(status))
+    if timer.stages:
+        stage_duration.observe_many((seconds, (name,)) for name, seconds in timer.stages)
+    headers['Server-Timing'] = timer.server_timing(total)
+
+    if ACCESS_LOG and access_logger.isEnabledFor(logging.INFO):
+        stages = {}
+        for name, seconds in timer.stages:
+            stages[name] = stages.get(name, 0) + seconds
+        access_logger.info(json.dumps({
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'method': method,
+            'path': path,
+            'route': route,
+            'status': status,
+            'duration_ms': round(total * 1000, 3),
+            'stages_ms': {name: round(seconds * 1000, 3) for name, seconds in stages.items()},
+            'bytes': size,
+            'remote': remote,
+        }))
@@ -0,0 +1,355 @@
+"""Load tests for the app: throughput and latency percentiles under a mix of requests.
+
+    python load_test.py run http://localhost:5000 --requests 2000 --concurrency 200
+    python load_test.py matrix --modes sync async --workers 1 2 4 --output cache/load_tests/after.json
+    python load_test.py compare cache/load_tests/before.json cache/load_tests/after.json
+
+`run` drives apps that are already running. `matrix` starts a fake Nominatim
+(fake_nominatim.py) and then each serving mode (gunicorn for app.py, uvicorn for
+async_app.py) at each worker count in turn, runs the same load against each, and writes
+one report. Everything runs on the local machine, with no calls to the real Nominatim.
+
+The request mix is a list of kind=weight pairs:
+
+- geocode: /geocode with a different address each time, so every one goes upstream
+- zip: /geocode?zip= with Indiana postal codes, which repeat and hit the geocode cache
+- reverse: /reverse-geocode at random points in Indiana
+- county: /api/county/<name>, the map's per-county data
+- static: the static data files and script
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import quote
+
+import httpx
+
+DEFAULT_MIX = 'geocode=3,zip=1,reverse=4,county=1,static=1'
+STATIC_PATHS = [
+    '/static/utilities/data/indiana_township_trustees.json',
+    '/static/utilities/data/indiana_food_pantries.json',
+    '/static/script.js',
+]
+COUNTIES_FILE = 'static/utilities/data/counties_bounding_boxes.json'
+RESULTS_PATH = 'cache/load_tests'
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def parse_mix(text):
+    """Parses 'geocode=3,reverse=1' into {'geocode': 3.0, 'reverse': 1.0}."""
+    mix = {}
+    for part in text.split(','):
+        kind, _, weight = part.partition('=')
+        kind = kind.strip()
+        if kind not in ('geocode', 'zip', 'reverse', 'county', 'static'):
+            raise argparse.ArgumentTypeError(f"Unknown request kind {kind!r}")
+        mix[kind] = float(weight or 1)
+    return mix
+
+
+def build_requests(total, mix=None, path=None, seed=0, run_id=None):
+    """Returns (kind, path) for every request of a run, the same for the same arguments and seed.
+
+    run_id goes into every geocode address (and {run} in path). It defaults to one made from
+    the seed; pass a new one so a second run against the same app misses the first run's cache entries.
+    """
+    if run_id is None:
+        run_id = f'seed{seed}'
+    if path:
+        return [('path', path.format(i=i, run=run_id)) for i in range(total)]
+
+    rng = random.Random(seed)
+    counties = []
+    if 'county' in mix:
+        with open(COUNTIES_FILE, 'r') as f:
+            counties = [county['name'] for county in json.load(f)]
+    kinds = rng.choices(list(mix), weights=list(mix.values()), k=total)
+    requests = []
+    for i, kind in enumerate(kinds):
+        if kind == 'geocode':
+            url = f"/geocode?address={quote(f'{rng.randint(1, 9999)} {run_id}-{i} Main St, Bloomington, IN')}"
+        elif kind == 'zip':
+            url = f"/geocode?zip={rng.randint(46001, 47997)}"
+        elif kind == 'reverse':
+            url = f"/reverse-geocode?lat={rng.uniform(37.9, 41.7):.5f}&lon={rng.uniform(-87.5, -84.9):.5f}"
+        elif kind == 'county':
+            url = f"/api/county/{quote(rng.choice(counties))}"
+        else:
+            url = rng.choice(STATIC_PATHS)
+        requests.append((kind, url))
+    return requests
+
+
+def summarize(latencies):
+    if not latencies:
+        return {'requests': 0, 'p50_ms': None, 'p95_ms': None, 'p99_ms': None, 'mean_ms': None}
+    return {
+        'requests': len(latencies),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+        'mean_ms': round(statistics.mean(latencies) * 1000, 1),
+    }
+
+
+async def run(base_url, requests, concurrency):
+    queue = asyncio.Queue()
+    for request in requests:
+        queue.put_nowait(request)
+
+    latencies = []
+    by_kind = {}
+    statuses = {}
+
+    async def worker(client):
+        while True:
+            try:
+                kind, url = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            start = time.perf_counter()
+            try:
+                response = await client.get(url)
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latency = time.perf_counter() - start
+            latencies.append(latency)
+            by_kind.setdefault(kind, []).append(latency)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    result = {
+        'url': base_url,
+        'concurrency': concurrency,
+        'seconds': round(elapsed, 3),
+        'requests_per_second': round(len(requests) / elapsed, 1) if elapsed else 0,
+    }
+    result.update(summarize(latencies))
+    result['statuses'] = statuses
+    result['by_kind'] = {kind: summarize(values) for kind, values in sorted(by_kind.items())}
+    return result
+
+
+def print_result(label, result):
+    print(f"{label}: {result['requests_per_second']} req/s, p50 {result['p50_ms']} ms, "
+          f"p95 {result['p95_ms']} ms, p99 {result['p99_ms']} ms, statuses {result['statuses']}")
+    for kind, summary in result['by_kind'].items():
+        print(f"    {kind:8} {summary['requests']:6} requests, p50 {summary['p50_ms']} ms, "
+              f"p95 {summary['p95_ms']} ms, p99 {summary['p99_ms']} ms")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for(url, timeout):
+    """Polls url until it answers 200. Returns False if it doesn't within timeout seconds."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=2).status_code == 200:
+                return True
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def stop(process):
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def server_command(mode, workers, port, threads):
+    if mode == 'sync':
+        return ([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+                {'WEB_CONCURRENCY': str(workers), 'THREADS': str(threads), 'BIND': f'127.0.0.1:{port}'})
+    return ([sys.executable, '-m', 'uvicorn', 'async_app:app', '--host', '127.0.0.1', '--port', str(port),
+             '--workers', str(workers), '--log-level', 'warning'], {})
+
+
+def matrix(args):
+    """Runs the same load against every serving mode and worker count, with a fake Nominatim upstream."""
+    from benchmarks import environment
+
+    os.makedirs(args.log_dir, exist_ok=True)
+    upstream_port = free_port()
+    upstream_url = f'http://127.0.0.1:{upstream_port}'
+    upstream = subprocess.Popen(
+        [sys.executable, 'fake_nominatim.py', '--port', str(upstream_port), '--latency-ms', str(args.latency_ms),
+         '--jitter-ms', str(args.jitter_ms), '--error-rate', str(args.error_rate), '--seed', str(args.seed)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    results = []
+    try:
+        if not wait_for(f'{upstream_url}/stats', 30):
+            sys.exit("The fake Nominatim didn't start")
+
+        for mode in args.modes:
+            for workers in args.workers:
+                port = free_port()
+                command, extra_env = server_command(mode, workers, port, args.threads)
+                env = dict(os.environ, **extra_env)
+                env.update({
+                    'NOMINATIM_URL': f'{upstream_url}/search',
+                    'NOMINATIM_RATE': str(args.upstream_rate),
+                    'NOMINATIM_BURST': str(max(1, int(args.upstream_rate))),
+                    # A fresh geocode cache per server, so runs don't warm each other up
+                    'GEOCODE_CACHE_PATH': os.path.join(tempfile.mkdtemp(), 'geocode_cache.sqlite'),
+                    'ACCESS_LOG': '1' if args.access_log else '0',
+                })
+                label = f'{mode} x{workers}'
+                log_path = os.path.join(args.log_dir, f'{mode}-{workers}.log')
+                with open(log_path, 'w') as log:
+                    server = subprocess.Popen(command, env=env, stdout=log, stderr=subprocess.STDOUT)
+                try:
+                    base_url = f'http://127.0.0.1:{port}'
+                    if not wait_for(f'{base_url}/ready', args.startup_timeout):
+                        print(f"{label}: didn't become ready, see {log_path}")
+                        continue
+                    if args.warmup:
+                        asyncio.run(run(base_url, build_requests(args.warmup, args.mix, args.path, args.seed + 1,
+                                                                 f'{args.run_id}-warmup' if args.run_id else None),
+                                        args.concurrency))
+                    before = httpx.get(f'{upstream_url}/stats').json()
+                    result = asyncio.run(run(base_url, build_requests(args.requests, args.mix, args.path, args.seed,
+                                                                      args.run_id),
+                                             args.concurrency))
+                    after = httpx.get(f'{upstream_url}/stats').json()
+                finally:
+                    stop(server)
+                result.update({'mode': mode, 'workers': workers,
+                               'upstream_calls': after['search'] - before['search']})
+                print_result(label, result)
+                results.append(result)
+    finally:
+        stop(upstream)
+
+    print(f"\n{'mode':6} {'workers':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'upstream':>9}")
+    for result in results:
+        print(f"{result['mode']:6} {result['workers']:>7} {result['requests_per_second']:>8} {result['p50_ms']:>8} "
+              f"{result['p95_ms']:>8} {result['p99_ms']:>8} {result['upstream_calls']:>9}")
+    return {
+        'environment': environment(),
+        'settings': {key: value for key, value in vars(args).items() if key != 'command'},
+        'results': results,
+    }
+
+
+def compare(before_file, after_file):
+    """Prints throughput and latency changes for the runs found in both reports."""
+    def key(result):
+        return (result['mode'], result['workers']) if 'mode' in result else (result['url'],)
+
+    with open(before_file, 'r') as f:
+        before = {key(result): result for result in json.load(f)['results']}
+    with open(after_file, 'r') as f:
+        after = json.load(f)['results']
+
+    print(f"{'run':24} {'req/s':>17} {'p95 ms':>17} {'p99 ms':>17}")
+    for result in after:
+        old = before.get(key(result))
+        if old is None:
+            continue
+        columns = [f"{old[field]:>7} -> {result[field]:<7}"
+                   for field in ('requests_per_second', 'p95_ms', 'p99_ms')]
+        print(f"{' x'.join(str(part) for part in key(result)):24} {' '.join(columns)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the app.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def add_load_arguments(subparser):
+        subparser.add_argument('--requests', type=int, default=1000)
+        subparser.add_argument('--concurrency', type=int, default=100)
+        subparser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                               help=f"Request kinds and weights (default {DEFAULT_MIX})")
+        subparser.add_argument('--path', help='Send only this path instead of a mix; {i} is the request number, '
+                                              '{run} the run id')
+        subparser.add_argument('--seed', type=int, default=0, help='Seed for the request mix and the fake upstream')
+        subparser.add_argument('--run-id', help='Put into every geocode address, so a new one misses the geocode '
+                                                'cache entries of earlier runs (default: made from --seed)')
+
+    run_parser = subparsers.add_parser('run', help='Load test apps that are already running')
+    run_parser.add_argument('url', nargs='+', help='Base URL of a running app; give several to compare them')
+    add_load_arguments(run_parser)
+    run_parser.add_argument('--output', help='Also write the results as JSON to this file')
+
+    matrix_parser = subparsers.add_parser('matrix', help='Start each serving mode and worker count and load test it')
+    add_load_arguments(matrix_parser)
+    matrix_parser.add_argument('--modes', nargs='+', choices=('sync', 'async'), default=['sync', 'async'])
+    matrix_parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    matrix_parser.add_argument('--threads', type=int, default=2, help='Threads per gunicorn worker')
+    matrix_parser.add_argument('--warmup', type=int, default=50, help='Requests sent before measuring')
+    matrix_parser.add_argument('--latency-ms', type=float, default=200, help='Fake Nominatim latency')
+    matrix_parser.add_argument('--jitter-ms', type=float, default=50)
+    matrix_parser.add_argument('--error-rate', type=float, default=0, help='Share of fake Nominatim 503s')
+    matrix_parser.add_argument('--upstream-rate', type=float, default=1000,
+                               help='NOMINATIM_RATE for the app, the real Nominatim allows 1')
+    matrix_parser.add_argument('--access-log', action='store_true', help='Leave the JSON access log on')
+    matrix_parser.add_argument('--startup-timeout', type=float, default=180)
+    matrix_parser.add_argument('--log-dir', default=os.path.join(RESULTS_PATH, 'logs'))
+    matrix_parser.add_argument('--output', default=os.path.join(RESULTS_PATH, 'report.json'))
+
+    compare_parser = subparsers.add_parser('compare', help='Compare two reports')
+    compare_parser.add_argument('before')
+    compare_parser.add_argument('after')
+
+    args = parser.parse_args()
+    if args.command == 'compare':
+        compare(args.before, args.after)
+        return
+
+    if args.command == 'run':
+        results = []
+        run_id = args.run_id or f'seed{args.seed}'
+        for index, url in enumerate(args.url):
+            # The apps may share a geocode cache, so each URL gets addresses of its own
+            url_run_id = f'{run_id}-{index}' if len(args.url) > 1 else run_id
+            result = asyncio.run(run(url, build_requests(args.requests, args.mix, args.path, args.seed, url_run_id),
+                                     args.concurrency))
+            print_result(url, result)
+            results.append(result)
+        report = {'results': results}
+    else:
+        report = matrix(args)
+
+    if args.output:
+        directory = os.path.dirname(args.output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved the report to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
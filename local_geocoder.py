@@ -0,0 +1,284 @@
+"""Offline address geocoder built from the OSM address extract made by utilities/converter_script.py.
+
+The index is a directory of .npy arrays that are memory-mapped at startup:
+
+- keys.npy: sorted, fixed-width lookup keys ('<street>|zip:<postcode>' and '<street>|city:<city>')
+- offsets.npy: for key i, its addresses are rows offsets[i]:offsets[i + 1] of the arrays below
+- numbers.npy, latitudes.npy, longitudes.npy: house numbers (sorted within each key) and coordinates
+
+Build it with:
+
+    python local_geocoder.py build utilities/data/indiana_addresses.ndjson cache/address_index
+"""
+import argparse
+import csv
+import json
+import os
+import re
+from collections import defaultdict
+
+import numpy as np
+
+INDEX_VERSION = 1
+DEFAULT_PATH = os.getenv('LOCAL_GEOCODER_PATH', 'cache/address_index')
+
+# Common USPS abbreviations, so '325 East Winslow Road' and '325 E Winslow Rd' share a key
+ABBREVIATIONS = {
+    'north': 'n', 'south': 's', 'east': 'e', 'west': 'w',
+    'northeast': 'ne', 'northwest': 'nw', 'southeast': 'se', 'southwest': 'sw',
+    'street': 'st', 'avenue': 'ave', 'road': 'rd', 'drive': 'dr', 'lane': 'ln',
+    'court': 'ct', 'place': 'pl', 'boulevard': 'blvd', 'parkway': 'pkwy',
+    'highway': 'hwy', 'circle': 'cir', 'terrace': 'ter', 'trail': 'trl',
+    'square': 'sq',
+}
+
+HOUSE_NUMBER = re.compile(r'\d+')
+ZIP_CODE = re.compile(r'\b(\d{5})(?:-\d{4})?\b')
+STATES = {'in', 'indiana'}
+
+# How far past either end of a street's known house numbers a lookup may still snap to the end
+MAX_NUMBER_GAP = 100
+
+
+def normalize_street(street):
+    """Lowercases, strips punctuation and abbreviates a street name."""
+    words = re.sub(r'[^\w\s]', ' ', street.lower()).split()
+    return ' '.join(ABBREVIATIONS.get(word, word) for word in words)
+
+
+def normalize_place(value):
+    return ' '.join(re.sub(r'[^\w\s]', ' ', value.lower()).split())
+
+
+def parse_house_number(value):
+    """Returns the leading integer of a house number ('123A' -> 123), or None."""
+    match = HOUSE_NUMBER.search(value or '')
+    return int(match.group()) if match else None
+
+
+def street_keys(street, city=None, postcode=None):
+    """Returns the index keys for a street, most specific first.
+
+    There is no statewide key: Main Street runs through hundreds of towns, and interpolating
+    between two of them gives a confident answer in the wrong place. An address without a
+    city or ZIP code has no key and is left to Nominatim.
+    """
+    street = normalize_street(street)
+    keys = []
+    if postcode:
+        keys.append(f"{street}|zip:{postcode[:5]}")
+    if city:
+        keys.append(f"{street}|city:{normalize_place(city)}")
+    return keys
+
+
+def interpolate_number(numbers, latitudes, longitudes, housenumber):
+    """Returns (latitude, longitude, match) for a house number from one street's sorted numbers, or None.
+
+    match is 'exact' when the number is in the index, 'interpolated' when it falls
+    between two known numbers and 'nearest' when it's just past either end of the street.
+    Numbers more than MAX_NUMBER_GAP past either end are not on the known part of the street.
+    """
+    i = int(np.searchsorted(numbers, housenumber))
+    if i < len(numbers) and numbers[i] == housenumber:
+        return float(latitudes[i]), float(longitudes[i]), 'exact'
+    if i == 0 or i == len(numbers):
+        nearest = min(i, len(numbers) - 1)
+        if abs(int(numbers[nearest]) - housenumber) > MAX_NUMBER_GAP:
+            return None
+        return float(latitudes[nearest]), float(longitudes[nearest]), 'nearest'
+    fraction = (housenumber - numbers[i - 1]) / (numbers[i] - numbers[i - 1])
+    latitude = latitudes[i - 1] + fraction * (latitudes[i] - latitudes[i - 1])
+    longitude = longitudes[i - 1] + fraction * (longitudes[i] - longitudes[i - 1])
+    return float(latitude), float(longitude), 'interpolated'
+
+
+def parse_address(address):
+    """Splits 'number street, city, state zip' into its parts.
+
+    Returns None when the address has no house number or no comma after the street,
+    since the street can't be told apart from the city then.
+    """
+    parts = [part.strip() for part in address.split(',')]
+    if len(parts) < 2:
+        return None
+    match = re.match(r'(\d+)\S*\s+(.+)', parts[0])
+    if not match:
+        return None
+
+    rest = ' '.join(parts[1:])
+    zip_match = ZIP_CODE.search(rest)
+    postcode = zip_match.group(1) if zip_match else None
+
+    city = None
+    state = None
+    for part in parts[1:]:
+        part = ZIP_CODE.sub('', part).strip()
+        if not part:
+            continue
+        if normalize_place(part) in STATES:
+            state = 'IN'
+        elif city is None:
+            # 'Bloomington IN' with no comma before the state
+            words = part.split()
+            if len(words) > 1 and words[-1].lower() in STATES:
+                state = 'IN'
+                part = ' '.join(words[:-1])
+            city = part
+        elif len(part) == 2:
+            state = part.upper()
+
+    return {
+        'housenumber': int(match.group(1)),
+        'street': match.group(2),
+        'city': city,
+        'state': state,
+        'postcode': postcode,
+    }
+
+
+def read_extract(file_path):
+    """Yields address records from the converter's JSON list, NDJSON or CSV output."""
+    with open(file_path, 'r', encoding='utf-8', newline='') as f:
+        if file_path.endswith('.csv'):
+            for record in csv.DictReader(f):
+                if record['latitude'] and record['longitude']:
+                    record['latitude'] = float(record['latitude'])
+                    record['longitude'] = float(record['longitude'])
+                else:
+                    record['latitude'] = record['longitude'] = None
+                yield record
+        elif file_path.endswith('.ndjson') or file_path.endswith('.jsonl'):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from json.load(f)
+
+
+def build_index(extract_file, index_dir):
+    """Builds the memory-mappable address index from an OSM address extract."""
+    grouped = defaultdict(list)
+    skipped = 0
+    for record in read_extract(extract_file):
+        number = parse_house_number(record.get('housenumber'))
+        latitude = record.get('latitude')
+        longitude = record.get('longitude')
+        if number is None or latitude is None or longitude is None or not record.get('street'):
+            # Ways from the old extract only carry node refs, not coordinates.
+            skipped += 1
+            continue
+        for key in street_keys(record['street'], record.get('city'), record.get('postcode')):
+            grouped[key].append((number, latitude, longitude))
+
+    keys = np.array([key.encode('utf-8') for key in grouped], dtype=bytes)
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    key_list = list(grouped)
+
+    offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+    numbers = []
+    latitudes = []
+    longitudes = []
+    for position, key_index in enumerate(order):
+        rows = sorted(grouped[key_list[key_index]])
+        numbers.extend(row[0] for row in rows)
+        latitudes.extend(row[1] for row in rows)
+        longitudes.extend(row[2] for row in rows)
+        offsets[position + 1] = len(numbers)
+
+    os.makedirs(index_dir, exist_ok=True)
+    np.save(os.path.join(index_dir, 'keys.npy'), keys)
+    np.save(os.path.join(index_dir, 'offsets.npy'), offsets)
+    np.save(os.path.join(index_dir, 'numbers.npy'), np.array(numbers, dtype=np.int32))
+    np.save(os.path.join(index_dir, 'latitudes.npy'), np.array(latitudes, dtype=np.float64))
+    np.save(os.path.join(index_dir, 'longitudes.npy'), np.array(longitudes, dtype=np.float64))
+    with open(os.path.join(index_dir, 'meta.json'), 'w') as f:
+        json.dump({'version': INDEX_VERSION, 'keys': len(keys), 'addresses': len(numbers)}, f)
+
+    print(f"Indexed {len(keys)} street keys, skipped {skipped} records without a number or coordinates")
+
+
+class LocalGeocoder:
+    """Looks up addresses in the memory-mapped index. Nothing is read until it's needed."""
+
+    def __init__(self, index_dir=DEFAULT_PATH):
+        with open(os.path.join(index_dir, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+        if meta.get('version') != INDEX_VERSION:
+            raise ValueError(f"Address index version {meta.get('version')} is not supported, rebuild it")
+        self.keys = np.load(os.path.join(index_dir, 'keys.npy'), mmap_mode='r')
+        self.offsets = np.load(os.path.join(index_dir, 'offsets.npy'), mmap_mode='r')
+        self.numbers = np.load(os.path.join(index_dir, 'numbers.npy'), mmap_mode='r')
+        self.latitudes = np.load(os.path.join(index_dir, 'latitudes.npy'), mmap_mode='r')
+        self.longitudes = np.load(os.path.join(index_dir, 'longitudes.npy'), mmap_mode='r')
+
+    @classmethod
+    def open(cls, index_dir=DEFAULT_PATH):
+        """Returns a LocalGeocoder, or None if no index has been built."""
+        if not os.path.exists(os.path.join(index_dir, 'meta.json')):
+            return None
+        return cls(index_dir)
+
+    def find_key(self, key):
+        key = key.encode('utf-8')
+        if len(key) > self.keys.dtype.itemsize:
+            return None
+        position = int(np.searchsorted(self.keys, key))
+        if position < len(self.keys) and self.keys[position] == key:
+            return position
+        return None
+
+    def lookup(self, housenumber, street, city=None, postcode=None):
+        """Returns (latitude, longitude, match) for a house number on a street, or None.
+
+        See interpolate_number for what match means.
+        """
+        for key in street_keys(street, city, postcode):
+            position = self.find_key(key)
+            if position is None:
+                continue
+            start, end = int(self.offsets[position]), int(self.offsets[position + 1])
+            result = interpolate_number(self.numbers[start:end], self.latitudes[start:end],
+                                        self.longitudes[start:end], housenumber)
+            if result is not None:
+                return result
+        return None
+
+    def geocode(self, address):
+        """Geocodes a free-form 'number street, city, IN zip' address. Returns (lat, lon) or None."""
+        parsed = parse_address(address)
+        if not parsed or (parsed['state'] and parsed['state'] != 'IN'):
+            return None
+        result = self.lookup(parsed['housenumber'], parsed['street'], parsed['city'], parsed['postcode'])
+        if result is None:
+            return None
+        return result[0], result[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or query the offline address index.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help='Build the index from an OSM address extract')
+    build_parser.add_argument('extract', help='JSON, NDJSON or CSV output of utilities/converter_script.py')
+    build_parser.add_argument('index_dir', nargs='?', default=DEFAULT_PATH)
+
+    query_parser = subparsers.add_parser('query', help='Geocode one address against the index')
+    query_parser.add_argument('address')
+    query_parser.add_argument('--index-dir', default=DEFAULT_PATH)
+
+    args = parser.parse_args()
+    if args.command == 'build':
+        build_index(args.extract, args.index_dir)
+    else:
+        local_geocoder = LocalGeocoder(args.index_dir)
+        parsed = parse_address(args.address)
+        if not parsed:
+            print("Could not parse address. Use 'Number Street, City, IN Zipcode'.")
+            return
+        print(local_geocoder.lookup(parsed['housenumber'], parsed['street'], parsed['city'], parsed['postcode']))
+
+
+if __name__ == '__main__':
+    main()
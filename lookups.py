@@ -0,0 +1,187 @@
+"""Request handling shared by the Flask app (app.py) and the asyncio app (async_app.py).
+
+Each function returns (body, status) so either framework can turn it into a JSON response.
+"""
+import math
+import os
+
+from instrumentation import stage
+from nearest import RESOURCE_TYPES, sort_by_distance
+
+
+def pick_location(data, zip=None):
+    """Picks (lat, lon) out of Nominatim search results, or None when there are none."""
+    if not data:
+        return None
+
+    if zip:
+        # if a zip code is provided, loop through each result and find the one with a state of Indiana
+        for item in data:
+            if 'state' in item['address'] and item['address']['state'].lower() == 'indiana':
+                location = item
+                break
+        else:
+            # if no location with Indiana state is found, return the first result
+            location = data[0]
+    else:
+        # if we are using an address, just take the first result
+        location = data[0]
+    return float(location['lat']), float(location['lon'])
+
+
+def geocode_result(resolver, store, coordinates):
+    """Builds the /geocode response for coordinates found by a geocoder."""
+    if coordinates is None:
+        return {"error": "Nothing found for the provided address or zip code"}, 200
+    latitude, longitude = coordinates
+
+    with stage('township'):
+        county, township = resolver.resolve(latitude, longitude)
+    if county and township:
+        return trustee_result(store, county, township)
+    return {
+        "latitude": latitude,
+        "longitude": longitude,
+        "message": "No township found for the provided coordinates"
+    }, 200
+
+
+def trustee_result(store, county, township):
+    """Gets trustee information for a given county and township."""
+    if store.trustees is None:
+        return {"error": "Trustee data file not found. Please check the file path."}, 200
+    with stage('trustee'):
+        trustee = store.get_trustee(county, township)
+    if trustee:
+        return {
+            "county": county,
+            "township": township,
+            "trustee": trustee
+        }, 200
+    return {
+        "county": county,
+        "message": "No immediate trustee found for the provided address"
+    }, 200
+
+
+def zip_result(townships):
+    """Builds the /geocode response for a ZIP code from its townships in the ZIP code table.
+
+    The largest township with a trustee fills in the same fields as an address lookup, and
+    townships lists every township in the ZIP with its share of the area and its trustee.
+    """
+    primary = next((entry for entry in townships if entry['trustee']), None)
+    if primary is None:
+        return {
+            "county": townships[0]['county'],
+            "townships": townships,
+            "message": "No immediate trustee found for the provided zip code"
+        }, 200
+    return {
+        "county": primary['county'],
+        "township": primary['township'],
+        "trustee": primary['trustee'],
+        "townships": townships
+    }, 200
+
+
+def reverse_geocode_result(resolver, store, lat, lon):
+    """Builds the /reverse-geocode response from the raw lat and lon query parameters."""
+    if not lat or not lon:
+        return {"error": "Latitude and longitude are required"}, 400
+
+    try:
+        latitude = float(lat)
+        longitude = float(lon)
+    except ValueError:
+        return {"error": "Invalid latitude or longitude"}, 400
+    # float() accepts 'nan' and 'inf'
+    if not (math.isfinite(latitude) and math.isfinite(longitude)):
+        return {"error": "Invalid latitude or longitude"}, 400
+
+    # Get township and county
+    with stage('township'):
+        county, township = resolver.resolve(latitude, longitude)
+    if not county or not township:
+        return {"error": "No township found for the provided coordinates"}, 404
+
+    # Get trustee and food pantry data
+    with stage('trustee'):
+        trustee = store.get_trustee(county, township)
+    with stage('food_pantries'):
+        food_pantries = sort_by_distance(store.get_food_pantries(county), latitude, longitude)
+    return {
+        "trustee": trustee,
+        "food_pantries": food_pantries
+    }, 200
+
+
+def nearest_result(nearest_resources, args):
+    """Builds the /nearest response from the query parameters."""
+    lat = args.get('lat')
+    lon = args.get('lon')
+
+    if not lat or not lon:
+        return {"error": "Latitude and longitude are required"}, 400
+
+    try:
+        latitude = float(lat)
+        longitude = float(lon)
+        k = int(args.get('k', 5))
+        max_km = args.get('max_km')
+        max_km = float(max_km) if max_km else None
+    except ValueError:
+        return {"error": "Invalid latitude, longitude, k or max_km"}, 400
+    # float() accepts 'nan' and 'inf', which the BallTree can't handle
+    if not all(math.isfinite(value) for value in (latitude, longitude, max_km or 0)):
+        return {"error": "Invalid latitude, longitude, k or max_km"}, 400
+
+    if not 1 <= k <= 50:
+        return {"error": "k must be between 1 and 50"}, 400
+
+    resource_type = args.get('type', 'all')
+    if resource_type == 'all':
+        types = RESOURCE_TYPES
+    elif resource_type in RESOURCE_TYPES:
+        types = (resource_type,)
+    else:
+        return {"error": "type must be one of all, trustee, food_pantry"}, 400
+
+    with stage('nearest'):
+        results = nearest_resources.nearest(latitude, longitude, k, max_km, types)
+    return {
+        "results": results
+    }, 200
+
+
+def readiness_result(dataset, loaded):
+    """Readiness check: 200 only once the township data and indexes are loaded."""
+    if not loaded or len(dataset.resolver) == 0:
+        return {"status": "loading"}, 503
+    store = dataset.resource_store
+    return {
+        "status": "ready",
+        "data_source": dataset.source,
+        "townships": len(dataset.resolver),
+        "trustees": len(store.trustees or []),
+        "food_pantries": len(store.food_pantries or []),
+        "pid": os.getpid()
+    }, 200
+
+
+def features_result(map_features, args):
+    """Builds the /api/features response from the bbox, zoom and type query parameters."""
+    try:
+        west, south, east, north = (float(value) for value in args.get('bbox', '').split(','))
+        zoom = int(args.get('zoom', ''))
+    except ValueError:
+        return {"error": "bbox must be west,south,east,north and zoom an integer"}, 400
+    if west > east or south > north:
+        return {"error": "bbox must be west,south,east,north"}, 400
+
+    selection = args.get('type', 'all')
+    if selection not in map_features.selections:
+        return {"error": "type must be one of all, trustee, food_pantry"}, 400
+
+    with stage('features'):
+        return map_features.query(west, south, east, north, zoom, selection), 200
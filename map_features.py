@@ -0,0 +1,137 @@
+"""Viewport queries for the map's trustee and food pantry markers.
+
+Up to CLUSTER_MAX_ZOOM, points are grouped into clusters on a grid of CLUSTER_RADIUS
+pixel cells in Web Mercator. The clusters for every zoom level are computed once at
+startup. Above that zoom the individual points are returned. Either way a viewport query
+is an STRtree lookup, and the number of features is bounded by the viewport size, not by
+how many records fall inside it.
+"""
+import os
+
+import numpy as np
+import shapely
+
+from county_shards import slim
+from nearest import RESOURCE_TYPES, has_coordinates
+
+CLUSTER_MAX_ZOOM = int(os.getenv('MAP_CLUSTER_MAX_ZOOM', 11))
+CLUSTER_RADIUS = 60  # pixels
+MAX_ZOOM = 20
+TILE_SIZE = 256
+# Cap on points returned at high zoom, for very large viewports
+MAX_POINTS = 2000
+
+
+def mercator_pixels(latitudes, longitudes, zoom):
+    """Projects coordinates to Web Mercator pixel coordinates at a zoom level."""
+    scale = TILE_SIZE * 2 ** zoom
+    latitudes = np.clip(latitudes, -85.05112878, 85.05112878)
+    x = (longitudes + 180) / 360 * scale
+    y = (1 - np.log(np.tan(np.radians(latitudes)) + 1 / np.cos(np.radians(latitudes))) / np.pi) / 2 * scale
+    return x, y
+
+
+class FeatureLayer:
+    """Points or clusters for one zoom level and resource type selection, with an STRtree over them."""
+
+    def __init__(self, latitudes, longitudes, properties):
+        self.latitudes = latitudes
+        self.longitudes = longitudes
+        self.properties = properties
+        self.tree = shapely.STRtree(shapely.points(longitudes, latitudes))
+
+    def query(self, west, south, east, north, limit=None):
+        """Returns GeoJSON features inside the box, in a stable order, and whether the limit cut any off."""
+        indices = np.sort(self.tree.query(shapely.box(west, south, east, north), predicate='intersects'))
+        truncated = limit is not None and len(indices) > limit
+        if truncated:
+            indices = indices[:limit]
+        features = [{
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [float(self.longitudes[i]), float(self.latitudes[i])]},
+            'properties': self.properties[i],
+        } for i in indices]
+        return features, truncated
+
+
+class MapFeatures:
+    """Pre-clustered trustee and food pantry locations for every zoom level."""
+
+    def __init__(self, trustees, food_pantries):
+        records = []
+        for resource_type, group in zip(RESOURCE_TYPES, (trustees, food_pantries)):
+            for record in group or []:
+                if has_coordinates(record):
+                    properties = slim(record)
+                    properties['County'] = record['County']
+                    properties['type'] = resource_type
+                    records.append(properties)
+        self.records = records
+        self.latitudes = np.array([float(record['Latitude']) for record in records], dtype=float)
+        self.longitudes = np.array([float(record['Longitude']) for record in records], dtype=float)
+        self.types = np.array([record['type'] for record in records], dtype=object)
+
+        # One layer of points and one of clusters per zoom for every type selection the API accepts
+        self.selections = {'all': RESOURCE_TYPES}
+        self.selections.update({resource_type: (resource_type,) for resource_type in RESOURCE_TYPES})
+        self.points = {}
+        self.clusters = {}
+        for name, types in self.selections.items():
+            selected = np.flatnonzero(np.isin(self.types, types))
+            self.points[name] = FeatureLayer(
+                self.latitudes[selected], self.longitudes[selected], [records[i] for i in selected])
+            for zoom in range(CLUSTER_MAX_ZOOM + 1):
+                self.clusters[name, zoom] = self.cluster(selected, zoom)
+
+    def cluster(self, selected, zoom):
+        """Groups the selected points into CLUSTER_RADIUS pixel grid cells at one zoom level."""
+        if len(selected) == 0:
+            return FeatureLayer(np.empty(0), np.empty(0), [])
+        x, y = mercator_pixels(self.latitudes[selected], self.longitudes[selected], zoom)
+        cells = np.column_stack([x // CLUSTER_RADIUS, y // CLUSTER_RADIUS])
+        _, cell_ids = np.unique(cells, axis=0, return_inverse=True)
+        cell_ids = cell_ids.ravel()
+
+        latitudes = []
+        longitudes = []
+        properties = []
+        # Cells in order of their first point, so output order follows the data
+        order = np.argsort(cell_ids, kind='stable')
+        boundaries = np.flatnonzero(np.diff(cell_ids[order])) + 1
+        for members in sorted(np.split(order, boundaries), key=lambda members: members[0]):
+            points = selected[members]
+            if len(points) == 1:
+                # A single point is sent as itself, so the client can show it like any other marker
+                latitudes.append(self.latitudes[points[0]])
+                longitudes.append(self.longitudes[points[0]])
+                properties.append(self.records[points[0]])
+                continue
+            counts = {resource_type: int(np.count_nonzero(self.types[points] == resource_type))
+                      for resource_type in RESOURCE_TYPES}
+            latitudes.append(self.latitudes[points].mean())
+            longitudes.append(self.longitudes[points].mean())
+            properties.append({
+                'cluster': True,
+                'count': len(points),
+                'trustees': counts['trustee'],
+                'food_pantries': counts['food_pantry'],
+                # Zooming in this far splits the cluster's cell into smaller ones
+                'expansion_zoom': min(zoom + 2, CLUSTER_MAX_ZOOM + 1),
+            })
+        return FeatureLayer(np.array(latitudes, dtype=float), np.array(longitudes, dtype=float), properties)
+
+    def query(self, west, south, east, north, zoom, selection='all'):
+        """Returns a GeoJSON FeatureCollection of clusters or points inside the box at this zoom."""
+        zoom = max(0, min(int(zoom), MAX_ZOOM))
+        clustered = zoom <= CLUSTER_MAX_ZOOM
+        if clustered:
+            features, truncated = self.clusters[selection, zoom].query(west, south, east, north)
+        else:
+            features, truncated = self.points[selection].query(west, south, east, north, MAX_POINTS)
+        return {
+            'type': 'FeatureCollection',
+            'zoom': zoom,
+            'clustered': clustered,
+            'truncated': truncated,
+            'features': features,
+        }
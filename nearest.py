@@ -0,0 +1,101 @@
+import numpy as np
+from sklearn.neighbors import BallTree
+
+EARTH_RADIUS_KM = 6371.0
+
+RESOURCE_TYPES = ('trustee', 'food_pantry')
+
+
+def has_coordinates(record):
+    try:
+        float(record['Latitude'])
+        float(record['Longitude'])
+    except (KeyError, TypeError, ValueError):
+        return False
+    return True
+
+
+def haversine_km(latitude, longitude, latitudes, longitudes):
+    """Vectorized great circle distance in km from one point to arrays of points."""
+    lat1, lon1 = np.radians(latitude), np.radians(longitude)
+    lat2, lon2 = np.radians(np.asarray(latitudes, dtype=float)), np.radians(np.asarray(longitudes, dtype=float))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def sort_by_distance(records, latitude, longitude):
+    """Returns records ordered by distance from the point; ones without coordinates go last."""
+    located = [record for record in records if has_coordinates(record)]
+    unlocated = [record for record in records if not has_coordinates(record)]
+    if not located:
+        return unlocated
+    distances = haversine_km(
+        latitude, longitude,
+        [record['Latitude'] for record in located],
+        [record['Longitude'] for record in located],
+    )
+    return [located[i] for i in np.argsort(distances, kind='stable')] + unlocated
+
+
+class NearestIndex:
+    """BallTree over one kind of resource, using the haversine metric on radians."""
+
+    def __init__(self, records):
+        self.records = [record for record in records if has_coordinates(record)]
+        coordinates = np.array(
+            [[float(record['Latitude']), float(record['Longitude'])] for record in self.records],
+            dtype=float,
+        ).reshape(-1, 2)
+        self.tree = BallTree(np.radians(coordinates), metric='haversine') if self.records else None
+
+    def query_many(self, latitudes, longitudes, k):
+        """Returns (distances_km, indices) arrays of shape (n, k) for many points."""
+        points = np.radians(np.column_stack([
+            np.asarray(latitudes, dtype=float),
+            np.asarray(longitudes, dtype=float),
+        ]))
+        k = min(k, len(self.records))
+        if self.tree is None or k == 0:
+            return np.empty((len(points), 0)), np.empty((len(points), 0), dtype=np.int64)
+        distances, indices = self.tree.query(points, k=k)
+        return distances * EARTH_RADIUS_KM, indices
+
+
+class NearestResources:
+    """Nearest trustee offices and food pantries to a point, across county lines."""
+
+    def __init__(self, trustees, food_pantries):
+        self.indexes = {
+            'trustee': NearestIndex(trustees or []),
+            'food_pantry': NearestIndex(food_pantries or []),
+        }
+
+    def nearest_many(self, latitudes, longitudes, k=5, max_km=None, types=RESOURCE_TYPES):
+        """Vectorized nearest-neighbour search.
+
+        Returns one list per input point of result dicts sorted by distance, each a copy
+        of the record with 'type' and 'distance_km' added.
+        """
+        latitudes = np.asarray(latitudes, dtype=float)
+        longitudes = np.asarray(longitudes, dtype=float)
+        results = [[] for _ in range(len(latitudes))]
+        for resource_type in types:
+            index = self.indexes[resource_type]
+            distances, indices = index.query_many(latitudes, longitudes, k)
+            for point, (row_distances, row_indices) in enumerate(zip(distances, indices)):
+                for distance, i in zip(row_distances, row_indices):
+                    if max_km is not None and distance > max_km:
+                        break
+                    result = dict(index.records[i])
+                    result['type'] = resource_type
+                    result['distance_km'] = round(float(distance), 3)
+                    results[point].append(result)
+
+        for point_results in results:
+            point_results.sort(key=lambda result: result['distance_km'])
+            del point_results[k:]
+        return results
+
+    def nearest(self, latitude, longitude, k=5, max_km=None, types=RESOURCE_TYPES):
+        """Returns up to k resources nearest to the point, closest first."""
+        return self.nearest_many([latitude], [longitude], k, max_km, types)[0]
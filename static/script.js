@@ -1,8 +1,11 @@
-let trusteeData = [];
-let foodPantryData = [];
 let countyData = [];
+// Per-county trustees and food pantries, fetched when a county is first selected
+let countyShards = {};
 let map;
 let markers = [];
+// Viewport markers from /api/features, shown while no county is selected
+let featureLayer;
+let featureRequest = 0;
 
 $(document).ready(function() {
     const countySelect = $('#countySelect');
@@ -82,33 +85,15 @@ $(document).ready(function() {
     });
 
     countySelect.change(function() {
-        const selectedCounty = $(this).val();
-        const selectedFilter = filterSelect.val();
-        displayResults(selectedCounty, selectedFilter);
-        updateMap(selectedCounty, selectedFilter);
+        showCounty($(this).val(), filterSelect.val());
+        refreshFeatures();
     });
 
     filterSelect.change(function() {
-        const selectedCounty = countySelect.val();
-        const selectedFilter = $(this).val();
-        displayResults(selectedCounty, selectedFilter);
-        updateMap(selectedCounty, selectedFilter);
+        showCounty(countySelect.val(), $(this).val());
+        refreshFeatures();
     });
 
-    fetch('static/utilities/data/indiana_township_trustees.json')
-        .then(response => response.json())
-        .then(data => {
-            trusteeData = data;
-        })
-        .catch(error => console.error('Error loading trustee data:', error));
-
-    fetch('static/utilities/data/indiana_food_pantries.json')
-        .then(response => response.json())
-        .then(data => {
-            foodPantryData = data;
-        })
-        .catch(error => console.error('Error loading food pantry data:', error));
-
     zipForm.submit(function(event) {
             event.preventDefault();
             const zip = zipInput.val();
@@ -138,9 +123,20 @@ $(document).ready(function() {
                             }
                             
     
-                            // Update results
+                            // Update results, with the trustee of every township the zip code covers
                             resultsDiv.empty();
                             resultsDiv.append(createCard(trustee, 'Trustee'));
+                            (data.townships || []).forEach(entry => {
+                                if (!entry.trustee || (entry.trustee.Name === trustee.Name && entry.trustee.County === trustee.County)) {
+                                    return;
+                                }
+                                if (entry.trustee.Latitude && entry.trustee.Longitude) {
+                                    const marker = L.marker([entry.trustee.Latitude, entry.trustee.Longitude], { icon: trusteeIcon }).addTo(map);
+                                    marker.bindPopup(createPopupContent(entry.trustee, 'Trustee'));
+                                    markers.push(marker);
+                                }
+                                resultsDiv.append(createCard(entry.trustee, 'Trustee'));
+                            });
     
                         } else if (data.county) {
                             alert(`No immediate trustee found for your address in ${data.county}. Showing other results in that area.`);
@@ -205,6 +201,64 @@ function initializeMap() {
     L.tileLayer('https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png', {
         attribution: '© OpenStreetMap contributors'
     }).addTo(map);
+
+    // Township boundaries, drawn from vector tiles the server cuts from the township polygons
+    L.vectorGrid.protobuf('/tiles/{z}/{x}/{y}.mvt', {
+        minZoom: 6,
+        maxNativeZoom: 14,
+        interactive: true,
+        vectorTileLayerStyles: {
+            townships: { weight: 1, color: '#6c757d', opacity: 0.8, fill: true, fillOpacity: 0 }
+        }
+    })
+        .on('click', event => {
+            const properties = event.layer.properties;
+            L.popup()
+                .setLatLng(event.latlng)
+                .setContent(`<strong>${properties.township}</strong><br>${properties.county} County`)
+                .openOn(map);
+        })
+        .addTo(map);
+
+    featureLayer = L.layerGroup().addTo(map);
+    map.on('moveend', refreshFeatures);
+    refreshFeatures();
+}
+
+function refreshFeatures() {
+    const requestId = ++featureRequest;
+    if ($('#countySelect').val()) {
+        featureLayer.clearLayers();
+        return;
+    }
+
+    const filter = $('#filterSelect').val();
+    fetch(`/api/features?bbox=${map.getBounds().toBBoxString()}&zoom=${map.getZoom()}&type=${filter}`)
+        .then(response => response.json())
+        .then(data => {
+            // A newer request has been made since this one, e.g. the map moved again
+            if (requestId !== featureRequest) {
+                return;
+            }
+            featureLayer.clearLayers();
+            data.features.forEach(feature => {
+                const [longitude, latitude] = feature.geometry.coordinates;
+                const properties = feature.properties;
+                if (properties.cluster) {
+                    const marker = L.marker([latitude, longitude], {
+                        icon: L.divIcon({ className: 'feature-cluster', html: `<span>${properties.count}</span>`, iconSize: [36, 36] })
+                    });
+                    marker.on('click', () => map.setView([latitude, longitude], properties.expansion_zoom));
+                    featureLayer.addLayer(marker);
+                } else {
+                    const isTrustee = properties.type === 'trustee';
+                    const marker = L.marker([latitude, longitude], { icon: isTrustee ? trusteeIcon : foodPantryIcon });
+                    marker.bindPopup(createPopupContent(properties, isTrustee ? 'Trustee' : 'Food Pantry'));
+                    featureLayer.addLayer(marker);
+                }
+            });
+        })
+        .catch(error => console.error('Error loading map features:', error));
 }
 
 const trusteeIcon = new L.Icon({
@@ -225,7 +279,35 @@ const foodPantryIcon = new L.Icon({
     shadowSize: [41, 41]
 });
 
-function updateMap(county, filter) {
+function loadCounty(county) {
+    if (!county) {
+        return Promise.resolve({ trustees: [], food_pantries: [] });
+    }
+    if (!countyShards[county]) {
+        countyShards[county] = fetch(`/api/county/${encodeURIComponent(county)}`)
+            .then(response => response.ok ? response.json() : { trustees: [], food_pantries: [] })
+            .catch(error => {
+                // Forget the failed request so selecting the county again retries it
+                delete countyShards[county];
+                console.error('Error loading county data:', error);
+                return { trustees: [], food_pantries: [] };
+            });
+    }
+    return countyShards[county];
+}
+
+function showCounty(county, filter) {
+    loadCounty(county).then(shard => {
+        // Skip results for a county the user has already moved away from
+        if ($('#countySelect').val() !== county) {
+            return;
+        }
+        displayResults(shard, filter);
+        updateMap(county, shard, filter);
+    });
+}
+
+function updateMap(county, shard, filter) {
     markers.forEach(marker => map.removeLayer(marker));
     markers = [];
 
@@ -237,8 +319,7 @@ function updateMap(county, filter) {
     }
 
     if (filter === 'all' || filter === 'trustee') {
-        const trustees = trusteeData.filter(item => item.County === county);
-        trustees.forEach(trustee => {
+        shard.trustees.forEach(trustee => {
             if (trustee.Latitude && trustee.Longitude) { //only show markers that have a location. Otherwise, don't bother.
                 const marker = L.marker([trustee.Latitude, trustee.Longitude], { icon: trusteeIcon }).addTo(map);
                 marker.bindPopup(createPopupContent(trustee, 'Trustee'));
@@ -249,8 +330,7 @@ function updateMap(county, filter) {
     }
 
     if (filter === 'all' || filter === 'food_pantry') {
-        const foodPantries = foodPantryData.filter(item => item.County === county);
-        foodPantries.forEach(foodPantry => {
+        shard.food_pantries.forEach(foodPantry => {
             if (foodPantry.Latitude && foodPantry.Longitude){ //only show markers that have a location. Otherwise, don't bother.
                 const marker = L.marker([foodPantry.Latitude, foodPantry.Longitude], { icon: foodPantryIcon }).addTo(map);
                 marker.bindPopup(createPopupContent(foodPantry, 'Food Pantry'));
@@ -284,20 +364,18 @@ function createPopupContent(data, type) {
     `;
 }
 
-function displayResults(county, filter) {
+function displayResults(shard, filter) {
     const resultsDiv = $('#results');
     resultsDiv.empty();
 
     if (filter === 'all' || filter === 'trustee') {
-        const trustees = trusteeData.filter(item => item.County === county);
-        trustees.forEach(trustee => {
+        shard.trustees.forEach(trustee => {
             resultsDiv.append(createCard(trustee, 'Trustee'));
         });
     }
 
     if (filter === 'all' || filter === 'food_pantry') {
-        const foodPantries = foodPantryData.filter(item => item.County === county);
-        foodPantries.forEach(foodPantry => {
+        shard.food_pantries.forEach(foodPantry => {
             resultsDiv.append(createCard(foodPantry, 'Food Pantry'));
         });
     }
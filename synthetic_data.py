@@ -0,0 +1,253 @@
+"""Generates a synthetic Indiana dataset: township polygons, trustees, food pantries and OSM addresses.
+
+The real township GeoJSON and address extract aren't in the repo, so benchmarks and load
+tests run against this instead. Townships are Voronoi cells over Indiana's bounding box,
+each assigned to the county whose centre (from counties_bounding_boxes.json) is nearest,
+so they tile the state without gaps and nest in counties like the real ones. Every file is
+written in the same format as the real data, so load_dataset() and the utilities read it as is.
+
+Scale 1 is about the size of the real data (~1,000 townships). Output is deterministic for a
+given scale and seed.
+
+    python synthetic_data.py --scale 10 --output cache/synthetic/10x
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+import shapely
+from shapely.geometry import mapping
+
+from county_shards import COUNTIES_FILE
+
+GENERATOR_VERSION = 1
+DEFAULT_PATH = 'cache/synthetic'
+# Where the app reads its real data from; synthetic files must never end up in there
+PRODUCTION_DATA_PATH = 'static'
+INDIANA_BOUNDS = (-88.10, 37.77, -84.78, 41.76)
+
+# Sizes at scale 1
+TOWNSHIPS = 1008
+FOOD_PANTRIES = 450
+STREETS = 250
+ADDRESSES_PER_STREET = 20
+
+# Share of townships that are water or otherwise undefined, and of townships with no trustee record
+UNDEFINED_SHARE = 0.01
+MISSING_TRUSTEE_SHARE = 0.05
+
+TOWNSHIP_WORDS = [
+    'Washington', 'Jackson', 'Union', 'Center', 'Clay', 'Harrison', 'Jefferson', 'Franklin',
+    'Wayne', 'Perry', 'Monroe', 'Liberty', 'Pleasant', 'Green', 'Adams', 'Richland', 'Salt Creek',
+    'Blue Creek', 'French', 'Sugar Creek', 'Pike', 'Lincoln', 'Van Buren', 'Madison', 'Marion',
+    'Shelby', 'Warren', 'Posey', 'Noble', 'Fairfield', 'Prairie', 'Spring Creek', 'Eel River',
+]
+STREET_WORDS = [
+    'Main', 'Oak', 'Maple', 'Walnut', 'Cherry', 'Mill', 'Church', 'Water', 'Market', 'Park',
+    'Hickory', 'Sycamore', 'Elm', 'Pine', 'Lake', 'Hill', 'Meridian', 'Jefferson', 'Madison',
+    'Washington', 'State', 'County Line', 'Old Farm', 'Prairie', 'Orchard',
+]
+STREET_SUFFIXES = ['St', 'Ave', 'Rd', 'Dr', 'Ln', 'Ct', 'Pike', 'Blvd']
+DIRECTIONS = ['N', 'S', 'E', 'W']
+
+
+def dataset_paths(output_dir):
+    """Paths of the generated files, named like the real ones."""
+    return {
+        'townships': os.path.join(output_dir, 'indiana_townships.geojson'),
+        'trustees': os.path.join(output_dir, 'indiana_township_trustees.json'),
+        'food_pantries': os.path.join(output_dir, 'indiana_food_pantries.json'),
+        'addresses': os.path.join(output_dir, 'indiana_addresses.ndjson'),
+        'meta': os.path.join(output_dir, 'meta.json'),
+    }
+
+
+def load_counties(counties_file=COUNTIES_FILE):
+    """Returns county names and the centres of their bounding boxes."""
+    with open(counties_file, 'r') as f:
+        counties = json.load(f)
+    names = [county['name'] for county in counties]
+    centres = np.array([
+        ((county['bbox']['southwest']['lng'] + county['bbox']['northeast']['lng']) / 2,
+         (county['bbox']['southwest']['lat'] + county['bbox']['northeast']['lat']) / 2)
+        for county in counties
+    ])
+    return names, centres
+
+
+def make_townships(rng, count, county_centres):
+    """Returns township polygons and the index of the county each one belongs to."""
+    west, south, east, north = INDIANA_BOUNDS
+    seeds = np.column_stack([rng.uniform(west, east, count), rng.uniform(south, north, count)])
+    bounds = shapely.box(west, south, east, north)
+    cells = shapely.voronoi_polygons(shapely.multipoints(seeds), extend_to=bounds, ordered=True)
+    polygons = shapely.intersection(np.asarray(shapely.get_parts(cells)), bounds)
+
+    # Nearest county centre, in chunks so 100x doesn't build one huge distance matrix
+    counties = np.empty(count, dtype=np.int64)
+    for start in range(0, count, 10000):
+        chunk = seeds[start:start + 10000]
+        distances = ((chunk[:, None, :] - county_centres[None, :, :]) ** 2).sum(axis=2)
+        counties[start:start + 10000] = distances.argmin(axis=1)
+    return polygons, counties
+
+
+def township_names(rng, counties):
+    """Gives each township a name that is unique within its county."""
+    used = {}
+    names = []
+    for county in counties:
+        word = TOWNSHIP_WORDS[rng.integers(len(TOWNSHIP_WORDS))]
+        count = used.get((county, word), 0) + 1
+        used[county, word] = count
+        names.append(word if count == 1 else f"{word} {count}")
+    return names
+
+
+def random_phone(rng):
+    return f"{rng.integers(200, 999)}-{rng.integers(200, 999)}-{rng.integers(1000, 9999)}"
+
+
+def jitter(rng, point, spread=0.01):
+    return float(point.y + rng.uniform(-spread, spread)), float(point.x + rng.uniform(-spread, spread))
+
+
+def generate(output_dir, scale=1, seed=0):
+    """Writes a synthetic dataset of the given scale to output_dir. Returns the file paths."""
+    production = os.path.realpath(PRODUCTION_DATA_PATH)
+    if os.path.commonpath([production, os.path.realpath(output_dir)]) == production:
+        raise ValueError(f"{output_dir} is where the app reads its real data, write synthetic data to {DEFAULT_PATH}")
+    rng = np.random.default_rng(seed)
+    paths = dataset_paths(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    county_names, county_centres = load_counties()
+
+    count = int(TOWNSHIPS * scale)
+    polygons, counties = make_townships(rng, count, county_centres)
+    names = township_names(rng, counties)
+    undefined = rng.random(count) < UNDEFINED_SHARE
+    points = shapely.point_on_surface(polygons)
+
+    features = []
+    for polygon, county, name, is_undefined in zip(polygons, counties, names, undefined):
+        geometry = mapping(shapely.set_precision(polygon, 1e-6))
+        features.append({
+            'type': 'Feature',
+            'properties': {
+                'cnty_name': county_names[county],
+                'tl_2021_18_cousub_namelsad': 'County Subdivisions Not Defined' if is_undefined else f"{name} township",
+            },
+            'geometry': geometry,
+        })
+    with open(paths['townships'], 'w') as f:
+        json.dump({'type': 'FeatureCollection', 'features': features}, f)
+
+    trustees = []
+    for index in range(count):
+        if undefined[index] or rng.random() < MISSING_TRUSTEE_SHARE:
+            continue
+        latitude, longitude = jitter(rng, points[index], 0.002)
+        trustees.append({
+            'County': county_names[counties[index]],
+            'Name': f"{names[index]} Township Trustee",
+            'Address': f"{rng.integers(100, 9999)} {STREET_WORDS[rng.integers(len(STREET_WORDS))]} St, "
+                       f"{names[index]}, IN {46000 + counties[index] * 10}",
+            'Phone': random_phone(rng),
+            'Website': 'N/A',
+            'Latitude': latitude,
+            'Longitude': longitude,
+            'Hours': [],
+        })
+    with open(paths['trustees'], 'w') as f:
+        json.dump(trustees, f, indent=4)
+
+    pantries = []
+    for number, index in enumerate(rng.integers(count, size=int(FOOD_PANTRIES * scale))):
+        latitude, longitude = jitter(rng, points[index])
+        pantries.append({
+            'County': county_names[counties[index]],
+            'Name': f"{names[index]} Community Food Pantry {number}",
+            'Address': f"{rng.integers(100, 9999)} Main St, {names[index]}, IN {46000 + counties[index] * 10}",
+            'Phone': random_phone(rng),
+            'Website': 'N/A',
+            'Latitude': latitude,
+            'Longitude': longitude,
+            'Hours': ['Monday: 9:00 AM - 5:00 PM', 'Tuesday: Closed'],
+        })
+    with open(paths['food_pantries'], 'w') as f:
+        json.dump(pantries, f, indent=4)
+
+    # Straight streets starting near a township's centre, with even house numbers on one side
+    # and odd on the other, in the converter script's NDJSON format
+    addresses = 0
+    with open(paths['addresses'], 'w') as f:
+        for street in range(int(STREETS * scale)):
+            index = rng.integers(count)
+            start_latitude, start_longitude = jitter(rng, points[index])
+            angle = rng.uniform(0, 2 * np.pi)
+            length = rng.uniform(0.005, 0.03)
+            name = (f"{DIRECTIONS[rng.integers(4)]} {STREET_WORDS[rng.integers(len(STREET_WORDS))]} "
+                    f"{STREET_SUFFIXES[rng.integers(len(STREET_SUFFIXES))]}")
+            first = int(rng.integers(1, 50)) * 100
+            for step in range(ADDRESSES_PER_STREET):
+                fraction = step / ADDRESSES_PER_STREET
+                f.write(json.dumps({
+                    'type': 'node',
+                    'id': addresses,
+                    'latitude': round(start_latitude + fraction * length * np.sin(angle), 7),
+                    'longitude': round(start_longitude + fraction * length * np.cos(angle), 7),
+                    'housenumber': str(first + step * 2 + street % 2),
+                    'street': name,
+                    'city': names[index],
+                    'state': 'IN',
+                    'postcode': str(46000 + counties[index] * 10),
+                }) + '\n')
+                addresses += 1
+
+    meta = {
+        'version': GENERATOR_VERSION,
+        'scale': scale,
+        'seed': seed,
+        'townships': count,
+        'trustees': len(trustees),
+        'food_pantries': len(pantries),
+        'addresses': addresses,
+    }
+    with open(paths['meta'], 'w') as f:
+        json.dump(meta, f)
+    return paths
+
+
+def ensure(scale, seed=0, root=DEFAULT_PATH):
+    """Returns the paths of the dataset for a scale, generating it first if it isn't there yet."""
+    output_dir = os.path.join(root, f"{scale:g}x")
+    paths = dataset_paths(output_dir)
+    try:
+        with open(paths['meta'], 'r') as f:
+            meta = json.load(f)
+        if (meta['version'], meta['scale'], meta['seed']) == (GENERATOR_VERSION, scale, seed):
+            return paths
+    except (FileNotFoundError, ValueError, KeyError):
+        pass
+    print(f"Generating the {scale:g}x synthetic dataset in {output_dir}")
+    return generate(output_dir, scale, seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic Indiana dataset.')
+    parser.add_argument('--scale', type=float, default=1, help='1 is about the size of the real data')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help=f"Output directory (default {DEFAULT_PATH}/<scale>x)")
+    args = parser.parse_args()
+
+    output_dir = args.output or os.path.join(DEFAULT_PATH, f"{args.scale:g}x")
+    paths = generate(output_dir, args.scale, args.seed)
+    with open(paths['meta'], 'r') as f:
+        meta = json.load(f)
+    print(f"Wrote {meta['townships']} townships, {meta['trustees']} trustees, {meta['food_pantries']} food pantries "
+          f"and {meta['addresses']} addresses to {output_dir}")
+
+
+if __name__ == '__main__':
+    main()
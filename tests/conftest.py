@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# geocoder opens its cache on import; keep the tests away from cache/geocode_cache.sqlite
+os.environ.setdefault('GEOCODE_CACHE_PATH', os.path.join(tempfile.mkdtemp(), 'geocode_cache.sqlite'))
@@ -0,0 +1,37 @@
+import os
+import sys
+
+import shapely
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'utilities'))
+
+from county_resolver import CountyResolver  # noqa: E402
+
+
+def make_resolver():
+    # Two counties sharing the line at longitude -85
+    return CountyResolver([shapely.box(-86, 40, -85, 41), shapely.box(-85, 40, -84, 41)], ['Adams', 'Allen'])
+
+
+def test_counties_at():
+    resolver = make_resolver()
+    assert list(resolver.counties_at([40.5, 40.5, 42], [-85.5, -84.5, -85.5])) == ['Adams', 'Allen', None]
+    assert resolver.county_at(40.5, -84.5) == 'Allen'
+    assert len(resolver.counties_at([], [])) == 0
+
+
+def test_in_county_ignores_case_and_spacing():
+    resolver = make_resolver()
+    assert list(resolver.in_county([40.5, 40.5], [-85.5, -84.5], 'Adams')) == [True, False]
+    assert list(resolver.in_county([40.5, 40.5], [-85.5, -84.5], ' allen ')) == [False, True]
+    assert list(resolver.in_county([40.5], [-85.5], 'Wells')) == [False]
+
+
+def test_point_on_a_county_line_is_in_both_counties():
+    resolver = make_resolver()
+    assert resolver.in_county([40.5], [-85], 'Adams')[0]
+    assert resolver.in_county([40.5], [-85], 'Allen')[0]
+
+
+def test_in_county_with_no_points():
+    assert len(make_resolver().in_county([], [], 'Adams')) == 0
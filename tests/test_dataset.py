@@ -0,0 +1,93 @@
+import json
+
+import pytest
+
+import dataset
+
+
+@pytest.fixture
+def sources(tmp_path):
+    """Two square townships in one county, a trustee for one of them and a food pantry."""
+    def square(west, south):
+        return [[[west, south], [west + 0.1, south], [west + 0.1, south + 0.1], [west, south + 0.1], [west, south]]]
+
+    townships = {'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'geometry': {'type': 'Polygon', 'coordinates': square(-86.6, 39.1)},
+         'properties': {'cnty_name': 'Monroe', 'tl_2021_18_cousub_namelsad': 'Bloomington township'}},
+        {'type': 'Feature', 'geometry': {'type': 'Polygon', 'coordinates': square(-86.5, 39.1)},
+         'properties': {'cnty_name': 'Monroe', 'tl_2021_18_cousub_namelsad': 'Perry township'}},
+    ]}
+    trustees = [{'County': 'Monroe', 'Name': 'Bloomington Township Trustee', 'Phone': '812-555-0100'}]
+    food_pantries = [{'County': 'Monroe', 'Name': 'Hoosier Hills Food Bank'}]
+    paths = {}
+    for name, data in (('townships', townships), ('trustees', trustees), ('food_pantries', food_pantries)):
+        paths[name] = str(tmp_path / f'{name}.json')
+        with open(paths[name], 'w') as f:
+            json.dump(data, f)
+    return paths
+
+
+@pytest.fixture
+def bundle(tmp_path, sources):
+    path = str(tmp_path / 'dataset.bundle')
+    dataset.compile_data(path, sources['townships'], sources['trustees'], sources['food_pantries'], 0.05)
+    return path
+
+
+def test_bundle_round_trip(bundle):
+    loaded = dataset.load_dataset(bundle)
+    assert loaded.source == bundle
+    assert loaded.resolver.resolve(39.15, -86.55) == ('Monroe', 'Bloomington township')
+    assert loaded.resolver.resolve(39.15, -86.45) == ('Monroe', 'Perry township')
+    assert loaded.resource_store.get_trustee('Monroe', 'Bloomington township')['Phone'] == '812-555-0100'
+    assert len(loaded.resource_store.get_food_pantries('monroe')) == 1
+
+
+@pytest.mark.parametrize('size', [0, 8, 100, -64])
+def test_truncated_bundle_is_rejected(bundle, size):
+    with open(bundle, 'r+b') as f:
+        f.truncate(size if size >= 0 else f.seek(0, 2) + size)
+    with pytest.raises(ValueError):
+        dataset.read_bundle(bundle)
+
+
+def test_bad_bundle_falls_back_to_the_source_files(bundle, monkeypatch):
+    with open(bundle, 'r+b') as f:
+        f.truncate(8)
+    fallback = object()
+    monkeypatch.setattr(dataset, 'load_sources', lambda: fallback)
+    assert dataset.load_dataset(bundle) is fallback
+
+
+def array_offset(path, name):
+    """Where an array starts in a bundle file."""
+    with open(path, 'rb') as f:
+        prefix = f.read(12)
+        header_length = int.from_bytes(prefix[8:12], 'little')
+        header = json.loads(f.read(header_length))
+    return dataset.aligned(12 + header_length) + header['arrays'][name]['offset']
+
+
+def test_corrupt_geometry_falls_back_to_the_source_files(bundle, monkeypatch):
+    with open(bundle, 'r+b') as f:
+        f.seek(array_offset(bundle, 'township_wkb'))
+        f.write(b'\xff' * 16)
+    fallback = object()
+    monkeypatch.setattr(dataset, 'load_sources', lambda: fallback)
+    assert dataset.load_dataset(bundle) is fallback
+
+
+def test_bundle_carries_the_tile_layers(bundle, sources, monkeypatch):
+    import vector_tiles
+
+    loaded = dataset.load_dataset(bundle)
+    assert sorted(loaded.tile_layers) == list(vector_tiles.LAYER_ZOOMS)
+    built = vector_tiles.TownshipTiles(dataset.load_sources(sources['townships'], sources['trustees'],
+                                                            sources['food_pantries']).resolver, None)
+
+    # With the bundle's layers nothing is simplified at startup
+    monkeypatch.setattr(vector_tiles, 'simplify_layers', lambda geometries: pytest.fail('simplified again'))
+    tiles = vector_tiles.TownshipTiles(loaded.resolver, None, loaded.tile_layers)
+    for z, x, y in ((4, 4, 6), (8, 66, 97), (12, 1063, 1563)):
+        assert tiles.tile(z, x, y)
+        assert tiles.tile(z, x, y) == built.tile(z, x, y)
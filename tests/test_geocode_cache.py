@@ -0,0 +1,69 @@
+import time
+
+import geocode_cache
+from geocode_cache import GeocodeCache, cache_key
+
+
+def test_cache_key_normalizes_queries():
+    assert cache_key(address='  325 E  Winslow Rd ') == cache_key(address='325 e winslow rd')
+    assert cache_key(zip='47401') != cache_key(address='47401')
+
+
+def test_disk_hit_is_promoted_to_memory(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    GeocodeCache(path).set('key', [{'lat': '39.1', 'lon': '-86.5'}])
+
+    # A new cache on the same file, like another worker or a restart
+    cache = GeocodeCache(path)
+    assert cache.get('key') == (True, [{'lat': '39.1', 'lon': '-86.5'}])
+    assert cache.stats()['disk_hits'] == 1
+    assert cache.stats()['memory_entries'] == 1
+
+    assert cache.get('key')[0]
+    assert cache.stats()['memory_hits'] == 1
+    assert cache.stats()['disk_hits'] == 1
+
+
+def test_memory_tier_evicts_least_recently_used(tmp_path):
+    cache = GeocodeCache(str(tmp_path / 'cache.sqlite'), memory_size=2)
+    cache.set('a', [1])
+    cache.set('b', [2])
+    cache.get('a')
+    cache.set('c', [3])
+
+    assert list(cache.memory) == ['a', 'c']
+    # b is still on disk
+    assert cache.get('b') == (True, [2])
+    assert cache.stats()['disk_hits'] == 1
+
+
+def test_entries_expire_after_ttl(tmp_path, monkeypatch):
+    cache = GeocodeCache(str(tmp_path / 'cache.sqlite'), ttl=60, negative_ttl=10)
+    cache.set('found', [1])
+    cache.set('missing', [])
+    assert cache.get('missing') == (True, [])
+    assert cache.stats()['negative_hits'] == 1
+
+    now = time.time()
+    monkeypatch.setattr(geocode_cache.time, 'time', lambda: now + 30)
+    assert cache.get('found') == (True, [1])
+    assert cache.get('missing') == (False, None)
+
+    monkeypatch.setattr(geocode_cache.time, 'time', lambda: now + 61)
+    assert cache.get('found') == (False, None)
+    # Expired in both tiers, not just the LRU
+    assert 'found' not in cache.memory
+    assert GeocodeCache(cache.path).get('found') == (False, None)
+
+
+def test_prune_deletes_expired_and_excess_rows(tmp_path, monkeypatch):
+    cache = GeocodeCache(str(tmp_path / 'cache.sqlite'), ttl=60, disk_size=2)
+    for key in 'abc':
+        cache.set(key, [key])
+    cache.prune()
+    assert cache.connection().execute('SELECT COUNT(*) FROM geocode_cache').fetchone()[0] == 2
+
+    now = time.time()
+    monkeypatch.setattr(geocode_cache.time, 'time', lambda: now + 61)
+    cache.prune()
+    assert cache.connection().execute('SELECT COUNT(*) FROM geocode_cache').fetchone()[0] == 0
@@ -0,0 +1,169 @@
+import socket
+import threading
+import time
+
+import pytest
+import uvicorn
+
+import fake_nominatim
+import geocoder
+from geocode_cache import GeocodeCache
+
+
+@pytest.fixture(scope='module')
+def nominatim_url():
+    """Serves fake_nominatim.py on a free port for the tests in this module."""
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    server = uvicorn.Server(uvicorn.Config(fake_nominatim.app, log_level='warning'))
+    thread = threading.Thread(target=server.run, kwargs={'sockets': [sock]}, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    yield f'http://127.0.0.1:{sock.getsockname()[1]}/search'
+    server.should_exit = True
+    thread.join()
+
+
+@pytest.fixture
+def upstream(monkeypatch, nominatim_url):
+    """The fake Nominatim with no latency, and retries that don't sleep but record their attempts."""
+    monkeypatch.setattr(fake_nominatim, 'LATENCY_MS', 0)
+    monkeypatch.setattr(fake_nominatim, 'JITTER_MS', 0)
+    monkeypatch.setattr(fake_nominatim, 'ERROR_RATE', 0)
+    monkeypatch.setattr(fake_nominatim, 'THROTTLE_RATE', 0)
+    monkeypatch.setattr(fake_nominatim, 'EMPTY_RATE', 0)
+    backoffs = []
+
+    def record_backoff(attempt, response=None):
+        backoffs.append((attempt, response.status_code if response is not None else None,
+                         original_backoff(attempt, response)))
+        return 0
+
+    original_backoff = geocoder.backoff
+    monkeypatch.setattr(geocoder, 'backoff', record_backoff)
+    return nominatim_url, backoffs
+
+
+def make_client(url, max_retries=2):
+    return geocoder.NominatimClient(url=url, rate=1000, burst=1000, max_retries=max_retries)
+
+
+def test_search_returns_results(upstream):
+    url, backoffs = upstream
+    client = make_client(url)
+    results = client.search(geocoder.build_params(address='325 E Winslow Rd, Bloomington, IN'))
+    assert len(results) == 1
+    assert client.counters == {'requests': 1, 'retries': 0, 'failures': 0, 'throttled': 0}
+    assert backoffs == []
+
+
+def test_503_is_retried_until_it_succeeds(upstream, monkeypatch):
+    url, backoffs = upstream
+    monkeypatch.setattr(fake_nominatim, 'ERROR_RATE', 1)
+
+    def recover(attempt, response=None):
+        backoffs.append((attempt, response.status_code))
+        monkeypatch.setattr(fake_nominatim, 'ERROR_RATE', 0)
+        return 0
+
+    monkeypatch.setattr(geocoder, 'backoff', recover)
+    client = make_client(url)
+    assert client.search(geocoder.build_params(zip='47401'))
+    assert backoffs == [(0, 503)]
+    assert client.counters['requests'] == 2
+    assert client.counters['retries'] == 1
+    assert client.counters['failures'] == 0
+
+
+def test_429_backs_off_by_retry_after_then_gives_up(upstream, monkeypatch):
+    url, backoffs = upstream
+    monkeypatch.setattr(fake_nominatim, 'THROTTLE_RATE', 1)
+    client = make_client(url, max_retries=2)
+    with pytest.raises(geocoder.GeocoderUnavailable):
+        client.search(geocoder.build_params(address='1 Main St, Muncie, IN'))
+    # fake_nominatim sends Retry-After: 1
+    assert backoffs == [(0, 429, 1.0), (1, 429, 1.0)]
+    assert client.counters == {'requests': 3, 'retries': 2, 'failures': 1, 'throttled': 0}
+
+
+def test_backoff_grows_without_retry_after():
+    # 0.5 s doubling each attempt, capped at 8 s, with +-50% jitter
+    assert 0.25 <= geocoder.backoff(0) <= 0.75
+    assert 1 <= geocoder.backoff(2) <= 3
+    assert 4 <= geocoder.backoff(10) <= 12
+
+
+def test_single_flight_shares_one_call():
+    single_flight = geocoder.SingleFlight()
+    calls = []
+    release = threading.Event()
+
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return ['result']
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(single_flight.do('key', slow))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    # Let every thread join the call before the leader finishes
+    while len(single_flight.calls) == 0 or len(calls) == 0:
+        time.sleep(0.01)
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert calls == [1]
+    assert results == [['result']] * 5
+    assert single_flight.calls == {}
+
+
+def test_single_flight_shares_errors():
+    single_flight = geocoder.SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def failing():
+        started.set()
+        release.wait(5)
+        raise geocoder.GeocoderUnavailable('down')
+
+    errors = []
+
+    def call():
+        try:
+            single_flight.do('key', failing)
+        except geocoder.GeocoderUnavailable as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=call)
+    follower.start()
+    time.sleep(0.1)
+    release.set()
+    leader.join()
+    follower.join()
+    assert len(errors) == 2
+
+
+def test_search_coalesces_and_caches(upstream, monkeypatch, tmp_path):
+    url, _ = upstream
+    client = make_client(url)
+    monkeypatch.setattr(geocoder, 'client', client)
+    monkeypatch.setattr(geocoder, 'cache', GeocodeCache(str(tmp_path / 'cache.sqlite')))
+    monkeypatch.setattr(fake_nominatim, 'LATENCY_MS', 200)
+
+    threads = [threading.Thread(target=geocoder.search, kwargs={'zip': '47401'}) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert client.counters['requests'] == 1
+
+    assert geocoder.search(zip=' 47401 ')
+    assert client.counters['requests'] == 1
@@ -0,0 +1,106 @@
+import json
+import logging
+import os
+import sys
+
+import shapely
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'utilities'))
+
+import places_crawler  # noqa: E402
+
+COUNTIES = ['Adams', 'Allen', 'Bartholomew']
+
+
+class FakeGmaps:
+    """Answers the three googlemaps calls the crawler makes with one place per county."""
+
+    def __init__(self):
+        self.calls = []
+
+    def places(self, query):
+        self.calls.append(('places', query))
+        county = next(county for county in COUNTIES if county in query)
+        index = COUNTIES.index(county)
+        return {'results': [{
+            'place_id': f'place-{county}',
+            'name': f'{county} Pantry',
+            'formatted_address': f'1 Main St, {county} County, IN',
+            'geometry': {'location': {'lat': 40.0 + index, 'lng': -86.0}},
+        }]}
+
+    def place(self, place_id):
+        self.calls.append(('place', place_id))
+        return {'result': {'formatted_phone_number': '(317) 555-0100'}}
+
+    def reverse_geocode(self, latlng):
+        self.calls.append(('reverse_geocode', latlng))
+        county = COUNTIES[int(latlng[0] - 40)]
+        return [{'address_components': [{'types': ['administrative_area_level_2'],
+                                         'long_name': f'{county} County'}]}]
+
+
+def crawl(tmp_path, gmaps, *options):
+    argv = ['--output', str(tmp_path / 'places.json'), '--cache', str(tmp_path / 'cache.sqlite'),
+            '--checkpoints', str(tmp_path / 'checkpoints'), '--workers', '1', '--rate', '0',
+            *options]
+    for county in COUNTIES:
+        argv += ['--county', county]
+    return places_crawler.main('pantries', 'pantry {county} County Indiana', str(tmp_path / 'places.json'),
+                               gmaps, argv)
+
+
+def test_stops_at_max_requests_and_resumes(tmp_path, caplog):
+    caplog.set_level(logging.INFO, logger='places_crawler')
+    gmaps = FakeGmaps()
+
+    # Each county takes three calls, so the budget runs out part way through the second one
+    assert crawl(tmp_path, gmaps, '--reverse-geocode', '--max-requests', '4') is False
+    assert len(gmaps.calls) == 4
+    assert not (tmp_path / 'places.json').exists()
+    assert os.listdir(tmp_path / 'checkpoints' / 'pantries') == ['Adams.json']
+    assert 'Request budget of 4 used up' in caplog.text
+    assert '2 counties not finished (Allen, Bartholomew), run again to resume' in caplog.text
+
+    # The rerun skips Adams and gets Allen's search from the response cache
+    caplog.clear()
+    gmaps = FakeGmaps()
+    assert crawl(tmp_path, gmaps, '--reverse-geocode', '--max-requests', '100') is True
+    assert ('places', 'pantry Adams County Indiana') not in gmaps.calls
+    assert ('places', 'pantry Allen County Indiana') not in gmaps.calls
+    assert len(gmaps.calls) == 5
+    assert '1 counties already done, crawling 2' in caplog.text
+
+    with open(tmp_path / 'places.json', encoding='utf-8') as f:
+        records = json.load(f)
+    assert [record['County'] for record in records] == COUNTIES
+    assert all(record['Phone'] == '(317) 555-0100' for record in records)
+
+
+def test_restart_crawls_everything_again_from_the_cache(tmp_path):
+    assert crawl(tmp_path, FakeGmaps(), '--reverse-geocode') is True
+
+    gmaps = FakeGmaps()
+    assert crawl(tmp_path, gmaps, '--reverse-geocode', '--restart') is True
+    # Every county is crawled again, but every call is answered from the cache
+    assert gmaps.calls == []
+    assert len(os.listdir(tmp_path / 'checkpoints' / 'pantries')) == len(COUNTIES)
+
+
+def test_county_check_uses_the_township_polygons(tmp_path):
+    # Bartholomew's place at latitude 42 sits on its line with Allen, and names differ in case
+    boxes = [('ADAMS', shapely.box(-87, 39.5, -85, 40.5)), ('Allen', shapely.box(-87, 40.5, -85, 42)),
+             ('Bartholomew', shapely.box(-87, 42, -85, 43))]
+    townships = {'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'properties': {'cnty_name': name}, 'geometry': shapely.geometry.mapping(box)}
+        for name, box in boxes]}
+    with open(tmp_path / 'townships.geojson', 'w', encoding='utf-8') as f:
+        json.dump(townships, f)
+
+    gmaps = FakeGmaps()
+    assert crawl(tmp_path, gmaps, '--townships', str(tmp_path / 'townships.geojson')) is True
+    assert not any(call[0] == 'reverse_geocode' for call in gmaps.calls)
+
+    with open(tmp_path / 'places.json', encoding='utf-8') as f:
+        records = json.load(f)
+    assert [record['County'] for record in records] == COUNTIES
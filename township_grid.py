@@ -0,0 +1,159 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+
+import numpy as np
+import shapely
+
+logger = logging.getLogger(__name__)
+
+GRID_VERSION = 1
+DEFAULT_PATH = os.getenv('TOWNSHIP_GRID_PATH', 'cache/township_grid')
+DEFAULT_RESOLUTION = 0.0015  # degrees, roughly 150 m
+
+# Cell values other than a township row index
+OUTSIDE = -1
+BOUNDARY = -2
+
+
+def fingerprint(resolver):
+    """Hashes the township names and bounds so a grid built from other data isn't used."""
+    digest = hashlib.sha1()
+    for county, township, bounds in zip(resolver.counties, resolver.townships, shapely.bounds(resolver.geometries)):
+        digest.update(f"{county}|{township}|{np.round(bounds, 6).tolist()}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def rasterize(resolver, resolution=DEFAULT_RESOLUTION):
+    """Rasterizes the township polygons into a grid of township row indices.
+
+    A cell gets a township's index when the polygon fully contains it, BOUNDARY when any
+    polygon edge crosses it and OUTSIDE when no polygon touches it. Returns (grid, meta).
+    """
+    west, south, east, north = shapely.total_bounds(resolver.geometries)
+    columns = int(np.ceil((east - west) / resolution)) + 1
+    rows = int(np.ceil((north - south) / resolution)) + 1
+    # Indiana has about a thousand townships, so int16 halves the file size
+    dtype = np.int16 if len(resolver) < np.iinfo(np.int16).max else np.int32
+    grid = np.full((rows, columns), OUTSIDE, dtype=dtype)
+    boundary = np.zeros((rows, columns), dtype=bool)
+
+    # Walk backwards so that where polygons overlap the first one wins, like the resolver does.
+    for index in range(len(resolver.geometries) - 1, -1, -1):
+        polygon = resolver.geometries[index]
+        if polygon is None or polygon.is_empty:
+            continue
+        minx, miny, maxx, maxy = polygon.bounds
+        col0 = int((minx - west) // resolution)
+        col1 = int((maxx - west) // resolution)
+        row0 = int((miny - south) // resolution)
+        row1 = int((maxy - south) // resolution)
+        cell_columns, cell_rows = np.meshgrid(np.arange(col0, col1 + 1), np.arange(row0, row1 + 1))
+        cell_columns = cell_columns.ravel()
+        cell_rows = cell_rows.ravel()
+        cell_west = west + cell_columns * resolution
+        cell_south = south + cell_rows * resolution
+        cells = shapely.box(cell_west, cell_south, cell_west + resolution, cell_south + resolution)
+
+        crosses = shapely.intersects(polygon.boundary, cells)
+        boundary[cell_rows[crosses], cell_columns[crosses]] = True
+        inside = ~crosses & shapely.contains_xy(polygon, cell_west + resolution / 2, cell_south + resolution / 2)
+        grid[cell_rows[inside], cell_columns[inside]] = index
+
+    grid[boundary] = BOUNDARY
+
+    meta = {
+        'version': GRID_VERSION,
+        'west': float(west),
+        'south': float(south),
+        'resolution': resolution,
+        'shape': [rows, columns],
+        'townships': len(resolver),
+        'fingerprint': fingerprint(resolver),
+    }
+    inside_state = grid != OUTSIDE
+    boundary_share = np.count_nonzero(grid == BOUNDARY) / max(np.count_nonzero(inside_state), 1)
+    print(f"Built a {rows}x{columns} grid at {resolution} degrees, "
+          f"{boundary_share:.1%} of cells inside Indiana need an exact polygon test")
+    return grid, meta
+
+
+def build_grid(resolver, output_dir=DEFAULT_PATH, resolution=DEFAULT_RESOLUTION):
+    """Rasterizes the townships and saves the grid to output_dir."""
+    grid, meta = rasterize(resolver, resolution)
+    os.makedirs(output_dir, exist_ok=True)
+    np.save(os.path.join(output_dir, 'grid.npy'), grid)
+    with open(os.path.join(output_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+
+class TownshipGrid:
+    """Memory-mapped township grid. Cell lookups are a single array index."""
+
+    def __init__(self, grid, meta):
+        if meta.get('version') != GRID_VERSION:
+            raise ValueError(f"Township grid version {meta.get('version')} is not supported, rebuild it")
+        self.grid = grid
+        self.meta = meta
+        self.west = self.meta['west']
+        self.south = self.meta['south']
+        self.resolution = self.meta['resolution']
+        self.rows, self.columns = self.grid.shape
+
+    @classmethod
+    def open(cls, resolver, grid_dir=DEFAULT_PATH):
+        """Returns the grid if it exists and was built from the same townships, otherwise None."""
+        if not os.path.exists(os.path.join(grid_dir, 'meta.json')):
+            return None
+        with open(os.path.join(grid_dir, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+        grid = cls(np.load(os.path.join(grid_dir, 'grid.npy'), mmap_mode='r'), meta)
+        if not grid.matches(resolver):
+            logger.warning("Township grid in %s was built from different township data, ignoring it", grid_dir)
+            return None
+        return grid
+
+    def matches(self, resolver):
+        """Whether the grid was built from the same townships as the resolver."""
+        return self.meta['townships'] == len(resolver) and self.meta['fingerprint'] == fingerprint(resolver)
+
+    def lookup(self, latitude, longitude):
+        """Returns the township index for the point's cell, OUTSIDE, or BOUNDARY when it needs an exact test."""
+        row = (latitude - self.south) // self.resolution
+        column = (longitude - self.west) // self.resolution
+        # Written so NaN coordinates fail the bounds check
+        if 0 <= row < self.rows and 0 <= column < self.columns:
+            return int(self.grid[int(row), int(column)])
+        return OUTSIDE
+
+    def lookup_many(self, latitudes, longitudes):
+        """Vectorized lookup. NaN coordinates are treated as outside the grid."""
+        latitudes = np.asarray(latitudes, dtype=float)
+        longitudes = np.asarray(longitudes, dtype=float)
+        with np.errstate(invalid='ignore'):
+            rows = np.floor((latitudes - self.south) / self.resolution)
+            columns = np.floor((longitudes - self.west) / self.resolution)
+            valid = (rows >= 0) & (rows < self.rows) & (columns >= 0) & (columns < self.columns)
+        result = np.full(len(latitudes), OUTSIDE, dtype=np.int64)
+        result[valid] = self.grid[rows[valid].astype(np.int64), columns[valid].astype(np.int64)]
+        return result
+
+
+def main():
+    import geopandas as gpd
+    from township_resolver import TownshipResolver
+
+    parser = argparse.ArgumentParser(description='Build the township lookup grid.')
+    parser.add_argument('--townships', default='static/utilities/data/indiana_townships.geojson')
+    parser.add_argument('--output', default=DEFAULT_PATH)
+    parser.add_argument('--resolution', type=float, default=DEFAULT_RESOLUTION, help='Cell size in degrees')
+    args = parser.parse_args()
+
+    resolver = TownshipResolver.from_geodataframe(gpd.read_file(args.townships))
+    build_grid(resolver, args.output, args.resolution)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+import numpy as np
+import shapely
+from shapely import STRtree
+
+from township_grid import BOUNDARY
+
+
+class TownshipResolver:
+    """Resolves coordinates to a (county, township) pair using an STRtree over the township polygons.
+
+    The tree does a bounding-box prefilter and the exact point-in-polygon test only runs
+    against the handful of candidate polygons, which are prepared once up front.
+    """
+
+    def __init__(self, geometries, counties, townships):
+        self.geometries = np.asarray(geometries, dtype=object)
+        self.counties = np.asarray(counties, dtype=object)
+        self.townships = np.asarray(townships, dtype=object)
+        shapely.prepare(self.geometries)
+        self.tree = STRtree(self.geometries)
+        self.grid = None
+
+    @classmethod
+    def from_geodataframe(cls, township_gdf):
+        """Builds a resolver from the townships GeoDataFrame loaded by the app."""
+        return cls(
+            township_gdf.geometry.to_numpy(),
+            township_gdf['cnty_name'].to_numpy(dtype=object),
+            township_gdf['tl_2021_18_cousub_namelsad'].to_numpy(dtype=object),
+        )
+
+    def __len__(self):
+        return len(self.geometries)
+
+    def use_grid(self, grid):
+        """Answers lookups from a precomputed TownshipGrid, only testing polygons for boundary cells."""
+        self.grid = grid
+
+    def locate(self, latitude, longitude):
+        """Returns the row index of the township containing the point, or -1 if there is none."""
+        if self.grid is not None:
+            index = self.grid.lookup(latitude, longitude)
+            if index != BOUNDARY:
+                return index
+        candidates = self.tree.query(shapely.Point(longitude, latitude), predicate='within')
+        if len(candidates) == 0:
+            return -1
+        # The old iterrows scan returned the first row that matched, so keep that tie-break.
+        return int(candidates.min())
+
+    def locate_many(self, latitudes, longitudes):
+        """Vectorized form of locate. Returns an int array of row indices, -1 where nothing matched."""
+        latitudes = np.asarray(latitudes, dtype=float)
+        longitudes = np.asarray(longitudes, dtype=float)
+        if self.grid is None:
+            return self.query_tree(latitudes, longitudes)
+        result = self.grid.lookup_many(latitudes, longitudes)
+        boundary = result == BOUNDARY
+        if boundary.any():
+            result[boundary] = self.query_tree(latitudes[boundary], longitudes[boundary])
+        return result
+
+    def query_tree(self, latitudes, longitudes):
+        points = shapely.points(longitudes, latitudes)
+        point_index, geometry_index = self.tree.query(points, predicate='within')
+        result = np.full(len(points), len(self.geometries), dtype=np.int64)
+        np.minimum.at(result, point_index, geometry_index)
+        result[result == len(self.geometries)] = -1
+        return result
+
+    def resolve(self, latitude, longitude):
+        """Returns (cnty_name, tl_2021_18_cousub_namelsad) for the point, or (None, None)."""
+        index = self.locate(latitude, longitude)
+        if index < 0:
+            return None, None
+        return self.counties[index], self.townships[index]
+
+    def resolve_many(self, latitudes, longitudes):
+        """Resolves many points at once. Returns a list of (county, township) tuples."""
+        return [
+            (self.counties[index], self.townships[index]) if index >= 0 else (None, None)
+            for index in self.locate_many(latitudes, longitudes)
+        ]
@@ -1,32 +1,154 @@
 #finds what counties and townships are missing data in our trustee file
+#
+# A township counts as covered when some trustee in the same county has a name starting with
+# the township name. Trustee names are indexed per county in sorted order, so each check is a
+# binary search instead of a scan of every trustee.
+#
+# The results are saved to a state file with a hash of each county's trustees. A rerun only
+# re-checks townships that are new or whose county's trustees changed. It writes
+# missing_offices.json/.txt as before, plus audit_diff.json listing the townships that are
+# newly missing and newly fixed since the last run.
+import argparse
+import bisect
+import hashlib
 import json
 import os
+import sys
 from collections import defaultdict
 
+HERE = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(HERE, '..', 'static', 'utilities', 'data')
+TOWNSHIP_FILE = os.path.join(DATA_DIR, 'indiana_townships.geojson')
+TRUSTEE_FILE = os.path.join(DATA_DIR, 'indiana_township_trustees.json')
+STATE_FILE = os.path.join(HERE, 'audit_state.json')
+
+STATE_VERSION = 1
+UNDEFINED_TOWNSHIP = "County Subdivisions Not Defined"
+
+
 # Load data
 def load_json(file_path):
     with open(file_path, 'r') as file:
         return json.load(file)
 
-geojson_data = load_json('../static/utilities/data/indiana_townships.geojson')
-trustee_data = load_json('../static/utilities/data/indiana_township_trustees.json')
 
-# Cross-referencing and logging missing data
-missing_offices = []
-plain_text_missing_offices = []
+def load_townships(file_path):
+    """Returns (key, county, township) for each feature, in file order.
+
+    The key is county|township|n, where n counts earlier features with the same names, so
+    a township split across several features is still audited once per feature like before.
+    """
+    seen = defaultdict(int)
+    townships = []
+    for feature in load_json(file_path)['features']:
+        township_name = feature['properties']['tl_2021_18_cousub_namelsad'].replace(' Township', '')
+        county_name = feature['properties']['cnty_name']
+        occurrence = seen[county_name, township_name]
+        seen[county_name, township_name] += 1
+        townships.append((f"{county_name}|{township_name}|{occurrence}", county_name, township_name))
+    return townships
+
+
+def record_hash(county, name):
+    return hashlib.sha1(f"{county}\0{name}".encode('utf-8')).hexdigest()
+
+
+class TrusteeIndex:
+    """Trustee names per lowercased county, sorted for prefix lookups, with a hash per county."""
+
+    def __init__(self, trustee_data):
+        names = defaultdict(list)
+        hashes = defaultdict(list)
+        for trustee in trustee_data:
+            county = trustee['County'].lower()
+            names[county].append(trustee['Name'].lower())
+            # Only the fields the audit reads go into the hash, so e.g. a phone number change
+            # doesn't cause a re-check
+            hashes[county].append(record_hash(trustee['County'], trustee['Name']))
+        self.names = {county: sorted(values) for county, values in names.items()}
+        self.county_hashes = {
+            county: hashlib.sha1(''.join(sorted(values)).encode('utf-8')).hexdigest()
+            for county, values in hashes.items()
+        }
+
+    def has_trustee(self, county, township):
+        """Whether a trustee in the county has a name starting with the township name."""
+        names = self.names.get(county.lower(), [])
+        prefix = township.lower()
+        position = bisect.bisect_left(names, prefix)
+        return position < len(names) and names[position].startswith(prefix)
+
+
+def load_state(file_path):
+    try:
+        state = load_json(file_path)
+    except (FileNotFoundError, ValueError):
+        return None
+    return state if state.get('version') == STATE_VERSION else None
 
-missing_townships_count = 0
-missing_counties = defaultdict(list)
 
-for feature in geojson_data['features']:
-    township_name = feature['properties']['tl_2021_18_cousub_namelsad'].replace(' Township', '')
-    county_name = feature['properties']['cnty_name']
+def audit(townships, index, previous=None):
+    """Checks every township, reusing results from the previous run where nothing changed.
 
-    # Check if the township exists in the trustee data
-    if not any(trustee['Name'].lower().startswith(township_name.lower()) and trustee['County'].lower() == county_name.lower() for trustee in trustee_data):
-        if township_name == "County Subdivisions Not Defined":
+    Returns (missing keys in file order, state for the next run, number of townships re-checked).
+    """
+    previous_missing = set(previous['missing']) if previous else set()
+    previous_keys = set(previous['townships']) if previous else set()
+    previous_hashes = previous['county_hashes'] if previous else {}
+    changed_counties = {
+        county for county in set(previous_hashes) | set(index.county_hashes)
+        if previous_hashes.get(county) != index.county_hashes.get(county)
+    }
+
+    missing = []
+    rechecked = 0
+    for key, county, township in townships:
+        if township == UNDEFINED_TOWNSHIP:
             continue
+        if key in previous_keys and county.lower() not in changed_counties:
+            is_missing = key in previous_missing
+        else:
+            is_missing = not index.has_trustee(county, township)
+            rechecked += 1
+        if is_missing:
+            missing.append(key)
+
+    state = {
+        'version': STATE_VERSION,
+        'townships': [key for key, _, township in townships if township != UNDEFINED_TOWNSHIP],
+        'county_hashes': index.county_hashes,
+        'missing': missing,
+    }
+    return missing, state, rechecked
+
+
+def split_key(key):
+    county, township, _ = key.split('|')
+    return {"County": county, "Township": township}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Find townships that have no trustee in the trustee data.')
+    parser.add_argument('--townships', default=TOWNSHIP_FILE)
+    parser.add_argument('--trustees', default=TRUSTEE_FILE)
+    parser.add_argument('--output-dir', default=HERE, help='Where to write missing_offices.json/.txt and audit_diff.json')
+    parser.add_argument('--state', default=STATE_FILE, help='Results of the previous run')
+    parser.add_argument('--full', action='store_true', help='Ignore the previous run and check every township')
+    parser.add_argument('--fail-on-new', action='store_true', help='Exit with status 1 if any township is newly missing')
+    args = parser.parse_args()
+
+    townships = load_townships(args.townships)
+    index = TrusteeIndex(load_json(args.trustees))
+    previous = None if args.full else load_state(args.state)
+    missing, state, rechecked = audit(townships, index, previous)
 
+    # Cross-referencing and logging missing data
+    missing_offices = []
+    plain_text_missing_offices = []
+    missing_counties = defaultdict(list)
+    for key in missing:
+        names = split_key(key)
+        county_name, township_name = names["County"], names["Township"]
         missing_office = {
             "County": county_name,
             "Name": f"{township_name} Township Trustee",
@@ -39,24 +161,50 @@ for feature in geojson_data['features']:
         }
         missing_offices.append(missing_office)
         plain_text_missing_offices.append(f"County: {county_name}, Township: {township_name}")
-        missing_townships_count += 1
         missing_counties[county_name].append(township_name)
 
-# Save missing offices to JSON
-with open('missing_offices.json', 'w', encoding='utf-8') as json_file:
-    json.dump(missing_offices, json_file, ensure_ascii=False, indent=4)
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    # Save missing offices to JSON
+    with open(os.path.join(args.output_dir, 'missing_offices.json'), 'w', encoding='utf-8') as json_file:
+        json.dump(missing_offices, json_file, ensure_ascii=False, indent=4)
+
+    # Save missing offices to plaintext file
+    with open(os.path.join(args.output_dir, 'missing_offices.txt'), 'w', encoding='utf-8') as text_file:
+        for line in plain_text_missing_offices:
+            text_file.write(line + '\n')
+
+    # Save what changed since the last run
+    before = set(previous['missing']) if previous else set()
+    after = set(missing)
+    diff = {
+        'previous_run': previous is not None,
+        'missing_count': len(missing),
+        'rechecked_townships': rechecked,
+        'newly_missing': [split_key(key) for key in missing if key not in before],
+        'newly_fixed': [split_key(key) for key in previous['missing'] if key not in after] if previous else [],
+    }
+    with open(os.path.join(args.output_dir, 'audit_diff.json'), 'w', encoding='utf-8') as diff_file:
+        json.dump(diff, diff_file, ensure_ascii=False, indent=4)
+
+    with open(args.state, 'w', encoding='utf-8') as state_file:
+        json.dump(state, state_file)
+
+    # Print summary information
+    print(f"Total missing townships: {len(missing)}")
+    print(f"Total affected counties: {len(missing_counties)}")
+    print("Affected counties and their missing townships:")
+
+    for county, townships_missing in missing_counties.items():
+        print(f"{county}: {', '.join(townships_missing)}")
 
-# Save missing offices to plaintext file
-with open('missing_offices.txt', 'w', encoding='utf-8') as text_file:
-    for line in plain_text_missing_offices:
-        text_file.write(line + '\n')
+    print("Missing offices have been logged.")
+    print(f"Re-checked {rechecked} townships; {len(diff['newly_missing'])} newly missing, "
+          f"{len(diff['newly_fixed'])} newly fixed since the last run.")
 
-# Print summary information
-print(f"Total missing townships: {missing_townships_count}")
-print(f"Total affected counties: {len(missing_counties)}")
-print("Affected counties and their missing townships:")
+    if args.fail_on_new and diff['newly_missing']:
+        sys.exit(1)
 
-for county, townships in missing_counties.items():
-    print(f"{county}: {', '.join(townships)}")
 
-print("Missing offices have been logged.")
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,13 @@
 import osmium as osm
+import argparse
+import csv
 import json
+import os
+import resource
+import shutil
+from multiprocessing import Pool
+
+FIELDS = ['type', 'id', 'latitude', 'longitude', 'housenumber', 'street', 'city', 'state', 'postcode']
 
 class AddressHandler(osm.SimpleHandler):
     def __init__(self):
@@ -35,10 +43,156 @@ class AddressHandler(osm.SimpleHandler):
             }
             self.addresses.append(address)
 
+class NdjsonWriter:
+    """Writes one JSON address record per line."""
+    def __init__(self, f):
+        self.f = f
+
+    def write_header(self):
+        pass
+
+    def write(self, address):
+        self.f.write(json.dumps(address) + '\n')
+
+class CsvWriter:
+    """Writes address records as CSV columns, with empty cells for missing values."""
+    def __init__(self, f):
+        self.writer = csv.DictWriter(f, fieldnames=FIELDS)
+
+    def write_header(self):
+        self.writer.writeheader()
+
+    def write(self, address):
+        self.writer.writerow(address)
+
+WRITERS = {
+    'ndjson': NdjsonWriter,
+    'csv': CsvWriter,
+}
+
+def way_centroid(w):
+    """Returns the mean (lat, lon) of a way's node locations, or (None, None) if none are known."""
+    nodes = list(w.nodes)
+    # Closed ways repeat their first node at the end, don't count it twice
+    if len(nodes) > 1 and nodes[0].ref == nodes[-1].ref:
+        nodes = nodes[:-1]
+    latitudes = []
+    longitudes = []
+    for n in nodes:
+        if n.location.valid():
+            latitudes.append(n.location.lat)
+            longitudes.append(n.location.lon)
+    if not latitudes:
+        return None, None
+    return sum(latitudes) / len(latitudes), sum(longitudes) / len(longitudes)
+
+class StreamingAddressHandler(osm.SimpleHandler):
+    """Writes each address as soon as it's seen instead of keeping them all in memory.
+
+    Ways are written with the centroid of their nodes, which needs the file to be applied
+    with locations=True. With workers > 1 each process only handles the objects whose
+    id % workers == worker. Every worker still reads the whole file and builds its own
+    node location index, so workers split the record building and writing, not the parse.
+    """
+    def __init__(self, writer, worker=0, workers=1):
+        osm.SimpleHandler.__init__(self)
+        self.writer = writer
+        self.worker = worker
+        self.workers = workers
+        self.count = 0
+        self.missing_locations = 0
+
+    def write(self, obj, kind, latitude, longitude):
+        self.writer.write({
+            'type': kind,
+            'id': obj.id,
+            'latitude': latitude,
+            'longitude': longitude,
+            'housenumber': obj.tags.get('addr:housenumber'),
+            'street': obj.tags.get('addr:street'),
+            'city': obj.tags.get('addr:city'),
+            'state': obj.tags.get('addr:state'),
+            'postcode': obj.tags.get('addr:postcode')
+        })
+        self.count += 1
+
+    def node(self, n):
+        if n.id % self.workers == self.worker and 'addr:street' in n.tags:
+            self.write(n, 'node', n.location.lat, n.location.lon)
+
+    def way(self, w):
+        if w.id % self.workers == self.worker and 'addr:street' in w.tags:
+            latitude, longitude = way_centroid(w)
+            if latitude is None:
+                self.missing_locations += 1
+                return
+            self.write(w, 'way', latitude, longitude)
+
 def save_addresses_to_json(addresses, filename):
     with open(filename, 'w') as f:
         json.dump(addresses, f, indent=4)
 
+def peak_memory_mb():
+    """Returns the peak RSS of this process and of its largest finished child, in MB."""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux
+    return own / 1024, children / 1024
+
+def extract_part(osm_file, output_file, output_format, worker, workers, location_index):
+    """Streams one worker's share of the addresses to output_file. Returns (written, missing locations)."""
+    with open(output_file, 'w', encoding='utf-8', newline='') as f:
+        writer = WRITERS[output_format](f)
+        if worker == 0:
+            writer.write_header()
+        handler = StreamingAddressHandler(writer, worker, workers)
+        # Only hand objects with a house number to Python, everything else stays in C++
+        handler.apply_file(osm_file, locations=True, idx=location_index,
+                           filters=[osm.filter.KeyFilter('addr:housenumber')])
+    return handler.count, handler.missing_locations
+
+def worker_location_index(location_index, worker):
+    """Gives each worker its own file for a file-based index ('dense_file_array,nodes.idx'), so they
+    don't all write the same one. Returns (index, file to remove afterwards or None)."""
+    kind, _, path = location_index.partition(',')
+    if not path:
+        return location_index, None
+    path = f"{path}.worker{worker}"
+    return f"{kind},{path}", path
+
+def extract_streaming(osm_file, output_file, output_format='ndjson', workers=1, location_index='flex_mem'):
+    """Extracts addresses to NDJSON or CSV with bounded memory, optionally across worker processes.
+
+    Each worker parses the whole file and keeps a full node location index of its own, so
+    workers don't shorten the parse and need workers times the index memory (or disk).
+    """
+    if workers == 1:
+        results = [extract_part(osm_file, output_file, output_format, 0, 1, location_index)]
+    else:
+        part_files = [f"{output_file}.part{worker}" for worker in range(workers)]
+        indexes = [worker_location_index(location_index, worker) for worker in range(workers)]
+        jobs = [(osm_file, part_files[worker], output_format, worker, workers, indexes[worker][0])
+                for worker in range(workers)]
+        try:
+            with Pool(workers) as pool:
+                results = pool.starmap(extract_part, jobs)
+        finally:
+            for _, index_file in indexes:
+                if index_file and os.path.exists(index_file):
+                    os.remove(index_file)
+        with open(output_file, 'wb') as out:
+            for part_file in part_files:
+                with open(part_file, 'rb') as part:
+                    shutil.copyfileobj(part, out)
+                os.remove(part_file)
+
+    written = sum(result[0] for result in results)
+    missing = sum(result[1] for result in results)
+    own_mb, worker_mb = peak_memory_mb()
+    print(f"Extracted {written} addresses and saved to {output_file}")
+    print(f"Skipped {missing} ways with no known node locations")
+    print(f"Peak memory: {own_mb:.1f} MB main process, {worker_mb:.1f} MB largest worker")
+
 def main(osm_file, output_file):
     handler = AddressHandler()
     handler.apply_file(osm_file)
@@ -47,6 +201,21 @@ def main(osm_file, output_file):
     print(f"Extracted {len(handler.addresses)} addresses and saved to {output_file}")
 
 if __name__ == "__main__":
-    osm_file = "data/indiana.pbf"  # Update this to the correct path
-    output_file = "data/indiana_addresses2.json"
-    main(osm_file, output_file)
+    parser = argparse.ArgumentParser(description='Extract addresses from an OSM PBF file.')
+    parser.add_argument('osm_file', nargs='?', default="data/indiana.pbf")
+    parser.add_argument('output_file', nargs='?', default="data/indiana_addresses2.json")
+    parser.add_argument('--format', choices=['json', 'ndjson', 'csv'],
+                        help='Output format. json keeps everything in memory, ndjson and csv stream. '
+                             'Defaults to the output file extension.')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Worker processes for streaming formats. Each one parses the whole file with its own '
+                             'node location index, so this splits the record writing, not the parse time or memory')
+    parser.add_argument('--location-index', default='flex_mem',
+                        help="osmium node location index, e.g. 'dense_file_array,data/nodes.idx' to keep it on disk")
+    args = parser.parse_args()
+
+    output_format = args.format or os.path.splitext(args.output_file)[1].lstrip('.').lower()
+    if output_format in WRITERS:
+        extract_streaming(args.osm_file, args.output_file, output_format, args.workers, args.location_index)
+    else:
+        main(args.osm_file, args.output_file)
@@ -0,0 +1,72 @@
+#answers "which indiana county is this point in" locally, from the township polygons
+#
+# The townships are dissolved by cnty_name into one polygon per county and put in an STRtree,
+# so checking a place's county is a tree query instead of a reverse_geocode API call.
+# counties_at() and in_county() check a whole page of search results in one call.
+import os
+import sys
+
+import numpy as np
+import shapely
+
+# County names are matched the way the app's data_store.py matches them
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from data_store import normalize  # noqa: E402
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TOWNSHIP_FILE = os.path.join(HERE, '..', 'static', 'utilities', 'data', 'indiana_townships.geojson')
+
+
+class CountyResolver:
+    """County polygons in an STRtree."""
+
+    def __init__(self, geometries, names):
+        self.geometries = np.asarray(geometries)
+        self.names = np.asarray(names, dtype=object)
+        self.keys = np.array([normalize(name) for name in names], dtype=object)
+        shapely.prepare(self.geometries)
+        self.tree = shapely.STRtree(self.geometries)
+
+    @classmethod
+    def from_geojson(cls, township_file=TOWNSHIP_FILE):
+        """Dissolves the township polygons into counties."""
+        import geopandas as gpd
+
+        counties = gpd.read_file(township_file)[['cnty_name', 'geometry']].dissolve(by='cnty_name')
+        return cls(counties.geometry.values, counties.index.values)
+
+    def counties_at(self, latitudes, longitudes):
+        """Vectorized lookup: the county name for each point, or None outside every county.
+
+        Points on a county line count as inside (the first county in name order wins;
+        in_county() counts them for both).
+        """
+        latitudes = np.asarray(latitudes, dtype=float)
+        longitudes = np.asarray(longitudes, dtype=float)
+        result = np.full(len(latitudes), None, dtype=object)
+        if len(latitudes) == 0:
+            return result
+        point_indices, county_indices = self.tree.query(
+            shapely.points(longitudes, latitudes), predicate='intersects')
+        # Walk backwards so that for a point on a border the lowest county index is written last
+        order = np.argsort(county_indices, kind='stable')[::-1]
+        result[point_indices[order]] = self.names[county_indices[order]]
+        return result
+
+    def county_at(self, latitude, longitude):
+        return self.counties_at([latitude], [longitude])[0]
+
+    def in_county(self, latitudes, longitudes, county_name):
+        """Boolean mask of the points inside the named county, ignoring case and spacing.
+
+        A point on a county line is inside both counties.
+        """
+        latitudes = np.asarray(latitudes, dtype=float)
+        longitudes = np.asarray(longitudes, dtype=float)
+        inside = np.zeros(len(latitudes), dtype=bool)
+        if len(latitudes) == 0:
+            return inside
+        point_indices, county_indices = self.tree.query(
+            shapely.points(longitudes, latitudes), predicate='intersects')
+        inside[point_indices[self.keys[county_indices] == normalize(county_name)]] = True
+        return inside
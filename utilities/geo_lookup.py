@@ -4,79 +4,93 @@ import json
 import geopandas as gpd
 import re
 import os
-from math import radians, cos, sin, asin, sqrt
+import sys
 from collections import defaultdict
-import geopy.distance
+import numpy as np
+import shapely
 
-# Function to load and group addresses
+# The street keys, house number parsing and interpolation are shared with the app's local_geocoder.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from local_geocoder import MAX_NUMBER_GAP, interpolate_number, parse_house_number, street_keys  # noqa: E402
+from nearest import haversine_km  # noqa: E402
+
+# Function to load addresses
 def load_addresses(json_file):
     with open(json_file, 'r') as f:
         return json.load(f)
 
-def group_by_street(addresses):
-    grouped = defaultdict(list)
-    for addr in addresses:
-        if addr.get('street'):
-            grouped[addr['street'].lower()].append(addr)
-    return grouped
-
-def find_best_match(address, street_data):
-    housenumber = int(re.search(r'\d+', address['housenumber']).group())
-    candidates = []
-    for addr in street_data:
-        if addr['housenumber']:
-            try:
-                num = int(re.search(r'\d+', addr['housenumber']).group())
-                candidates.append((addr, num))
-            except ValueError:
+class StreetIndex:
+    """House numbers and coordinates for every street, parsed and sorted once.
+
+    Streets are keyed like local_geocoder.py's index, by street and ZIP code and by street
+    and city, so the same street name in two towns is never mixed. Each key is stored as
+    sorted NumPy arrays of house numbers, latitudes and longitudes, so a lookup is a binary
+    search plus linear interpolation.
+    """
+    def __init__(self, addresses):
+        grouped = defaultdict(list)
+        for addr in addresses:
+            number = parse_house_number(addr.get('housenumber'))
+            if number is None or not addr.get('street') or addr.get('latitude') is None or addr.get('longitude') is None:
                 continue
-
-    if not candidates:
-        return None
-
-    candidates.sort(key=lambda x: abs(x[1] - housenumber))
-    best_match = candidates[0][0]
-    
-    return best_match
-
-def interpolate_coordinates(address, street_data):
-    best_match = find_best_match(address, street_data)
-    if not best_match:
+            for key in street_keys(addr['street'], addr.get('city'), addr.get('postcode')):
+                grouped[key].append((number, addr['latitude'], addr['longitude']))
+
+        self.streets = {}
+        for key, rows in grouped.items():
+            rows = np.array(sorted(rows, key=lambda row: row[0]), dtype=float)
+            # np.interp needs strictly increasing house numbers, keep the first point for each
+            numbers, first = np.unique(rows[:, 0], return_index=True)
+            self.streets[key] = (numbers, rows[first, 1], rows[first, 2])
+
+    def interpolate(self, street, housenumber, city=None, postcode=None):
+        """Returns (lat, lon) for a house number on a street, or (None, None) if it isn't known.
+
+        Numbers up to MAX_NUMBER_GAP past either end of the street get the coordinates of the nearest end.
+        """
+        for key in street_keys(street, city, postcode):
+            arrays = self.streets.get(key)
+            if arrays is None:
+                continue
+            result = interpolate_number(*arrays, housenumber)
+            if result is not None:
+                return result[0], result[1]
         return None, None
 
-    housenumber = int(re.search(r'\d+', address['housenumber']).group())
-    match_housenumber = int(re.search(r'\d+', best_match['housenumber']).group())
-    
-    if housenumber == match_housenumber:
-        return best_match['latitude'], best_match['longitude']
-
-    # Find nearest points for interpolation
-    sorted_addresses = sorted(street_data, key=lambda x: int(re.search(r'\d+', x['housenumber']).group()))
-    prev_point = None
-    next_point = None
-
-    for addr in sorted_addresses:
-        num = int(re.search(r'\d+', addr['housenumber']).group())
-        if num <= housenumber:
-            prev_point = addr
-        if num >= housenumber and next_point is None:
-            next_point = addr
-
-    if not prev_point or not next_point or prev_point == next_point:
-        return best_match['latitude'], best_match['longitude']
-
-    # Interpolation
-    prev_coords = (prev_point['latitude'], prev_point['longitude'])
-    next_coords = (next_point['latitude'], next_point['longitude'])
-    
-    total_distance = geopy.distance.distance(prev_coords, next_coords).meters
-    distance_to_prev = geopy.distance.distance(prev_coords, (best_match['latitude'], best_match['longitude'])).meters
-    fraction = distance_to_prev / total_distance
-
-    interpolated_lat = prev_coords[0] + fraction * (next_coords[0] - prev_coords[0])
-    interpolated_lon = prev_coords[1] + fraction * (next_coords[1] - prev_coords[1])
-
-    return interpolated_lat, interpolated_lon
+    def interpolate_many(self, streets, housenumbers, cities=None, postcodes=None):
+        """Vectorized interpolate for a batch of addresses. Unknown addresses give NaN."""
+        housenumbers = np.asarray(housenumbers, dtype=float)
+        latitudes = np.full(len(housenumbers), np.nan)
+        longitudes = np.full(len(housenumbers), np.nan)
+        cities = cities if cities is not None else [None] * len(housenumbers)
+        postcodes = postcodes if postcodes is not None else [None] * len(housenumbers)
+        keys = [street_keys(street, city, postcode) for street, city, postcode in zip(streets, cities, postcodes)]
+
+        # ZIP code keys first, then city keys for the addresses still without coordinates
+        for level in range(2):
+            by_key = defaultdict(list)
+            for position, address_keys in enumerate(keys):
+                if level < len(address_keys) and np.isnan(latitudes[position]):
+                    by_key[address_keys[level]].append(position)
+            for key, positions in by_key.items():
+                arrays = self.streets.get(key)
+                if arrays is None:
+                    continue
+                numbers, street_latitudes, street_longitudes = arrays
+                positions = np.array(positions)
+                numbers_here = housenumbers[positions]
+                positions = positions[(numbers_here >= numbers[0] - MAX_NUMBER_GAP) &
+                                      (numbers_here <= numbers[-1] + MAX_NUMBER_GAP)]
+                latitudes[positions] = np.interp(housenumbers[positions], numbers, street_latitudes)
+                longitudes[positions] = np.interp(housenumbers[positions], numbers, street_longitudes)
+        return latitudes, longitudes
+
+def interpolate_coordinates(address, street_index):
+    """Estimates (lat, lon) for an address dict with 'housenumber', 'street', 'city' and 'postcode' keys."""
+    housenumber = parse_house_number(address['housenumber'])
+    if housenumber is None:
+        return None, None
+    return street_index.interpolate(address['street'], housenumber, address.get('city'), address.get('postcode'))
 
 def geocode_address(address):
     """Geocodes an address using the OpenCage Geocoding API."""
@@ -98,11 +112,113 @@ def geocode_address(address):
         return None, None, None
 
 def load_tiger_shapefile(shapefile_path):
-    """Load the TIGER/Line shapefile."""
-    return gpd.read_file(shapefile_path)
-
-def estimate_coordinates_from_address_range(address, tiger_df):
-    """Estimate coordinates for an address using TIGER/Line address ranges."""
+    """Load the TIGER/Line address range shapefile into a TigerIndex."""
+    return TigerIndex(gpd.read_file(shapefile_path))
+
+def normalize_street_name(name):
+    return ' '.join(re.sub(r'[^\w\s]', ' ', name.lower()).split())
+
+# Parity codes used in the TigerIndex arrays
+PARITY_BOTH, PARITY_ODD, PARITY_EVEN = 0, 1, 2
+
+class TigerIndex:
+    """TIGER/Line address ranges, loaded once into a name index and NumPy arrays.
+
+    Every side (left/right) of every edge with a numeric range becomes one row of
+    from/to house number, parity and zip arrays pointing at the edge's line, so a
+    lookup only looks at the edges of one street.
+    """
+    def __init__(self, tiger_df):
+        self.lines = []
+        name_rows = defaultdict(list)
+        from_numbers, to_numbers, parities, zips, edges = [], [], [], [], []
+
+        def column(name):
+            return tiger_df[name] if name in tiger_df else [None] * len(tiger_df)
+
+        left_sides = zip(column('LFROMHN'), column('LTOHN'), column('PARITYL'), column('ZIPL'))
+        right_sides = zip(column('RFROMHN'), column('RTOHN'), column('PARITYR'), column('ZIPR'))
+        for fullname, geometry, left_side, right_side in zip(tiger_df['FULLNAME'], tiger_df.geometry, left_sides, right_sides):
+            if not isinstance(fullname, str) or geometry is None or geometry.is_empty:
+                continue
+            if geometry.geom_type == 'MultiLineString':
+                geometry = shapely.line_merge(geometry)
+                if geometry.geom_type == 'MultiLineString':
+                    geometry = max(geometry.geoms, key=lambda part: part.length)
+            edge = len(self.lines)
+            key = normalize_street_name(fullname)
+            added = False
+
+            for from_hn, to_hn, parity, zipcode in (left_side, right_side):
+                from_number = parse_house_number(from_hn) if isinstance(from_hn, str) else None
+                to_number = parse_house_number(to_hn) if isinstance(to_hn, str) else None
+                if from_number is None or to_number is None:
+                    continue
+                if parity == 'O':
+                    parity_code = PARITY_ODD
+                elif parity == 'E':
+                    parity_code = PARITY_EVEN
+                elif parity == 'B' or from_number % 2 != to_number % 2:
+                    parity_code = PARITY_BOTH
+                else:
+                    parity_code = PARITY_ODD if from_number % 2 else PARITY_EVEN
+                name_rows[key].append(len(from_numbers))
+                from_numbers.append(from_number)
+                to_numbers.append(to_number)
+                parities.append(parity_code)
+                zips.append(zipcode if isinstance(zipcode, str) else '')
+                edges.append(edge)
+                added = True
+
+            if added:
+                self.lines.append(geometry)
+
+        self.from_numbers = np.array(from_numbers, dtype=np.int64)
+        self.to_numbers = np.array(to_numbers, dtype=np.int64)
+        self.low = np.minimum(self.from_numbers, self.to_numbers)
+        self.high = np.maximum(self.from_numbers, self.to_numbers)
+        self.parities = np.array(parities, dtype=np.int8)
+        self.zips = np.array(zips, dtype=object)
+        self.edges = np.array(edges, dtype=np.int64)
+        self.names = {key: np.array(rows, dtype=np.int64) for key, rows in name_rows.items()}
+
+    def find_rows(self, street):
+        """Returns the range rows for a street, matching the old substring search if there's no exact name."""
+        key = normalize_street_name(street)
+        rows = self.names.get(key)
+        if rows is not None:
+            return rows
+        matches = [self.names[name] for name in self.names if key in name]
+        return np.concatenate(matches) if matches else None
+
+    def locate(self, housenumber, street, zipcode=None):
+        """Returns (lat, lon) interpolated along the edge whose range holds the house number, or None."""
+        rows = self.find_rows(street)
+        if rows is None:
+            return None
+        parity = PARITY_ODD if housenumber % 2 else PARITY_EVEN
+        in_range = (self.low[rows] <= housenumber) & (housenumber <= self.high[rows])
+        parity_ok = (self.parities[rows] == PARITY_BOTH) | (self.parities[rows] == parity)
+        candidates = rows[in_range & parity_ok]
+        if zipcode and len(candidates):
+            same_zip = candidates[self.zips[candidates] == zipcode]
+            if len(same_zip):
+                candidates = same_zip
+        if not len(candidates):
+            return None
+
+        row = candidates[0]
+        from_number, to_number = self.from_numbers[row], self.to_numbers[row]
+        # Ranges run in the direction the line was digitized, so this works when from > to too
+        fraction = 0.5 if from_number == to_number else (housenumber - from_number) / (to_number - from_number)
+        point = self.lines[self.edges[row]].interpolate(fraction, normalized=True)
+        return point.y, point.x
+
+def estimate_coordinates_from_address_range(address, tiger_index):
+    """Estimate coordinates for an address using TIGER/Line address ranges.
+
+    tiger_index is the TigerIndex returned by load_tiger_shapefile.
+    """
     match = re.search(r"(\d+)\s+(.*),\s*([\w\s]+),\s*(\w{2})\s*(\d{5})?", address)
     if not match:
         return None, None, None
@@ -113,27 +229,11 @@ def estimate_coordinates_from_address_range(address, tiger_df):
     state = match.group(4)
     zipcode = match.group(5)
 
-    # Filter TIGER/Line data for the relevant street
-    street_data = tiger_df[tiger_df['FULLNAME'].str.lower().str.contains(street)]
-    
-    if street_data.empty:
+    # Find the edge whose address range holds the house number and interpolate along it
+    location = tiger_index.locate(housenumber, street, zipcode)
+    if location is None:
         return None, None, None
-
-    # Using the first match for simplicity
-    row = street_data.iloc[0]
-    line = row['geometry']
-    point = line.interpolate(0.5, normalized=True)  # Approximate midpoint of the line
-    return point.y, point.x, state
-
-def haversine_distance(lat1, lon1, lat2, lon2):
-    """Calculate the great circle distance between two points on the earth."""
-    R = 6371  # Radius of earth in kilometers. Use 3956 for miles
-    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-    dlon = lon2 - lon1 
-    dlat = lat2 - lat1 
-    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-    c = 2 * asin(sqrt(a)) 
-    return R * c
+    return location[0], location[1], state
 
 def get_township_from_geojson(latitude, longitude, geojson_file):
     """Determines the township from a GeoJSON file."""
@@ -148,8 +248,11 @@ def get_township_from_geojson(latitude, longitude, geojson_file):
         return None
     return None
 
-def get_trustee_info_geojson(address, township_data_file, geojson_file, osm_addresses_file):
-    """Determines the township trustee using local GeoJSON data and OSM addresses."""
+def get_trustee_info_geojson(address, township_data_file, geojson_file, osm_addresses_file, street_index=None):
+    """Determines the township trustee using local GeoJSON data and OSM addresses.
+
+    Pass a prebuilt StreetIndex when looking up many addresses so the OSM data is only loaded once.
+    """
     try:
         with open(township_data_file, 'r') as f:
             township_data = json.load(f)
@@ -171,26 +274,27 @@ def get_trustee_info_geojson(address, township_data_file, geojson_file, osm_addr
     if state.upper() != 'IN':
         return "Address is outside of Indiana. This service only covers Indiana townships."
 
-    # Load OSM addresses and group by street
-    addresses = load_addresses(osm_addresses_file)
-    grouped_addresses = group_by_street(addresses)
-    
+    # Load OSM addresses and index them by street
+    if street_index is None:
+        street_index = StreetIndex(load_addresses(osm_addresses_file))
+
+    # Split '325 E Winslow Rd' into the house number and the street
+    number_match = re.match(r"\s*(\S*\d\S*)\s+(.*)", street)
+    if not number_match:
+        return "Invalid address format. Please use 'Street, City, State Zipcode'."
+
     address_to_geocode = {
-        'housenumber': match.group(1),
-        'street': street,
+        'housenumber': number_match.group(1),
+        'street': number_match.group(2),
         'city': city,
         'state': state,
         'postcode': zipcode
     }
 
-    street_data = grouped_addresses.get(address_to_geocode['street'].lower())
-    if not street_data:
-        return "Address not found in OSM data."
-
     # Interpolate coordinates from OSM addresses
-    latitude, longitude = interpolate_coordinates(address_to_geocode, street_data)
+    latitude, longitude = interpolate_coordinates(address_to_geocode, street_index)
     if latitude is None or longitude is None:
-        return "Address not found or invalid."
+        return "Address not found in OSM data."
 
     # Get Township from GeoJSON
     township_name = get_township_from_geojson(latitude, longitude, geojson_file)
@@ -225,9 +329,15 @@ def get_trustee_info_api(address, township_data_file, max_distance_threshold=50)
     if state and state.upper() != 'IN':
         return "Address is outside of Indiana. This service only covers Indiana townships."
 
-    df_townships['distance'] = df_townships.apply(
-        lambda row: haversine_distance(latitude, longitude, row['Latitude'], row['Longitude']),
-        axis=1
+    # Trustees without an office location can't be the nearest one
+    df_townships['Latitude'] = pd.to_numeric(df_townships['Latitude'], errors='coerce')
+    df_townships['Longitude'] = pd.to_numeric(df_townships['Longitude'], errors='coerce')
+    df_townships = df_townships.dropna(subset=['Latitude', 'Longitude'])
+    if df_townships.empty:
+        return "No trustee found within a reasonable distance using API data."
+
+    df_townships['distance'] = haversine_km(
+        latitude, longitude, df_townships['Latitude'].to_numpy(), df_townships['Longitude'].to_numpy()
     )
     nearest_township = df_townships.loc[df_townships['distance'].idxmin()]
     min_distance = nearest_township['distance']
@@ -239,21 +349,3 @@ def get_trustee_info_api(address, township_data_file, max_distance_threshold=50)
                 f"Address: {trustee['Address']}\n")
 
     return "No trustee found within a reasonable distance using API data."
-
-# Example usage:
-address_to_search = "325 E Winslow Rd, Bloomington, IN 47401"
-
-api_result = get_trustee_info_api(
-    address_to_search,
-    "data/indiana_township_trustees.json"
-)
-
-geojson_result = get_trustee_info_geojson(
-    address_to_search, 
-    "data/indiana_township_trustees.json", 
-    "data/indiana_townships.geojson", 
-    "data/indiana_addresses.json"  # Processed OSM address data
-)
-
-print(f"GeoJSON Result:\n{geojson_result}\n")
-print(f"API Result:\n{api_result}\n")
@@ -0,0 +1,327 @@
+#crawls google places county by county for the trustee and food pantry scrapers
+#
+# food_pantry_lookup.py and trustee_lookup.py are configurations of PlacesCrawler: a search
+# query per county plus where to write the results. The crawler
+#   - runs counties on a thread pool, with every API call going through one rate limiter
+#     that can also stop the run at a request budget (e.g. what's left of the daily quota)
+#   - caches every API response in a SQLite file keyed by the call and its arguments
+#     (search query, place_id or coordinates), so reruns don't pay for the same call twice
+#   - writes each finished county to a checkpoint file, so a rerun after a crash or an
+#     exhausted quota only crawls the counties that are left
+#   - checks that each place is inside the county against the local county polygons
+#     (county_resolver.py), a whole page of results at a time, instead of a reverse_geocode
+#     call per place. --reverse-geocode switches back to asking Google.
+# The googlemaps client is passed in, so the crawler can be run against a fake one.
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from county_resolver import TOWNSHIP_FILE, CountyResolver
+
+logger = logging.getLogger(__name__)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CACHE_FILE = os.path.join(HERE, 'places_cache.sqlite')
+CHECKPOINT_DIR = os.path.join(HERE, 'checkpoints')
+CACHE_MAX_AGE_DAYS = 30
+
+indiana_counties = [
+    "Adams", "Allen", "Bartholomew", "Benton", "Blackford", "Boone", "Brown",
+    "Carroll", "Cass", "Clark", "Clay", "Clinton", "Crawford", "Daviess",
+    "Dearborn", "Decatur", "DeKalb", "Delaware", "Dubois", "Elkhart",
+    "Fayette", "Floyd", "Fountain", "Franklin", "Fulton", "Gibson", "Grant",
+    "Greene", "Hamilton", "Hancock", "Harrison", "Hendricks", "Henry",
+    "Howard", "Huntington", "Jackson", "Jasper", "Jay", "Jefferson",
+    "Jennings", "Johnson", "Knox", "Kosciusko", "LaGrange", "Lake",
+    "LaPorte", "Lawrence", "Madison", "Marion", "Marshall", "Martin",
+    "Miami", "Monroe", "Montgomery", "Morgan", "Newton", "Noble", "Ohio",
+    "Orange", "Owen", "Parke", "Perry", "Pike", "Porter", "Posey",
+    "Pulaski", "Putnam", "Randolph", "Ripley", "Rush", "St. Joseph", "Scott",
+    "Shelby", "Spencer", "Starke", "Steuben", "Sullivan", "Switzerland",
+    "Tippecanoe", "Tipton", "Union", "Vanderburgh", "Vermillion", "Vigo",
+    "Wabash", "Warren", "Warrick", "Washington", "Wayne", "Wells", "White",
+    "Whitley"
+]
+
+
+def replace_unicode_spaces(data):
+    """Recursively replaces Unicode spaces in strings within a data structure."""
+    if isinstance(data, dict):
+        return {key: replace_unicode_spaces(value) for key, value in data.items()}
+    elif isinstance(data, list):
+        return [replace_unicode_spaces(item) for item in data]
+    elif isinstance(data, str):
+        data = data.replace('\u202f', ' ')
+        data = data.replace('\u2009', ' ')
+        data = data.replace('\u2013', '-')
+        return data
+    else:
+        return data
+
+
+class QuotaExhausted(Exception):
+    """Raised when the run has used up its request budget."""
+
+
+class RateLimiter:
+    """Spaces API calls to a steady rate across threads and enforces an optional total budget."""
+
+    def __init__(self, rate, max_requests=None):
+        self.interval = 1 / rate if rate else 0
+        self.max_requests = max_requests
+        self.requests = 0
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            if self.max_requests is not None and self.requests >= self.max_requests:
+                raise QuotaExhausted(f"Request budget of {self.max_requests} used up")
+            self.requests += 1
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class ResponseCache:
+    """SQLite cache of API responses, shared by the crawler's threads."""
+
+    def __init__(self, path, max_age_days=CACHE_MAX_AGE_DAYS):
+        self.max_age = max_age_days * 24 * 3600
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None) if path else None
+        self.lock = threading.Lock()
+        self.hits = 0
+        if self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT NOT NULL, stored REAL NOT NULL)'
+            )
+
+    def get(self, key):
+        if not self.connection:
+            return None
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT value FROM responses WHERE key = ? AND stored > ?', (key, time.time() - self.max_age)
+            ).fetchone()
+            if row is None:
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        if not self.connection:
+            return
+        with self.lock:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO responses (key, value, stored) VALUES (?, ?, ?)',
+                (key, json.dumps(value), time.time())
+            )
+
+
+class CachedPlacesClient:
+    """The googlemaps calls the crawler makes, answered from the cache when possible and rate-limited otherwise."""
+
+    def __init__(self, gmaps, cache, limiter):
+        self.gmaps = gmaps
+        self.cache = cache
+        self.limiter = limiter
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def call(self, key, function, *args, **kwargs):
+        response = self.cache.get(key)
+        if response is None:
+            self.limiter.acquire()
+            response = function(*args, **kwargs)
+            with self.lock:
+                self.calls += 1
+            self.cache.set(key, response)
+        return response
+
+    def places(self, query):
+        return self.call(f"places|{query}", self.gmaps.places, query)
+
+    def place(self, place_id):
+        return self.call(f"place|{place_id}", self.gmaps.place, place_id=place_id)
+
+    def reverse_geocode(self, lat, lng):
+        return self.call(f"reverse_geocode|{lat!r},{lng!r}", self.gmaps.reverse_geocode, (lat, lng))
+
+
+class PlacesCrawler:
+    """Searches Google Places once per county and collects the results that are inside the county."""
+
+    def __init__(self, name, query, output_file, client, checkpoint_dir=CHECKPOINT_DIR, workers=4,
+                 county_resolver=None):
+        self.name = name
+        self.query = query
+        self.output_file = output_file
+        self.client = client
+        self.checkpoint_dir = os.path.join(checkpoint_dir, name)
+        self.workers = workers
+        # Without a resolver each place's county is checked with a reverse_geocode call
+        self.county_resolver = county_resolver
+
+    def is_location_in_county(self, lat, lng, county_name):
+        """Checks if a given latitude and longitude are within a specific county."""
+        geocode_result = self.client.reverse_geocode(lat, lng)
+        if geocode_result:
+            address_components = geocode_result[0].get('address_components', [])
+            for component in address_components:
+                if "administrative_area_level_2" in component['types'] and component['long_name'] == f"{county_name} County":
+                    return True
+        return False
+
+    def places_in_county(self, places, county_name):
+        """Returns the places that are within the county, keeping their order."""
+        if self.county_resolver is None:
+            return [place for place in places
+                    if self.is_location_in_county(place['geometry']['location']['lat'],
+                                                  place['geometry']['location']['lng'], county_name)]
+        latitudes = [place['geometry']['location']['lat'] for place in places]
+        longitudes = [place['geometry']['location']['lng'] for place in places]
+        inside = self.county_resolver.in_county(latitudes, longitudes, county_name)
+        return [place for place, is_inside in zip(places, inside) if is_inside]
+
+    def crawl_county(self, county):
+        """Returns the records for one county, in search result order."""
+        records = []
+        places_result = self.client.places(self.query.format(county=county))
+
+        # Verify if the locations are actually within the county
+        for place in self.places_in_county(places_result['results'], county):
+            place_info = {
+                "County": county,
+                "Name": place.get('name', 'N/A'),
+                "Address": place.get('formatted_address', 'N/A'),
+                "Phone": 'N/A',
+                "Website": place.get('website', 'N/A'),
+                "Latitude": place['geometry']['location']['lat'],
+                "Longitude": place['geometry']['location']['lng']
+            }
+
+            # --- Place Details Request (gets phone and hours) ---
+            place_details = self.client.place(place['place_id'])
+            if 'formatted_phone_number' in place_details['result']:
+                place_info["Phone"] = place_details['result']['formatted_phone_number']
+
+            # Get opening hours from Place Details
+            if 'opening_hours' in place_details['result']:
+                place_info["Hours"] = place_details['result']['opening_hours'].get('weekday_text', 'N/A')
+
+            # --- Clean up Unicode Spaces Before Saving ---
+            records.append(replace_unicode_spaces(place_info))
+        return records
+
+    def checkpoint_path(self, county):
+        return os.path.join(self.checkpoint_dir, county.replace(' ', '_').replace('.', '') + '.json')
+
+    def load_checkpoint(self, county):
+        try:
+            with open(self.checkpoint_path(county), 'r', encoding='utf-8') as f:
+                checkpoint = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        # A checkpoint from a different query doesn't count
+        return checkpoint['records'] if checkpoint.get('query') == self.query else None
+
+    def save_checkpoint(self, county, records):
+        path = self.checkpoint_path(county)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'county': county, 'query': self.query, 'records': records}, f)
+        os.replace(path + '.tmp', path)
+
+    def run(self, counties=indiana_counties):
+        """Crawls every county without a checkpoint, then writes the output once all of them are done.
+
+        Returns True when the output file was written. Counties that failed are logged and
+        left without a checkpoint, so running again retries only those.
+        """
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        results = {}
+        for county in counties:
+            records = self.load_checkpoint(county)
+            if records is not None:
+                results[county] = records
+        remaining = [county for county in counties if county not in results]
+        logger.info("%s: %d counties already done, crawling %d", self.name, len(results), len(remaining))
+
+        out_of_quota = False
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(self.crawl_county, county): county for county in remaining}
+            for future in as_completed(futures):
+                county = futures[future]
+                if future.cancelled():
+                    continue
+                try:
+                    records = future.result()
+                except QuotaExhausted as e:
+                    if not out_of_quota:
+                        out_of_quota = True
+                        logger.warning("%s: %s, not starting the remaining counties", self.name, e)
+                        for other in futures:
+                            other.cancel()
+                    continue
+                except Exception:
+                    logger.exception("%s: crawling %s failed", self.name, county)
+                    continue
+                self.save_checkpoint(county, records)
+                results[county] = records
+                logger.info("%s: %s done, %d places (%d/%d counties)",
+                            self.name, county, len(records), len(results), len(counties))
+
+        logger.info("%s: %d API calls, %d answered from the cache", self.name, self.client.calls, self.client.cache.hits)
+        unfinished = [county for county in counties if county not in results]
+        if unfinished:
+            logger.warning("%s: %d counties not finished (%s), run again to resume",
+                           self.name, len(unfinished), ', '.join(unfinished))
+            return False
+
+        # Save data to a JSON file, counties in the usual order
+        all_data = [record for county in counties for record in results[county]]
+        with open(self.output_file, "w", encoding='utf-8') as f:
+            json.dump(all_data, f, indent=4)
+        logger.info("Data saved to %s", self.output_file)
+        return True
+
+    def reset(self):
+        """Deletes the checkpoints, so the next run crawls every county again."""
+        if os.path.isdir(self.checkpoint_dir):
+            for file_name in os.listdir(self.checkpoint_dir):
+                os.remove(os.path.join(self.checkpoint_dir, file_name))
+
+
+def main(name, query, output_file, gmaps=None, argv=None):
+    """Command line entry point shared by the scraper scripts."""
+    parser = argparse.ArgumentParser(description=f'Crawl Google Places for {name}.')
+    parser.add_argument('--output', default=output_file)
+    parser.add_argument('--workers', type=int, default=4, help='Counties crawled at the same time')
+    parser.add_argument('--rate', type=float, default=10, help='API calls per second, across all workers')
+    parser.add_argument('--max-requests', type=int, help='Stop after this many API calls (cached answers are free)')
+    parser.add_argument('--cache', default=CACHE_FILE, help="Response cache file, '' to disable")
+    parser.add_argument('--checkpoints', default=CHECKPOINT_DIR)
+    parser.add_argument('--restart', action='store_true', help='Ignore checkpoints from earlier runs')
+    parser.add_argument('--county', action='append', help='Only crawl these counties (repeatable)')
+    parser.add_argument('--townships', default=TOWNSHIP_FILE, help='Township polygons the county check is built from')
+    parser.add_argument('--reverse-geocode', action='store_true',
+                        help="Check each place's county with a reverse_geocode call instead of the local polygons")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    if gmaps is None:
+        import googlemaps
+        gmaps = googlemaps.Client(key=os.getenv("GOOGLE_API_KEY"))
+
+    county_resolver = None if args.reverse_geocode else CountyResolver.from_geojson(args.townships)
+    client = CachedPlacesClient(gmaps, ResponseCache(args.cache), RateLimiter(args.rate, args.max_requests))
+    crawler = PlacesCrawler(name, query, args.output, client, args.checkpoints, args.workers, county_resolver)
+    if args.restart:
+        crawler.reset()
+    return crawler.run(args.county or indiana_counties)
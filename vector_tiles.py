@@ -0,0 +1,234 @@
+"""Mapbox Vector Tiles of the township boundaries, served from /tiles/<z>/<x>/<y>.mvt.
+
+Tiles are cut from the township polygons the app already has loaded, reprojected to Web
+Mercator once. Each zoom level the map shows gets its own simplified copy, so low zoom tiles
+don't carry detail nobody can see. The copies are compiled into the dataset bundle (see
+dataset.py), or built when the app loads from the source files, before gunicorn forks its
+workers either way. Generated tiles are kept in an in-process LRU and written to disk, so
+they are only built once per data version.
+
+`python vector_tiles.py seed` builds every tile covering Indiana for zoom 6 to 12 ahead of time.
+"""
+import argparse
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import mapbox_vector_tile
+import numpy as np
+import shapely
+
+from township_grid import fingerprint
+
+logger = logging.getLogger(__name__)
+
+TILE_PATH = os.getenv('TILE_CACHE_PATH', 'cache/tiles')
+TILE_MEMORY_SIZE = int(os.getenv('TILE_CACHE_MEMORY_SIZE', 1024))
+MIN_ZOOM = 0
+MAX_ZOOM = 14
+# Zoom levels that get their own simplified polygons, the map's minZoom to maxNativeZoom in
+# static/script.js. Tiles below the first use its polygons.
+LAYER_ZOOMS = range(6, MAX_ZOOM + 1)
+SEED_ZOOMS = (6, 12)
+
+LAYER_NAME = 'townships'
+EXTENT = 4096
+# Geometry reaching this far outside the tile (in tile units) is kept, so strokes don't break at the edges
+BUFFER = 64
+# Vertices closer together than this many screen pixels (at 256 px per tile) are simplified away
+TOLERANCE_PIXELS = 0.5
+WORLD_SIZE = 2 * math.pi * 6378137
+
+
+def to_web_mercator(geometries):
+    """Projects lon/lat geometries to Web Mercator (EPSG:3857) metres."""
+    def project(coordinates):
+        longitudes = coordinates[:, 0]
+        latitudes = np.clip(coordinates[:, 1], -85.05112878, 85.05112878)
+        x = np.radians(longitudes) * 6378137
+        y = np.log(np.tan(np.pi / 4 + np.radians(latitudes) / 2)) * 6378137
+        return np.column_stack([x, y])
+    return shapely.transform(geometries, project)
+
+
+def tile_bounds(z, x, y):
+    """Web Mercator bounds (minx, miny, maxx, maxy) of a tile, y counted from the top."""
+    size = WORLD_SIZE / 2 ** z
+    minx = -WORLD_SIZE / 2 + x * size
+    maxy = WORLD_SIZE / 2 - y * size
+    return minx, maxy - size, minx + size, maxy
+
+
+def tile_range(west, south, east, north, z):
+    """Tile x and y ranges (inclusive) covering a lon/lat box at a zoom level."""
+    def tile_xy(longitude, latitude):
+        n = 2 ** z
+        latitude = math.radians(max(min(latitude, 85.05112878), -85.05112878))
+        x = int((longitude + 180) / 360 * n)
+        y = int((1 - math.log(math.tan(latitude) + 1 / math.cos(latitude)) / math.pi) / 2 * n)
+        return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+    x0, y0 = tile_xy(west, north)
+    x1, y1 = tile_xy(east, south)
+    return range(x0, x1 + 1), range(y0, y1 + 1)
+
+
+def simplify(geometries, z):
+    """Returns Web Mercator township polygons simplified for zoom z."""
+    tolerance = WORLD_SIZE / 2 ** z / 256 * TOLERANCE_PIXELS
+    try:
+        # Simplifies shared edges once, so neighbouring townships don't get gaps or overlaps
+        return shapely.coverage_simplify(geometries, tolerance)
+    except (AttributeError, shapely.errors.GEOSException) as e:
+        logger.warning("Simplifying the townships as a coverage failed (%s), simplifying each one", e)
+        return shapely.simplify(geometries, tolerance, preserve_topology=True)
+
+
+def simplify_layers(geometries):
+    """Returns {zoom: simplified Web Mercator polygons} for LAYER_ZOOMS from lon/lat township polygons."""
+    geometries = to_web_mercator(geometries)
+    return {z: simplify(geometries, z) for z in LAYER_ZOOMS}
+
+
+class TileCache:
+    """LRU of encoded tiles backed by a directory of .mvt files."""
+
+    def __init__(self, path, memory_size=TILE_MEMORY_SIZE):
+        self.path = path
+        self.memory_size = memory_size
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+
+    def file_path(self, z, x, y):
+        return os.path.join(self.path, str(z), str(x), f'{y}.mvt')
+
+    def get(self, z, x, y):
+        """Returns the cached tile bytes, or None."""
+        key = (z, x, y)
+        with self.lock:
+            tile = self.memory.get(key)
+            if tile is not None:
+                self.memory.move_to_end(key)
+                return tile
+        if self.path:
+            try:
+                with open(self.file_path(z, x, y), 'rb') as f:
+                    tile = f.read()
+            except FileNotFoundError:
+                return None
+            self.remember(key, tile)
+        return tile
+
+    def set(self, z, x, y, tile):
+        self.remember((z, x, y), tile)
+        if self.path:
+            file_path = self.file_path(z, x, y)
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            # Write then rename, so a concurrent reader never sees a partial tile
+            temporary_path = f'{file_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(temporary_path, 'wb') as f:
+                f.write(tile)
+            os.replace(temporary_path, file_path)
+
+    def remember(self, key, tile):
+        with self.lock:
+            self.memory[key] = tile
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.memory_size:
+                self.memory.popitem(last=False)
+
+
+class TownshipTiles:
+    """Builds township boundary tiles from a TownshipResolver's polygons.
+
+    layers are the simplified polygons from simplify_layers, e.g. read from the dataset
+    bundle. Without them (or with a different set of zooms) they're built here.
+    """
+
+    def __init__(self, resolver, cache_dir=TILE_PATH, layers=None):
+        self.counties = [str(county) for county in resolver.counties]
+        self.townships = [str(township) for township in resolver.townships]
+        self.bounds = shapely.total_bounds(resolver.geometries)
+        if layers is None or any(z not in layers for z in LAYER_ZOOMS):
+            start = time.perf_counter()
+            layers = simplify_layers(resolver.geometries)
+            logger.info("Simplified the townships for zoom %d to %d in %.1f s, compile-data saves this",
+                        LAYER_ZOOMS[0], LAYER_ZOOMS[-1], time.perf_counter() - start)
+        self.simplified = {z: (layers[z], shapely.STRtree(layers[z])) for z in LAYER_ZOOMS}
+        # Tiles from other township data live in another directory, so they're never served by mistake
+        self.cache = TileCache(os.path.join(cache_dir, fingerprint(resolver)[:16]) if cache_dir else None)
+
+    def layer(self, z):
+        """Returns the simplified township polygons and STRtree to cut zoom z tiles from."""
+        return self.simplified[min(max(z, LAYER_ZOOMS[0]), LAYER_ZOOMS[-1])]
+
+    def render(self, z, x, y):
+        """Encodes one tile."""
+        minx, miny, maxx, maxy = tile_bounds(z, x, y)
+        margin = (maxx - minx) * BUFFER / EXTENT
+        geometries, tree = self.layer(z)
+        features = []
+        for index in np.sort(tree.query(shapely.box(minx - margin, miny - margin, maxx + margin, maxy + margin))):
+            clipped = shapely.clip_by_rect(geometries[index], minx - margin, miny - margin, maxx + margin, maxy + margin)
+            if clipped.is_empty:
+                continue
+            features.append({
+                'geometry': clipped,
+                'properties': {'county': self.counties[index], 'township': self.townships[index]},
+            })
+        if not features:
+            return b''
+        return mapbox_vector_tile.encode(
+            [{'name': LAYER_NAME, 'features': features}],
+            default_options={
+                'quantize_bounds': (minx, miny, maxx, maxy),
+                'extents': EXTENT,
+                'on_invalid_geometry': mapbox_vector_tile.encoder.on_invalid_geometry_make_valid,
+            },
+        )
+
+    def tile(self, z, x, y):
+        """Returns the tile bytes (empty for tiles with no townships), or None if z/x/y is out of range."""
+        if not MIN_ZOOM <= z <= MAX_ZOOM or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+            return None
+        tile = self.cache.get(z, x, y)
+        if tile is None:
+            tile = self.render(z, x, y)
+            self.cache.set(z, x, y, tile)
+        return tile
+
+    def seed(self, min_zoom=SEED_ZOOMS[0], max_zoom=SEED_ZOOMS[1]):
+        """Builds and caches every tile over the townships' extent for a range of zoom levels."""
+        west, south, east, north = self.bounds
+        for z in range(min_zoom, max_zoom + 1):
+            start = time.perf_counter()
+            xs, ys = tile_range(west, south, east, north, z)
+            size = 0
+            for x in xs:
+                for y in ys:
+                    size += len(self.tile(z, x, y))
+            print(f"zoom {z}: {len(xs) * len(ys)} tiles, {size / 1024:.0f} KB, "
+                  f"{time.perf_counter() - start:.1f} s")
+
+
+def main():
+    from dataset import load_dataset
+
+    parser = argparse.ArgumentParser(description='Township boundary vector tiles.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    seed_parser = subparsers.add_parser('seed', help='Build the tiles covering Indiana ahead of time')
+    seed_parser.add_argument('--min-zoom', type=int, default=SEED_ZOOMS[0])
+    seed_parser.add_argument('--max-zoom', type=int, default=SEED_ZOOMS[1])
+    seed_parser.add_argument('--output', default=TILE_PATH)
+    args = parser.parse_args()
+
+    dataset = load_dataset()
+    tiles = TownshipTiles(dataset.resolver, args.output, dataset.tile_layers)
+    tiles.seed(args.min_zoom, args.max_zoom)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
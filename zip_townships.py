@@ -0,0 +1,167 @@
+"""ZIP code to township table, so /geocode?zip= is answered without calling Nominatim.
+
+A ZIP code often spans several townships, sometimes in different counties. The build step
+intersects the Census ZIP Code Tabulation Area (ZCTA) polygons with the township polygons
+once, and stores for each ZIP the townships it overlaps, the share of the ZIP's area in
+each (weight) and their trustee records, largest share first:
+
+    python zip_townships.py build tl_2020_us_zcta520.zip
+    python zip_townships.py query 47401
+
+The ZCTA file can be anything geopandas reads, e.g. the national TIGER/Line shapefile. Only
+the ZCTAs inside the townships' bounding box are loaded from it.
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import time
+
+from data_store import TRUSTEE_FILE, ResourceStore
+from dataset import TOWNSHIP_FILE
+
+logger = logging.getLogger(__name__)
+
+TABLE_VERSION = 1
+DEFAULT_PATH = os.getenv('ZIP_TOWNSHIPS_PATH', 'cache/zip_townships.json')
+
+# Conterminous US Albers equal-area, so overlap areas compare fairly across the state
+EQUAL_AREA_CRS = 'EPSG:5070'
+# Overlaps below this share of a ZIP are slivers where ZCTA and township boundaries disagree
+MIN_WEIGHT = 0.005
+# ZIP code column in the 2020 and 2010 ZCTA files
+ZIP_COLUMNS = ('ZCTA5CE20', 'ZCTA5CE10', 'GEOID20', 'GEOID10', 'ZCTA5', 'zip')
+
+ZIP_CODE = re.compile(r'(\d{5})(?:-?\d{4})?')
+
+
+def normalize_zip(value):
+    """Returns the 5-digit ZIP code of '47401' or '47401-1234', or None."""
+    match = ZIP_CODE.fullmatch((value or '').strip())
+    return match.group(1) if match else None
+
+
+def build_table(zcta_file, output=DEFAULT_PATH, township_file=TOWNSHIP_FILE, trustee_file=TRUSTEE_FILE,
+                min_weight=MIN_WEIGHT):
+    """Intersects the ZCTA polygons with the township polygons and writes the table."""
+    import geopandas as gpd
+    import shapely
+
+    townships = gpd.read_file(township_file)
+    bounds = gpd.GeoSeries([shapely.box(*townships.total_bounds)], crs=townships.crs)
+    zctas = gpd.read_file(zcta_file, bbox=bounds)
+    column = next((name for name in ZIP_COLUMNS if name in zctas.columns), None)
+    if column is None:
+        raise ValueError(f"{zcta_file} has none of the ZIP code columns {', '.join(ZIP_COLUMNS)}")
+
+    zctas = zctas[[column, 'geometry']].rename(columns={column: 'zip'})
+    zctas = zctas.dissolve(by='zip', as_index=False).to_crs(EQUAL_AREA_CRS)
+    zctas['zip_area'] = zctas.area
+    townships = townships[['cnty_name', 'tl_2021_18_cousub_namelsad', 'geometry']].to_crs(EQUAL_AREA_CRS)
+
+    pieces = gpd.overlay(zctas, townships, how='intersection', keep_geom_type=True)
+    pieces['weight'] = pieces.area / pieces['zip_area']
+    # A township split into several polygons counts once per ZIP
+    pieces = pieces.groupby(['zip', 'cnty_name', 'tl_2021_18_cousub_namelsad'], as_index=False)['weight'].sum()
+    pieces = pieces.sort_values(['zip', 'weight'], ascending=[True, False])
+
+    store = ResourceStore.load(trustee_file)
+    zips = {}
+    for zip_code, county, township, weight in zip(pieces['zip'], pieces['cnty_name'],
+                                                  pieces['tl_2021_18_cousub_namelsad'], pieces['weight']):
+        entries = zips.setdefault(str(zip_code), [])
+        # Always keep the largest overlap, even for a ZIP that only clips the state
+        if entries and weight < min_weight:
+            continue
+        entries.append({
+            'county': county,
+            'township': township,
+            'weight': round(float(weight), 4),
+            'trustee': store.get_trustee(county, township),
+        })
+
+    table = {
+        'version': TABLE_VERSION,
+        'built_at': time.time(),
+        'sources': [zcta_file, township_file, trustee_file],
+        'zips': zips,
+    }
+    directory = os.path.dirname(output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temporary_path = output + '.tmp'
+    with open(temporary_path, 'w') as f:
+        json.dump(table, f)
+    os.replace(temporary_path, output)
+
+    spanning = sum(1 for entries in zips.values() if len(entries) > 1)
+    print(f"Mapped {len(zips)} ZIP codes to townships, {spanning} of them span more than one township")
+
+
+class ZipTownships:
+    """The ZIP code to township table, held in memory as a dict keyed by ZIP code."""
+
+    def __init__(self, zips):
+        self.zips = zips
+
+    @classmethod
+    def open(cls, path=DEFAULT_PATH):
+        """Returns the table, or None if it hasn't been built."""
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r') as f:
+            table = json.load(f)
+        if table.get('version') != TABLE_VERSION:
+            raise ValueError(f"ZIP code table version {table.get('version')} is not supported, rebuild it")
+        for source in table['sources'][1:]:
+            if os.path.exists(source) and os.path.getmtime(source) > table['built_at']:
+                logger.warning("%s changed after %s was built, build it again", source, path)
+        return cls(table['zips'])
+
+    def __len__(self):
+        return len(self.zips)
+
+    def lookup(self, zip_code):
+        """Returns the townships a ZIP code overlaps, largest share first, or None if it isn't in the table."""
+        zip_code = normalize_zip(zip_code)
+        if zip_code is None:
+            return None
+        return self.zips.get(zip_code)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or query the ZIP code to township table.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help='Build the table from ZCTA polygons')
+    build_parser.add_argument('zctas', help='ZCTA polygons, e.g. the Census TIGER/Line ZCTA shapefile')
+    build_parser.add_argument('output', nargs='?', default=DEFAULT_PATH)
+    build_parser.add_argument('--townships', default=TOWNSHIP_FILE)
+    build_parser.add_argument('--trustees', default=TRUSTEE_FILE)
+    build_parser.add_argument('--min-weight', type=float, default=MIN_WEIGHT,
+                              help='Leave out townships with less than this share of a ZIP')
+
+    query_parser = subparsers.add_parser('query', help='Show the townships of one ZIP code')
+    query_parser.add_argument('zip')
+    query_parser.add_argument('--table', default=DEFAULT_PATH)
+
+    args = parser.parse_args()
+    if args.command == 'build':
+        build_table(args.zctas, args.output, args.townships, args.trustees, args.min_weight)
+    else:
+        table = ZipTownships.open(args.table)
+        if table is None:
+            print(f"{args.table} does not exist, run build first")
+            return
+        entries = table.lookup(args.zip)
+        if not entries:
+            print(f"{args.zip} is not in the table")
+        for entry in entries or []:
+            trustee = entry['trustee']['Name'] if entry['trustee'] else 'no trustee'
+            print(f"{entry['weight']:7.2%}  {entry['county']}: {entry['township']} ({trustee})")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()